@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Cache of RAG answers looked up by question similarity.
+
+    Answers are grouped by (chat model, temperature, embedding model, variant),
+    where the variant captures anything else that changes the prompt, such as
+    per-request retrieval options. A new
+    question hits when the cosine similarity between its embedding and a cached
+    question's is at least `threshold`. Each embedding model has a knowledge-base
+    version that `invalidate` bumps after ingests and deletes: its entries are
+    dropped, and answers generated against an older version are not stored.
+    `invalidate()` without a model bumps a generation that is part of every
+    version, so it also covers models the cache has not seen yet.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 256, ttl_seconds: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._versions: Dict[str, int] = {}
+        self._generation = 0
+        # (model, temperature, embedding model, variant) -> entry id -> (unit vector, answer, expires)
+        self._groups: Dict[Tuple, Dict[int, Tuple[np.ndarray, str, float]]] = {}
+        # entry id -> group key, least recently used first
+        self._lru: "OrderedDict[int, Tuple]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def version(self, embedding_model: str) -> int:
+        with self._lock:
+            return self._version(embedding_model)
+
+    def _version(self, embedding_model: str) -> int:
+        # Both counters only grow, so their sum changes with every invalidation
+        return self._generation + self._versions.get(embedding_model, 0)
+
+    def invalidate(self, embedding_model: Optional[str] = None):
+        """Bumps the knowledge-base version of one embedding model (or all) and drops its answers."""
+        with self._lock:
+            if embedding_model:
+                self._versions[embedding_model] = self._versions.get(embedding_model, 0) + 1
+                stale = [key for key in self._groups if key[2] == embedding_model]
+            else:
+                self._generation += 1
+                stale = list(self._groups)
+            for key in stale:
+                for entry_id in self._groups.pop(key):
+                    del self._lru[entry_id]
+
+    def lookup(self, model: str, temperature: float, embedding_model: str,
+               vector: List[float], variant: Hashable = None) -> Optional[str]:
+        """Returns the answer of the most similar cached question above the threshold."""
+        query = _unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            group = self._groups.get((model, temperature, embedding_model, variant))
+            if group:
+                expired = [entry_id for entry_id, (_, _, expires) in group.items() if expires <= now]
+                for entry_id in expired:
+                    del group[entry_id]
+                    del self._lru[entry_id]
+                if not group:
+                    del self._groups[(model, temperature, embedding_model, variant)]
+            if group:
+                ids = list(group)
+                matrix = np.stack([group[entry_id][0] for entry_id in ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._lru.move_to_end(ids[best])
+                    self.hits += 1
+                    return group[ids[best]][1]
+            self.misses += 1
+            return None
+
+    def store(self, model: str, temperature: float, embedding_model: str, vector: List[float],
+              answer: str, version: int, variant: Hashable = None):
+        """Caches an answer generated against knowledge-base `version`, unless it changed since."""
+        with self._lock:
+            if self._version(embedding_model) != version:
+                return
+            key = (model, temperature, embedding_model, variant)
+            self._groups.setdefault(key, {})[self._next_id] = (
+                _unit(vector), answer, time.monotonic() + self.ttl_seconds)
+            self._lru[self._next_id] = key
+            self._next_id += 1
+            while len(self._lru) > self.max_entries:
+                entry_id, oldest_key = self._lru.popitem(last=False)
+                oldest_group = self._groups[oldest_key]
+                del oldest_group[entry_id]
+                if not oldest_group:
+                    del self._groups[oldest_key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"entries": len(self._lru), "max_entries": self.max_entries,
+                    "threshold": self.threshold, "hits": self.hits, "misses": self.misses,
+                    "generation": self._generation, "versions": dict(self._versions)}
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
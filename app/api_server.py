@@ -1,18 +1,26 @@
 import os
-import shutil
 import asyncio
 import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial
 from typing import List, Optional, Any, Dict
 from pydantic import BaseModel, Field
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Security, APIRouter
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Security, APIRouter, Request, Query
 from fastapi.security import APIKeyHeader
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.tools import tool
+from context_packing import model_num_ctx
 from rag_service import RAGService
-import nltk
+from retrieval import RetrievalOptions, parse_tags, source_name
+from ingest_jobs import IngestJobManager, IngestQueueFullError
+from migrations import ActivityMonitor, MigrationManager
+from uploads import UploadTooLargeError, save_upload
+from warmup import Warmup, load_ollama_model
 import config
 
 # Import MongoDB MCP
@@ -23,16 +31,18 @@ except ImportError:
     MONGODB_MCP_AVAILABLE = False
     print("WARNING: MongoDB MCP not available")
 
-# Ensure NLTK data is available
-try:
-    nltk.data.find('tokenizers/punkt_tab')
-except LookupError:
-    nltk.download('punkt_tab')
+def ensure_nltk_data():
+    """Descarga los datos de NLTK que necesita el loader opcional de Unstructured."""
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        nltk.download('punkt_tab')
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
 
 # Load settings from config
 OLLAMA_BASE_URL = config.OLLAMA_BASE_URL
@@ -41,6 +51,7 @@ PORT = config.PORT
 MAX_INPUT_LENGTH = config.MAX_INPUT_LENGTH
 EMBEDDING_MODEL = config.DEFAULT_EMBEDDING_MODEL
 UPLOAD_DIR = config.UPLOAD_DIR
+MAX_UPLOAD_BYTES = config.MAX_UPLOAD_MB * 1024 * 1024
 API_KEY = config.API_KEY
 API_KEY_NAME = "X-API-KEY"
 
@@ -56,11 +67,89 @@ async def verify_api_key(api_key: str = Security(api_key_header)):
             detail="Could not validate credentials",
         )
 
+# Calentamiento al arrancar: / responde desde el principio (liveness) y /ready
+# solo cuando ha terminado (readiness)
+warmup = Warmup()
+
+async def warm_up():
+    """Conecta MongoDB, carga los modelos por defecto en Ollama y abre los almacenes."""
+    steps = []
+    if config.MARKDOWN_LOADER == "unstructured":
+        steps.append(("nltk", ensure_nltk_data))
+    if MONGODB_MCP_AVAILABLE:
+        steps.append(("mongodb", init_mongodb))
+    queries = []
+    if config.WARMUP_ENABLED:
+        for model in rag_service.default_embedding_models():
+            steps.append((f"embedding:{model}", partial(
+                load_ollama_model, OLLAMA_BASE_URL, model, embedding=True,
+                keep_alive=config.MODEL_KEEP_ALIVE, timeout=config.WARMUP_TIMEOUT)))
+        queries = [query.strip() for query in config.WARMUP_QUERIES.split("|") if query.strip()]
+    # Abre el almacén por defecto (Chroma, registro, índice de palabras clave) aquí y no al
+    # importar, para que /ready no se dé por listo antes de tenerlo abierto
+    steps.append(("vector_stores", partial(rag_service.warm_up, queries=queries)))
+    if config.WARMUP_ENABLED:
+        steps.append((f"chat:{MODEL_NAME}", partial(
+            load_ollama_model, OLLAMA_BASE_URL, MODEL_NAME, keep_alive=config.MODEL_KEEP_ALIVE,
+            num_ctx=model_num_ctx(MODEL_NAME), timeout=config.WARMUP_TIMEOUT)))
+    await warmup.run(steps)
+    # Migraciones interrumpidas por un reinicio, una vez cargados los modelos
+    await asyncio.to_thread(migrations.resume_interrupted, rag_service.persist_dir)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+    migrations.shutdown()
+    ingest_jobs.shutdown()
+
 # Initialize FastAPI
 app = FastAPI(
-    title="LangChain Local LLM API"
+    title="LangChain Local LLM API",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Rechaza subidas demasiado grandes antes de leer el cuerpo."""
+    if request.method == "POST" and request.url.path == "/ingest":
+        content_length = request.headers.get("content-length")
+        # Margen para las cabeceras multipart
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds the maximum upload size of {config.MAX_UPLOAD_MB} MB"},
+            )
+    return await call_next(request)
+
+# Peticiones de chat en curso: las migraciones de embeddings esperan a que terminen
+CHAT_PATHS = {"/chat", "/chat/stream", "/analyze"}
+chat_activity = ActivityMonitor()
+
+@app.middleware("http")
+async def track_chat_requests(request: Request, call_next):
+    """Cuenta las peticiones de chat hasta que termina su respuesta (también en streaming)."""
+    if request.method != "POST" or request.url.path not in CHAT_PATHS:
+        return await call_next(request)
+    release = chat_activity.begin()
+    try:
+        response = await call_next(request)
+    except Exception:
+        release()
+        raise
+    body = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            release()
+
+    response.body_iterator = tracked_body()
+    return response
+
 # Router for protected endpoints
 router = APIRouter(dependencies=[Depends(verify_api_key)])
 
@@ -86,6 +175,12 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 async def root():
     return {"status": "ok", "service": "LangChain Local API"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 hasta que termina el calentamiento, con el estado de cada paso."""
+    status = warmup.status()
+    return status if warmup.ready else JSONResponse(status_code=503, content=status)
+
 # Inicializar RAG Service
 rag_service = RAGService(
     ollama_base_url=OLLAMA_BASE_URL,
@@ -93,12 +188,31 @@ rag_service = RAGService(
     embedding_model=EMBEDDING_MODEL
 )
 
-# Inicializar MongoDB MCP
+# Cola de ingesta en segundo plano (no bloquea el event loop)
+ingest_jobs = IngestJobManager(
+    rag_service.ingest_file,
+    max_workers=config.INGEST_MAX_WORKERS,
+    max_pending=config.INGEST_MAX_PENDING,
+    max_history=config.INGEST_JOB_HISTORY,
+)
+
+# Migraciones de embeddings entre modelos en segundo plano (una a la vez)
+migrations = MigrationManager(
+    rag_service.migrate_embeddings,
+    rag_service.store_dir,
+    activity=chat_activity,
+    pause=config.MIGRATION_BATCH_PAUSE,
+    max_wait=config.MIGRATION_MAX_WAIT,
+)
+
+# MongoDB MCP (se conecta durante el calentamiento, no al importar)
 mongodb_server = None
 mongodb_tools = []
 mongodb_context = None
 
-if MONGODB_MCP_AVAILABLE:
+def init_mongodb():
+    """Conecta con MongoDB y crea las herramientas LangChain a partir del MCP."""
+    global mongodb_server, mongodb_tools, mongodb_context, MONGODB_MCP_AVAILABLE
     try:
         mongodb_server = create_mongodb_mcp_server()
 
@@ -216,6 +330,37 @@ class ChatRequest(BaseModel):
     use_knowledge_base: Optional[bool] = Field(default=False, description="Use RAG context")
     embedding_model: Optional[str] = Field(default=None, description="Embedding model for RAG")
     use_mongodb_tools: Optional[bool] = Field(default=False, description="Enable MongoDB database tools")
+    # Opciones de recuperación RAG (None = valor configurado)
+    rag_k: Optional[int] = Field(default=None, ge=1, le=50, description="Chunks added to the RAG context")
+    rag_fetch_k: Optional[int] = Field(default=None, ge=1, le=200, description="Candidates retrieved before reranking")
+    rag_mmr: Optional[bool] = Field(default=None, description="Diversify chunks with maximal marginal relevance")
+    rag_mmr_lambda: Optional[float] = Field(default=None, ge=0.0, le=1.0,
+                                            description="MMR trade-off: 1 = relevance only, 0 = diversity only")
+    # Filtros de metadatos (se aplican dentro de la búsqueda de Chroma)
+    rag_sources: Optional[List[str]] = Field(default=None, description="Only search these documents (filenames, or paths under an ingested directory)")
+    rag_tags: Optional[List[str]] = Field(default=None, description="Only search documents with any of these tags")
+    rag_uploaded_after: Optional[datetime] = Field(default=None, description="Only documents uploaded at or after")
+    rag_uploaded_before: Optional[datetime] = Field(default=None, description="Only documents uploaded at or before")
+
+    def retrieval_options(self) -> RetrievalOptions:
+        return retrieval_options(k=self.rag_k, fetch_k=self.rag_fetch_k, mmr=self.rag_mmr,
+                                 mmr_lambda=self.rag_mmr_lambda, sources=self.rag_sources,
+                                 tags=self.rag_tags, uploaded_after=self.rag_uploaded_after,
+                                 uploaded_before=self.rag_uploaded_before)
+
+
+def retrieval_options(k: Optional[int] = None, fetch_k: Optional[int] = None, mmr: Optional[bool] = None,
+                      mmr_lambda: Optional[float] = None, sources: Optional[List[str]] = None,
+                      tags: Optional[List[str]] = None, uploaded_after: Optional[datetime] = None,
+                      uploaded_before: Optional[datetime] = None) -> RetrievalOptions:
+    """Construye las opciones de recuperación a partir de los parámetros de la petición."""
+    return RetrievalOptions(
+        k=k, fetch_k=fetch_k, mmr=mmr, mmr_lambda=mmr_lambda,
+        sources=tuple(source_name(source) for source in sources) if sources else None,
+        tags=parse_tags(tags) or None,
+        uploaded_after=uploaded_after.timestamp() if uploaded_after else None,
+        uploaded_before=uploaded_before.timestamp() if uploaded_before else None,
+    )
 
 
 # ... (Existing endpoints) ...
@@ -303,7 +448,9 @@ async def chat(request: ChatRequest):
                 question=last_message.content,
                 model_name=request.model,
                 temperature=request.temperature,
-                embedding_model=request.embedding_model
+                embedding_model=request.embedding_model,
+                retrieval=request.retrieval_options(),
+                max_tokens=request.max_tokens
             )
             return ChatResponse(response=response_text, model=request.model)
 
@@ -314,6 +461,8 @@ async def chat(request: ChatRequest):
                 base_url=OLLAMA_BASE_URL,
                 temperature=request.temperature,
                 num_predict=request.max_tokens,
+                num_ctx=model_num_ctx(request.model),
+                keep_alive=config.MODEL_KEEP_ALIVE,
             )
 
             from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -416,48 +565,162 @@ Ejemplos de uso:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 
-@router.post("/ingest")
-async def ingest_document(file: UploadFile = File(...), embedding_model: Optional[str] = None):
-    """Upload and ingest a document into the Knowledge Base."""
+@router.post("/ingest", status_code=202)
+async def ingest_document(file: UploadFile = File(...), embedding_model: Optional[str] = Form(None),
+                          tags: Optional[str] = Form(None)):
+    """Upload a document and queue it for background ingestion into the Knowledge Base.
+
+    `tags` (comma-separated) are stored on every chunk and can be used as retrieval filters.
+    """
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        num_chunks = rag_service.ingest_file(file_path, embedding_model=embedding_model)
-        
+        tag_list = list(parse_tags([tags] if tags else []))
+        upload_started = time.perf_counter()
+        upload = await save_upload(file, UPLOAD_DIR, max_bytes=MAX_UPLOAD_BYTES)
+        upload_seconds = time.perf_counter() - upload_started
+
+        # Contenido idéntico ya ingerido con este modelo: no se vuelve a parsear
+        # (salvo que se pidan etiquetas, que hay que aplicar a sus chunks)
+        if upload.already_stored and not tag_list and await asyncio.to_thread(
+            rag_service.is_ingested, upload.filename, upload.content_hash, embedding_model
+        ):
+            return JSONResponse(status_code=200, content={
+                "job_id": None,
+                "filename": upload.filename,
+                "status": "duplicate",
+                "content_hash": upload.content_hash,
+                "message": f"{upload.filename} is already in the Knowledge Base"
+            })
+
+        job = ingest_jobs.submit(upload.path, upload.filename, embedding_model=embedding_model,
+                                 content_hash=upload.content_hash, upload_seconds=upload_seconds,
+                                 tags=tag_list)
+
         return {
-            "filename": file.filename,
-            "status": "success", 
-            "chunks_added": num_chunks,
-            "message": f"Successfully ingested {file.filename}"
+            "job_id": job.id,
+            "filename": upload.filename,
+            "status": job.status,
+            "content_hash": upload.content_hash,
+            "message": f"Ingestion of {upload.filename} queued"
         }
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         print(f"Error ingesting file: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
+@router.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Status of a background ingestion job (queued/parsing/splitting/embedding/writing/done/failed)."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+    return job
+
+INGEST_EVENTS_MIN_INTERVAL = 0.25  # segundos entre eventos (agrupa actualizaciones seguidas)
+INGEST_EVENTS_HEARTBEAT = 15.0     # reenvía el estado si no hay cambios
+
+@router.get("/ingest/jobs/{job_id}/events")
+async def stream_ingest_job(job_id: str, format: str = "ndjson"):
+    """Live progress of an ingestion job: one JSON snapshot per change until it finishes.
+
+    `format=ndjson` (default) sends one JSON object per line; `format=sse` sends
+    Server-Sent Events (`data: {...}`). Snapshots carry per-stage timings (upload,
+    parse, split, embed, write), chunks done/remaining and throughput.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+
+    def encode(snapshot: Dict[str, Any]) -> str:
+        payload = json.dumps(snapshot)
+        return f"data: {payload}\n\n" if format == "sse" else payload + "\n"
+
+    async def generate():
+        snapshot = job
+        while True:
+            yield encode(snapshot)
+            if snapshot["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(INGEST_EVENTS_MIN_INTERVAL)
+            snapshot = await ingest_jobs.wait_for_update(job_id, snapshot["version"], INGEST_EVENTS_HEARTBEAT)
+            if snapshot is None:
+                return
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class MigrationRequest(BaseModel):
+    source_model: str = Field(..., description="Embedding model whose chunks are re-embedded")
+    target_model: str = Field(..., description="Embedding model that receives them")
+
+@router.post("/migrations", status_code=202)
+async def start_migration(request: MigrationRequest):
+    """Re-embed the Knowledge Base of one embedding model into another in the background.
+
+    Chunk texts are read from the source store, so documents are not uploaded or
+    parsed again. Submitting a cancelled or failed migration again resumes it.
+    """
+    try:
+        job = migrations.submit(request.source_model, request.target_model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return migrations.get(job.id)
+
+@router.get("/migrations")
+async def list_migrations():
+    """Recent embedding migrations, newest first."""
+    return {"migrations": migrations.list()}
+
+@router.get("/migrations/{job_id}")
+async def get_migration(job_id: str):
+    """Progress of an embedding migration (queued/migrating/waiting/done/failed/cancelled)."""
+    job = migrations.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Migration {job_id} not found")
+    return job
+
+@router.delete("/migrations/{job_id}")
+async def cancel_migration(job_id: str):
+    """Cancel an embedding migration before its next batch; what was copied is kept."""
+    job = migrations.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Migration {job_id} not found")
+    return job
+
 @router.get("/documents")
-async def list_documents(embedding_model: Optional[str] = None):
-    """List all unique documents in the vector store."""
+async def list_documents(embedding_model: Optional[str] = None, offset: int = Query(0, ge=0),
+                         limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """List documents from the registry (paginated with offset/limit; without limit, all of them).
+
+    `documents` keeps the list of filenames; `items` adds chunk count, bytes,
+    content hash, tags and ingestion time per document.
+    """
     try:
-        docs = rag_service.list_documents(embedding_model=embedding_model)
-        return {"documents": docs}
+        page = await asyncio.to_thread(rag_service.list_documents, embedding_model, offset, limit)
+        items = page["documents"]
+        return {"documents": [item["source_name"] for item in items], "items": items,
+                "total": page["total"], "offset": offset, "limit": limit}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/documents/{filename}")
+@router.delete("/documents/{filename:path}")
 async def delete_document(filename: str, embedding_model: Optional[str] = None):
     """Delete a specific document from the vector store."""
     try:
-        success = rag_service.delete_document(filename, embedding_model=embedding_model)
-        if success:
-            return {"status": "success", "message": f"Document {filename} deleted"}
-        else:
-            raise HTTPException(status_code=404, detail=f"Document {filename} not found or could not be deleted")
+        result = await asyncio.to_thread(rag_service.delete_document, filename, embedding_model)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not result["found"]:
+        raise HTTPException(status_code=404, detail=f"Document {filename} not found")
+    return {"status": "success", "message": f"Document {filename} deleted",
+            "chunks_deleted": result["chunks_deleted"]}
 
 @router.delete("/documents")
 async def clear_documents(embedding_model: Optional[str] = None):
@@ -491,7 +754,9 @@ async def chat_stream(request: ChatRequest):
                     question=last_message.content,
                     model_name=request.model,
                     temperature=request.temperature,
-                    embedding_model=request.embedding_model
+                    embedding_model=request.embedding_model,
+                    retrieval=request.retrieval_options(),
+                    max_tokens=request.max_tokens
                 ):
                     yield chunk
             
@@ -502,6 +767,8 @@ async def chat_stream(request: ChatRequest):
                     base_url=OLLAMA_BASE_URL,
                     temperature=request.temperature,
                     num_predict=request.max_tokens,
+                    num_ctx=model_num_ctx(request.model),
+                    keep_alive=config.MODEL_KEEP_ALIVE,
                 )
 
                 # Construir mensajes usando objetos Message directamente
@@ -648,6 +915,8 @@ Texto: {text}"""
             model=request.model,
             base_url=OLLAMA_BASE_URL,
             temperature=0.1,
+            num_ctx=model_num_ctx(request.model),
+            keep_alive=config.MODEL_KEEP_ALIVE,
         )
 
         prompt = ChatPromptTemplate.from_template(tasks[request.task])
@@ -665,18 +934,45 @@ Texto: {text}"""
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/debug/rag")
-async def debug_rag(query: str):
-    """Endpoint de debug para verificar retrieval."""
+async def debug_rag(query: str, k: Optional[int] = None, fetch_k: Optional[int] = None,
+                    mmr: Optional[bool] = None, mmr_lambda: Optional[float] = None,
+                    sources: Optional[List[str]] = Query(None), tags: Optional[List[str]] = Query(None),
+                    uploaded_after: Optional[datetime] = None, uploaded_before: Optional[datetime] = None,
+                    model: Optional[str] = None, max_tokens: Optional[int] = None,
+                    embedding_model: Optional[str] = None):
+    """Endpoint de debug para verificar retrieval (admite los mismos filtros que /chat).
+
+    Devuelve el contexto tal y como se empaqueta en el prompt para `model` y `max_tokens`.
+    """
     try:
-        docs = rag_service.get_related_docs(query)
+        options = retrieval_options(k=k, fetch_k=fetch_k, mmr=mmr, mmr_lambda=mmr_lambda, sources=sources,
+                                    tags=tags, uploaded_after=uploaded_after, uploaded_before=uploaded_before)
+        context = await asyncio.to_thread(rag_service.build_context, query, model, max_tokens, options,
+                                          embedding_model)
         return {
             "query": query,
-            "count": len(docs),
-            "documents": [{"content": d.page_content, "metadata": d.metadata} for d in docs]
+            "count": len(context.docs),
+            "context_tokens": context.tokens,
+            "context_budget": context.budget,
+            "truncated": context.truncated,
+            "documents": [{"content": d.page_content, "metadata": d.metadata} for d in context.docs]
         }
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """Contadores de las cachés (embeddings de preguntas, respuestas RAG, vectores en disco y almacenes abiertos)."""
+    query_cache = rag_service.query_cache
+    embedding_cache = rag_service.embedding_cache
+    answer_cache = rag_service.answer_cache
+    return {
+        "query_embeddings": query_cache.stats() if query_cache else None,
+        "answers": answer_cache.stats() if answer_cache else None,
+        "embeddings": await asyncio.to_thread(embedding_cache.stats) if embedding_cache else None,
+        "vector_stores": await asyncio.to_thread(rag_service.stores.stats),
+    }
+
 @router.get("/mongodb/status")
 async def mongodb_status():
     """Obtener estado de la conexión MongoDB."""
@@ -0,0 +1,309 @@
+import math
+import os
+import pickle
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Words plus identifiers joined by - . / : (e.g. "ABC-123", "v2.1", "app/config.py")
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+_JOINERS = re.compile(r"[-./:]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, accent-free terms; joined identifiers are kept whole and split into parts."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        term = match.group()
+        terms.append(term)
+        if _JOINERS.search(term):
+            terms.extend(part for part in _JOINERS.split(term) if part)
+    return terms
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over chunk IDs, persisted as a snapshot plus a log.
+
+    Each term keeps a posting list of (slot, term frequency, chunk length) in
+    compact arrays that NumPy reads without copying, so a query costs a few
+    vector operations proportional to the posting lists of its terms rather than
+    to the corpus size. Removed chunks are masked out and the arrays are
+    compacted once a quarter of the slots are dead.
+
+    save() appends the chunks added (with their term counts) and removed since
+    the last save to LOG_FILENAME, so persisting a write costs the size of the
+    write. The log is replayed on open and folded into a new snapshot once it
+    grows past half the snapshot's size.
+    """
+
+    FILENAME = "bm25.pkl"
+    LOG_FILENAME = "bm25.log"
+    FORMAT_VERSION = 2
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.log_path = os.path.join(os.path.dirname(path), self.LOG_FILENAME) if path else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._clear()
+        # Writes not yet saved: ("add", chunk ID, term counts) or ("remove", chunk ID)
+        self._pending: List[Tuple] = []
+        # Set by clear(): the next save writes a snapshot instead of appending
+        self._rewrite = False
+
+    def _clear(self):
+        self._ids: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self._lengths = array("i")
+        self._alive = bytearray()
+        # term -> (slots, term frequencies, chunk lengths)
+        self._postings: Dict[str, Tuple[array, array, array]] = {}
+        self._total_length = 0
+
+    @classmethod
+    def open(cls, directory: str) -> "BM25Index":
+        """Loads the index stored in `directory`, or returns an empty one bound to it.
+
+        A log cut short by a crash is replayed up to its last complete record; the
+        chunk count then no longer matches the vector store, which rebuilds the index.
+        """
+        index = cls(os.path.join(directory, cls.FILENAME))
+        if os.path.exists(index.path):
+            try:
+                with open(index.path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("format") == cls.FORMAT_VERSION:
+                    index._ids = state["ids"]
+                    index._lengths = state["lengths"]
+                    index._alive = state["alive"]
+                    index._postings = state["postings"]
+                    index._slots = {chunk_id: slot for slot, chunk_id in enumerate(index._ids)
+                                    if index._alive[slot]}
+                    index._total_length = sum(length for length, alive in
+                                              zip(index._lengths, index._alive) if alive)
+                    index._replay_log()
+            except Exception as e:
+                print(f"Warning: could not load keyword index {index.path}: {e}. Rebuilding it.")
+                index._clear()
+        return index
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        size = os.path.getsize(self.log_path)
+        with open(self.log_path, "rb") as f:
+            while f.tell() < size:
+                try:
+                    records = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError) as e:
+                    print(f"Warning: keyword index log {self.log_path} is truncated: {e!r}")
+                    # Records appended after the damaged one could not be read back
+                    self._rewrite = True
+                    break
+                for record in records:
+                    if record[0] == "add":
+                        self._add_terms(record[1], record[2])
+                    else:
+                        self._remove_slot(record[1])
+        self._compact_if_sparse()
+
+    @property
+    def exists(self) -> bool:
+        return self.path is not None and os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        """Indexes chunks; IDs already indexed are skipped (chunk IDs are content-addressed)."""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._slots:
+                    continue
+                terms = dict(Counter(tokenize(text)))
+                self._add_terms(chunk_id, terms)
+                self._pending.append(("add", chunk_id, terms))
+
+    def _add_terms(self, chunk_id: str, terms: Dict[str, int]):
+        """Indexes a chunk from its term counts. Caller holds the lock (or is loading)."""
+        if chunk_id in self._slots:
+            return
+        slot = len(self._ids)
+        self._ids.append(chunk_id)
+        self._slots[chunk_id] = slot
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._total_length += length
+        for term, tf in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("i"), array("i"), array("i"))
+            posting[0].append(slot)
+            posting[1].append(tf)
+            posting[2].append(length)
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Removes chunks by ID and returns how many were indexed."""
+        removed = 0
+        with self._lock:
+            for chunk_id in ids:
+                if self._remove_slot(chunk_id):
+                    self._pending.append(("remove", chunk_id))
+                    removed += 1
+            if removed:
+                self._compact_if_sparse()
+        return removed
+
+    def _remove_slot(self, chunk_id: str) -> bool:
+        """Masks out a chunk. Caller holds the lock (or is loading)."""
+        slot = self._slots.pop(chunk_id, None)
+        if slot is None:
+            return False
+        self._alive[slot] = 0
+        self._total_length -= self._lengths[slot]
+        return True
+
+    def _compact_if_sparse(self):
+        dead = len(self._ids) - len(self._slots)
+        if dead > 1000 and dead > len(self._ids) // 4:
+            self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._pending = []
+            self._rewrite = True
+
+    def search(self, query: str, k: int = 10,
+               allowed_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Returns up to k (chunk ID, BM25 score) pairs, best first.
+
+        With `allowed_ids`, only those chunks are ranked.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._slots:
+                return []
+            slots, scores = self._scores(terms)
+            if allowed_ids is not None:
+                allowed = np.fromiter((self._slots[chunk_id] for chunk_id in allowed_ids
+                                       if chunk_id in self._slots), dtype=np.int32)
+                keep = np.isin(slots, allowed)
+                slots, scores = slots[keep], scores[keep]
+            if len(slots) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                slots, scores = slots[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            return [(self._ids[slots[i]], float(scores[i])) for i in order]
+
+    def _scores(self, terms: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Slots matching any term and their BM25 scores. Caller holds the lock.
+
+        Posting arrays are read through zero-copy views, which must not outlive
+        this call: array.array cannot grow while a view of it exists.
+        """
+        alive_count = len(self._slots)
+        has_dead = alive_count < len(self._ids)
+        alive = np.frombuffer(self._alive, dtype=np.uint8) if has_dead else None
+        avg_length = self._total_length / alive_count or 1.0
+        k1, b = self.k1, self.b
+
+        postings = [self._postings[term] for term in terms if term in self._postings]
+        if len(postings) > 1:
+            # Terms in almost every chunk (idf < 0.11) barely change the ranking but
+            # have the longest posting lists: treat them as stopwords when the query
+            # has other terms
+            rare = [posting for posting in postings if len(posting[0]) <= 0.9 * len(self._ids)]
+            postings = rare or postings
+
+        matched_slots, matched_scores = [], []
+        for posting in postings:
+            slots = np.frombuffer(posting[0], dtype=np.int32)
+            tf = np.frombuffer(posting[1], dtype=np.int32).astype(np.float32)
+            lengths = np.frombuffer(posting[2], dtype=np.int32).astype(np.float32)
+            if has_dead:
+                live = alive[slots].astype(bool)
+                slots, tf, lengths = slots[live], tf[live], lengths[live]
+            df = len(slots)
+            if not df:
+                continue
+            idf = math.log(1.0 + (alive_count - df + 0.5) / (df + 0.5))
+            matched_slots.append(slots.copy())
+            matched_scores.append(idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * lengths / avg_length)))
+
+        if not matched_slots:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        if len(matched_slots) == 1:
+            # A posting list never repeats a slot
+            return matched_slots[0], matched_scores[0]
+        all_slots = np.concatenate(matched_slots)
+        all_scores = np.concatenate(matched_scores)
+        if len(all_slots) > len(self._ids) // 4:
+            # Long posting lists: accumulate into a dense array instead of sorting
+            dense = np.bincount(all_slots, weights=all_scores, minlength=len(self._ids))
+            slots = np.flatnonzero(dense).astype(np.int32)
+            return slots, dense[slots].astype(np.float32)
+        slots, inverse = np.unique(all_slots, return_inverse=True)
+        return slots, np.bincount(inverse, weights=all_scores).astype(np.float32)
+
+    def save(self):
+        """Persists the writes made since the index was loaded or last saved.
+
+        They are appended to the log; the whole index is written (atomically) as
+        a new snapshot instead when there is none yet, after clear(), or once the
+        log is larger than half the snapshot.
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            if not (self._pending or self._rewrite):
+                return
+            log_bytes = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            if self._rewrite or not os.path.exists(self.path) or log_bytes > os.path.getsize(self.path) // 2:
+                self._write_snapshot()
+            else:
+                with open(self.log_path, "ab") as f:
+                    pickle.dump(self._pending, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._pending = []
+            self._rewrite = False
+
+    def _write_snapshot(self):
+        """Writes the whole index and drops the log it now contains. Caller holds the lock."""
+        state = {"format": self.FORMAT_VERSION, "ids": self._ids, "lengths": self._lengths,
+                 "alive": self._alive, "postings": self._postings}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        # Replaying a log the snapshot already contains is harmless (adds of indexed
+        # IDs and removes of missing ones are no-ops), so a crash here loses nothing
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def _compact(self):
+        """Drops dead slots and renumbers the live ones. Caller holds the lock."""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+        postings = {}
+        for term, (slots, tfs, lengths) in self._postings.items():
+            slot_array = np.frombuffer(slots, dtype=np.int32)
+            keep = alive[slot_array]
+            if keep.any():
+                postings[term] = (array("i", new_slot[slot_array[keep]].astype(np.int32).tobytes()),
+                                  array("i", np.frombuffer(tfs, dtype=np.int32)[keep].tobytes()),
+                                  array("i", np.frombuffer(lengths, dtype=np.int32)[keep].tobytes()))
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)[alive]
+        self._ids = [chunk_id for chunk_id, keep in zip(self._ids, alive) if keep]
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._ids)}
+        self._lengths = array("i", lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._postings = postings
@@ -0,0 +1,87 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import config
+
+
+@dataclass(frozen=True)
+class ChunkingSettings:
+    chunk_tokens: int
+    overlap_tokens: int
+
+    @property
+    def signature(self) -> str:
+        """Identifies the chunking; part of every chunk ID so changing it re-indexes."""
+        return f"tokens-v1:{self.chunk_tokens}:{self.overlap_tokens}"
+
+
+# Chunk sizes per embedding model family, kept below what each model embeds well
+# (all-minilm truncates at 256 tokens) with ~10% overlap.
+MODEL_PRESETS: Dict[str, ChunkingSettings] = {
+    "all-minilm": ChunkingSettings(200, 20),
+    "nomic-embed-text": ChunkingSettings(400, 40),
+    "mxbai-embed-large": ChunkingSettings(400, 40),
+    "snowflake-arctic-embed": ChunkingSettings(400, 40),
+    "bge-m3": ChunkingSettings(512, 48),
+    "qwen3-embedding": ChunkingSettings(512, 48),
+}
+DEFAULT_SETTINGS = ChunkingSettings(400, 40)
+
+# Words split into ~4-character BPE pieces; punctuation is one token each
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Estimates the number of tokens in text.
+
+    A BPE-like approximation that does not need the model's tokenizer files.
+    Results are cached because the splitter measures the same pieces repeatedly.
+    """
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        length = len(match.group())
+        count += 1 if length <= 4 else (length + 3) // 4
+    return count
+
+
+def _parse_overrides(spec: str) -> Dict[str, ChunkingSettings]:
+    """Parses "model=chunk:overlap,model2=chunk:overlap"."""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, sizes = item.partition("=")
+        chunk, _, overlap = sizes.partition(":")
+        overrides[model.strip()] = ChunkingSettings(int(chunk), int(overlap or 0))
+    return overrides
+
+
+def chunking_for_model(embedding_model: Optional[str]) -> ChunkingSettings:
+    """Chunking settings for an embedding model's collection.
+
+    Precedence: CHUNKING_OVERRIDES entry for the model, then CHUNK_TOKENS /
+    CHUNK_OVERLAP_TOKENS, then the model family preset.
+    """
+    name = (embedding_model or "").split(":")[0]
+    overrides = _parse_overrides(config.CHUNKING_OVERRIDES)
+    if embedding_model in overrides:
+        return overrides[embedding_model]
+    if name in overrides:
+        return overrides[name]
+
+    preset = MODEL_PRESETS.get(name, DEFAULT_SETTINGS)
+    return ChunkingSettings(
+        chunk_tokens=config.CHUNK_TOKENS or preset.chunk_tokens,
+        overlap_tokens=config.CHUNK_OVERLAP_TOKENS if config.CHUNK_OVERLAP_TOKENS is not None
+        else preset.overlap_tokens,
+    )
+
+
+def make_text_splitter(settings: ChunkingSettings) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.chunk_tokens,
+        chunk_overlap=settings.overlap_tokens,
+        length_function=count_tokens,
+    )
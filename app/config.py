@@ -1,17 +1,129 @@
 import os
 
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
 # Ollama Settings
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DEFAULT_MODEL = os.getenv("MODEL_NAME", "qwen3:14b")
 DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "qwen3-embedding:8b")
+# Seconds Ollama keeps a model loaded after each request (negative = forever,
+# empty = the server's OLLAMA_KEEP_ALIVE default)
+_MODEL_KEEP_ALIVE = os.getenv("MODEL_KEEP_ALIVE", "1800").strip()
+MODEL_KEEP_ALIVE = int(_MODEL_KEEP_ALIVE) if _MODEL_KEEP_ALIVE else None
 
 # API Server Settings
 PORT = int(os.getenv("PORT", 8000))
 MAX_INPUT_LENGTH = int(os.getenv("MAX_INPUT_LENGTH", 4096))
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploaded_files")
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", 50))
+# Startup warm-up, reported by /ready: opens the default stores, loads the default
+# chat and embedding models into Ollama and runs WARMUP_QUERIES ("|"-separated)
+# through retrieval. WARMUP_TIMEOUT bounds each model load, in seconds.
+WARMUP_ENABLED = _env_bool("WARMUP_ENABLED", True)
+WARMUP_QUERIES = os.getenv("WARMUP_QUERIES", "warm-up")
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 300))
+
+# Background Ingestion Settings
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", 1))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", 20))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", 100))
+# Streaming ingestion: pages/sections read, embedded and written per window
+INGEST_WINDOW_DOCS = int(os.getenv("INGEST_WINDOW_DOCS", 8))
+INGEST_TEXT_SECTION_CHARS = int(os.getenv("INGEST_TEXT_SECTION_CHARS", 64000))
+# Token-based chunking. Sizes default to per-embedding-model presets (chunking.py);
+# CHUNK_TOKENS/CHUNK_OVERLAP_TOKENS override them for every model, and
+# CHUNKING_OVERRIDES="all-minilm=200:20,nomic-embed-text=512:32" per model.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 0)) or None
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS")) if os.getenv("CHUNK_OVERLAP_TOKENS") else None
+CHUNKING_OVERRIDES = os.getenv("CHUNKING_OVERRIDES", "")
+# Markdown loader: "native" (heading-aware, no NLTK) or "unstructured" (opt-in)
+MARKDOWN_LOADER = os.getenv("MARKDOWN_LOADER", "native").strip().lower()
+# Worker processes parsing files in parallel during directory ingestion
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 1))
 
 # Vector Database (ChromaDB) Settings
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+VECTORSTORE_WRITE_BATCH_SIZE = int(os.getenv("VECTORSTORE_WRITE_BATCH_SIZE", 256))
+# "chroma" (HNSW index), "flat" (float32 vectors in a memory-mapped NumPy file and
+# chunks in SQLite, exact search as one matrix-vector product; suits corpora of a few
+# thousand chunks) or "quantized": the flat index plus a VECTOR_QUANTIZATION ("int8"
+# or "float16") copy of the vectors that is scanned first, with an exact float32
+# rerank of the best VECTOR_RERANK_FACTOR x k candidates. int8 is the faster of the
+# two (NumPy has no fast float16 arithmetic). An existing Chroma store is copied into
+# the flat or quantized index the first time it is opened.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "int8").strip().lower()
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 4))
+# Per-embedding-model stores kept open at once; the least recently used are closed
+# beyond this count or VECTORSTORE_POOL_MAX_MB of estimated index memory (0 = no limit)
+VECTORSTORE_POOL_SIZE = int(os.getenv("VECTORSTORE_POOL_SIZE", 3))
+VECTORSTORE_POOL_MAX_MB = int(os.getenv("VECTORSTORE_POOL_MAX_MB", 0))
+
+# Embedding Settings
+# Chunks sent per request to Ollama's batch /api/embed endpoint
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+# Embedding requests in flight at once; matches what Ollama serves in parallel
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", 1)))
+# Persistent cache of computed vectors, shared by all embedding models. It lives on
+# the Chroma volume but survives clearing the vector stores.
+EMBEDDING_CACHE_ENABLED = _env_bool("EMBEDDING_CACHE_ENABLED", True)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH",
+                                 os.path.join(CHROMA_PERSIST_DIR, "_embedding_cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 1024))
+
+# In-memory LRU of question embeddings used by retrieval (0 entries disables it)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 3600))
+
+# Retrieval: "hybrid" fuses vector and BM25 keyword hits by reciprocal rank fusion,
+# "vector" is similarity search only. Each search returns RETRIEVAL_CANDIDATES
+# results before fusion; RETRIEVAL_K chunks go into the prompt.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 3))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Fan-out retrieval: also search these embedding models' stores (comma-separated)
+# concurrently and fuse the results with the current model's by reciprocal rank fusion
+FANOUT_EMBEDDING_MODELS = os.getenv("FANOUT_EMBEDDING_MODELS", "")
+# Maximal marginal relevance over the candidates: 1.0 is pure relevance, lower
+# values favour chunks that differ from those already picked
+MMR_ENABLED = _env_bool("MMR_ENABLED", True)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))
+
+# RAG prompt size. Chat models run with a context window of RAG_NUM_CTX tokens
+# (MODEL_NUM_CTX overrides it per model, "qwen3:14b=8192,llama3.2=4096"); retrieved
+# chunks fill what the prompt and the answer (max_tokens, or RAG_ANSWER_TOKENS)
+# leave free, most relevant first.
+RAG_NUM_CTX = int(os.getenv("RAG_NUM_CTX", 4096))
+MODEL_NUM_CTX = os.getenv("MODEL_NUM_CTX", "")
+RAG_ANSWER_TOKENS = int(os.getenv("RAG_ANSWER_TOKENS", 1024))
+
+# Extractive compression: retrieved chunks are cut down to the sentences most similar
+# to the question (plus CONTEXT_COMPRESSION_NEIGHBORS on each side) within
+# CONTEXT_COMPRESSION_TOKENS. Sentences are embedded with the current embedding model,
+# or CONTEXT_COMPRESSION_MODEL (a light one such as all-minilm keeps it cheap on CPU).
+CONTEXT_COMPRESSION_ENABLED = _env_bool("CONTEXT_COMPRESSION_ENABLED", False)
+CONTEXT_COMPRESSION_TOKENS = int(os.getenv("CONTEXT_COMPRESSION_TOKENS", 512))
+CONTEXT_COMPRESSION_NEIGHBORS = int(os.getenv("CONTEXT_COMPRESSION_NEIGHBORS", 1))
+CONTEXT_COMPRESSION_MODEL = os.getenv("CONTEXT_COMPRESSION_MODEL", "")
+
+# Semantic cache of knowledge-base answers: a question whose embedding has at least
+# ANSWER_CACHE_SIMILARITY cosine similarity to a cached one reuses its answer.
+# Invalidated whenever documents are ingested or deleted.
+ANSWER_CACHE_ENABLED = _env_bool("ANSWER_CACHE_ENABLED", False)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 256))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 86400))
+
+# Re-embedding migrations between embedding models: chunks per embedding request,
+# pause between requests, and the longest wait (seconds) for chat requests in
+# flight to finish before each request
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 16))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", 0.5))
+MIGRATION_MAX_WAIT = float(os.getenv("MIGRATION_MAX_WAIT", 30))
 
 # MongoDB Settings (for MCP)
 MONGODB_URI = os.getenv("MONGODB_URI", "")
@@ -0,0 +1,68 @@
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from chunking import count_tokens
+from context_packing import split_sentences
+from retrieval import cosine_similarities
+
+# Marks sentences left out between two kept ones
+GAP = " … "
+
+
+def compress_documents(docs: Sequence[Document], scores: Sequence[float], query_vector: Sequence[float],
+                       embed: Callable[[List[str]], List[List[float]]], target_tokens: int,
+                       neighbors: int = 1) -> Tuple[List[Document], List[float]]:
+    """Keeps the sentences of retrieved chunks most similar to the query.
+
+    All sentences are embedded in one batch with `embed` and scored against the
+    query vector with a single matrix product. The best sentences are taken
+    with up to `neighbors` sentences on each side (for pronouns and lists that
+    depend on them) while they fit in `target_tokens`, and are put back in
+    their original order; chunks left without sentences are dropped. Chunks
+    that already fit are returned unchanged, without embedding anything.
+    """
+    sentences: List[str] = []
+    owners: List[int] = []
+    for i, doc in enumerate(docs):
+        for sentence in split_sentences(doc.page_content):
+            sentences.append(sentence)
+            owners.append(i)
+    tokens = np.array([count_tokens(sentence) for sentence in sentences], dtype=np.int64)
+    if tokens.sum() <= target_tokens:
+        return list(docs), list(scores)
+
+    similarity = cosine_similarities(query_vector, np.asarray(embed(sentences), dtype=np.float32))
+    owners_array = np.asarray(owners)
+    keep = np.zeros(len(sentences), dtype=bool)
+    used = 0
+    for best in np.argsort(-similarity, kind="stable"):
+        if keep[best]:
+            continue
+        span = [j for j in range(best - neighbors, best + neighbors + 1)
+                if 0 <= j < len(sentences) and owners_array[j] == owners_array[best] and not keep[j]]
+        cost = int(tokens[span].sum())
+        if used + cost > target_tokens:
+            # Without room for its neighbours, take the sentence alone (always the best one)
+            if used and used + tokens[best] > target_tokens:
+                continue
+            span, cost = [best], int(tokens[best])
+        keep[span] = True
+        used += cost
+        if used >= target_tokens:
+            break
+
+    compressed_docs, compressed_scores = [], []
+    for i, doc in enumerate(docs):
+        indices = np.flatnonzero(keep & (owners_array == i))
+        if not len(indices):
+            continue
+        parts: List[str] = []
+        for previous, index in zip([None] + list(indices[:-1]), indices):
+            if previous is not None:
+                parts.append(" " if index == previous + 1 else GAP)
+            parts.append(sentences[index])
+        compressed_docs.append(Document(id=doc.id, page_content="".join(parts), metadata=doc.metadata))
+        compressed_scores.append(scores[i])
+    return compressed_docs, compressed_scores
+
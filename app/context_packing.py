@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+import config
+from chunking import count_tokens
+
+# Sentence ends (., !, ?, … followed by whitespace) and blank lines
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits text into sentences, keeping paragraph breaks as boundaries."""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _parse_num_ctx(spec: str) -> Dict[str, int]:
+    """Parses "model=num_ctx,model2=num_ctx"."""
+    sizes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, size = item.rpartition("=")
+        sizes[model.strip()] = int(size)
+    return sizes
+
+
+def model_num_ctx(model: Optional[str]) -> int:
+    """Context window used for a chat model: its MODEL_NUM_CTX entry (exact tag, then
+    family) or RAG_NUM_CTX."""
+    sizes = _parse_num_ctx(config.MODEL_NUM_CTX)
+    model = model or ""
+    return sizes.get(model) or sizes.get(model.split(":")[0]) or config.RAG_NUM_CTX
+
+
+@dataclass
+class PackedContext:
+    text: str
+    docs: List[Document] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = 0
+    # True when the last chunk was cut or lower-ranked chunks were left out
+    truncated: bool = False
+
+
+def _trim_to_tokens(text: str, budget: int, allow_words: bool) -> str:
+    """Leading sentences of text fitting in budget tokens.
+
+    With `allow_words`, text whose first sentence alone is too long is cut at a
+    word boundary instead of being dropped.
+    """
+    kept, used = [], 0
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept or not allow_words:
+        return " ".join(kept)
+    words = []
+    for word in text.split():
+        used += count_tokens(word)
+        if used > budget:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+def pack_context(docs: Sequence[Document], scores: Optional[Sequence[float]], budget: int,
+                 separator: str = "\n\n", min_fragment_tokens: int = 32) -> PackedContext:
+    """Fills a token budget with chunks, most relevant first.
+
+    Chunks are taken greedily by score (in the given order when scores are
+    missing). The first chunk that does not fit is trimmed at sentence
+    boundaries to the remaining budget, unless fewer than `min_fragment_tokens`
+    remain, and packing stops there.
+    """
+    order = range(len(docs)) if scores is None else \
+        sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+    packed, texts, used = [], [], 0
+    truncated = False
+    for i in order:
+        doc = docs[i]
+        tokens = count_tokens(doc.page_content)
+        if used + tokens <= budget:
+            packed.append(doc)
+            texts.append(doc.page_content)
+            used += tokens
+            continue
+        truncated = True
+        remaining = budget - used
+        if remaining >= min_fragment_tokens or not packed:
+            fragment = _trim_to_tokens(doc.page_content, remaining, allow_words=not packed)
+            if fragment:
+                packed.append(Document(id=doc.id, page_content=fragment, metadata=doc.metadata))
+                texts.append(fragment)
+                used += count_tokens(fragment)
+        break
+    return PackedContext(separator.join(texts), packed, used, budget, truncated)
@@ -0,0 +1,187 @@
+import codecs
+import os
+import re
+from typing import Iterable, Iterator, List, Optional
+
+from langchain_community.document_loaders import PyPDFLoader, UnstructuredMarkdownLoader
+from langchain_community.document_loaders.helpers import detect_file_encodings
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+import config
+from chunking import ChunkingSettings, make_text_splitter
+
+
+class StreamingTextLoader(BaseLoader):
+    """Reads a text file lazily in sections of roughly `section_chars` characters.
+
+    Sections end on a blank line (the first separator the text splitter tries), so
+    chunking matches reading the whole file while only one section is in memory.
+    Lines with no blank line for 4x `section_chars` are cut at a line boundary.
+    The encoding is checked (and, with `autodetect_encoding`, detected) before the
+    first section is yielded, so a file is never split with two encodings.
+    """
+
+    # Bytes decoded at a time while checking the encoding
+    CHECK_BLOCK_BYTES = 1024 * 1024
+
+    def __init__(self, file_path: str, encoding: str = "utf-8",
+                 autodetect_encoding: bool = False, section_chars: int = 64_000):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.autodetect_encoding = autodetect_encoding
+        self.section_chars = section_chars
+
+    def lazy_load(self) -> Iterator[Document]:
+        yield from self._read_sections(self._encoding())
+
+    def _encoding(self) -> str:
+        """The configured encoding if the whole file decodes with it, else a detected one."""
+        if self._decodes(self.encoding):
+            return self.encoding
+        if self.autodetect_encoding:
+            for detected in detect_file_encodings(self.file_path):
+                if self._decodes(detected.encoding):
+                    return detected.encoding
+        raise RuntimeError(f"Error loading {self.file_path}: not valid {self.encoding}")
+
+    def _decodes(self, encoding: str) -> bool:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(self.file_path, "rb") as f:
+                while True:
+                    block = f.read(self.CHECK_BLOCK_BYTES)
+                    decoder.decode(block, final=not block)
+                    if not block:
+                        return True
+        except UnicodeDecodeError:
+            return False
+
+    def _read_sections(self, encoding: str) -> Iterator[Document]:
+        metadata = {"source": str(self.file_path)}
+        buffer: List[str] = []
+        size = 0
+        with open(self.file_path, encoding=encoding) as f:
+            for line in f:
+                buffer.append(line)
+                size += len(line)
+                at_break = not line.strip()
+                if (size >= self.section_chars and at_break) or size >= 4 * self.section_chars:
+                    yield Document(page_content="".join(buffer), metadata=dict(metadata))
+                    buffer, size = [], 0
+        if buffer:
+            yield Document(page_content="".join(buffer), metadata=dict(metadata))
+
+
+class MarkdownSectionLoader(BaseLoader):
+    """Heading-aware markdown loader that needs neither Unstructured nor NLTK data.
+
+    Reads the file line by line and yields one Document per section under an ATX
+    heading (`#` to `######`), ignoring `#` lines inside fenced code blocks. Each
+    section keeps its heading path in metadata (`headings`, e.g. "Guide > Install")
+    so chunks split from it stay attributable. Sections with no body are not
+    emitted; their heading stays in the path of the sections below them.
+    """
+
+    # A closing run of "#" only counts after whitespace ("# Using C#" keeps its "#")
+    HEADING = re.compile(r"^(#{1,6})\s+(.+?)(?:\s+#+)?\s*$")
+    FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+
+    def __init__(self, file_path: str, encoding: str = "utf-8"):
+        self.file_path = file_path
+        self.encoding = encoding
+
+    def lazy_load(self) -> Iterator[Document]:
+        headings: List[str] = []
+        levels: List[int] = []
+        body: List[str] = []
+        fence = None
+
+        def section() -> Iterator[Document]:
+            text = "".join(body).strip()
+            if text:
+                heading_line = "#" * levels[-1] + " " + headings[-1] + "\n\n" if headings else ""
+                metadata = {"source": str(self.file_path), "headings": " > ".join(headings)}
+                yield Document(page_content=heading_line + text, metadata=metadata)
+
+        with open(self.file_path, encoding=self.encoding) as f:
+            for line in f:
+                fence_match = self.FENCE.match(line)
+                if fence_match:
+                    marker = fence_match.group(1)
+                    if fence is None:
+                        fence = marker
+                    elif marker[0] == fence[0] and len(marker) >= len(fence) and not line.strip()[len(marker):]:
+                        # Closed only by a bare run of the same character, at least as long
+                        fence = None
+                    body.append(line)
+                    continue
+
+                match = self.HEADING.match(line) if fence is None else None
+                if not match:
+                    body.append(line)
+                    continue
+
+                yield from section()
+                body = []
+                level = len(match.group(1))
+                while levels and levels[-1] >= level:
+                    levels.pop()
+                    headings.pop()
+                levels.append(level)
+                headings.append(match.group(2))
+
+        yield from section()
+
+
+def _unstructured_markdown_loader(file_path: str) -> BaseLoader:
+    """Opt-in Unstructured loader (MARKDOWN_LOADER=unstructured); needs NLTK data."""
+    import nltk
+    for resource, package in (('tokenizers/punkt_tab', 'punkt_tab'),
+                              ('tokenizers/punkt', 'punkt'),
+                              ('taggers/averaged_perceptron_tagger', 'averaged_perceptron_tagger')):
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package)
+    return UnstructuredMarkdownLoader(file_path)
+
+
+def get_loader(file_path: str) -> BaseLoader:
+    """Picks the loader for a file based on its extension."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        return PyPDFLoader(file_path)
+    if ext == ".md":
+        if config.MARKDOWN_LOADER == "unstructured":
+            try:
+                return _unstructured_markdown_loader(file_path)
+            except Exception as e:
+                print(f"Warning: UnstructuredMarkdownLoader unavailable: {e}. Using the native markdown loader.")
+        return MarkdownSectionLoader(file_path)
+    if ext == ".txt":
+        return StreamingTextLoader(file_path, encoding="utf-8",
+                                   section_chars=config.INGEST_TEXT_SECTION_CHARS)
+    # Fallback for code files or others, treat as text
+    return StreamingTextLoader(file_path, encoding="utf-8", autodetect_encoding=True,
+                               section_chars=config.INGEST_TEXT_SECTION_CHARS)
+
+
+def split_documents(documents: Iterable[Document], settings: ChunkingSettings,
+                    source_name: Optional[str] = None) -> List[Document]:
+    """Splits documents into token-sized chunks tagged with their source name.
+
+    The source name is `source_name` if given, else the basename of the source.
+    """
+    documents = list(documents)
+    for doc in documents:
+        if source_name is not None:
+            doc.metadata["source_name"] = source_name
+        elif "source" in doc.metadata:
+            doc.metadata["source_name"] = os.path.basename(doc.metadata["source"])
+    return make_text_splitter(settings).split_documents(documents)
+
+
+def load_and_split(file_path: str, settings: ChunkingSettings,
+                   source_name: Optional[str] = None) -> List[Document]:
+    """Parses and splits a whole file. Runs in worker processes for directory ingestion."""
+    return split_documents(get_loader(file_path).lazy_load(), settings, source_name)
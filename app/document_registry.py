@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+class DocumentRegistry:
+    """Per-embedding-model manifest of ingested documents, stored next to the vector store.
+
+    One row per document (keyed by basename, like list/delete) with its source
+    path, content hash, size in bytes, chunk count, tags and ingestion time, so
+    documents can be listed without reading the vector store.
+    """
+
+    FILENAME = "documents.sqlite3"
+    # PRAGMA user_version once the manifest covers every document in the store
+    COMPLETE_VERSION = 1
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, self.FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   source_name TEXT PRIMARY KEY,
+                   source TEXT NOT NULL,
+                   content_hash TEXT NOT NULL,
+                   bytes INTEGER NOT NULL,
+                   chunk_count INTEGER NOT NULL,
+                   ingested_at REAL NOT NULL
+               )"""
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "tags" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN tags TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        record["tags"] = [tag for tag in record["tags"].split(",") if tag]
+        return record
+
+    def get(self, source_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM documents WHERE source_name = ?", (source_name,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Documents ordered by name; `limit=None` returns all from `offset`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents ORDER BY source_name LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def upsert(self, source_name: str, source: str, content_hash: str, size: int, chunk_count: int,
+               tags: Sequence[str] = (), ingested_at: Optional[float] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(source_name, source, content_hash, bytes, chunk_count, ingested_at, tags) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source_name, source, content_hash, size, chunk_count,
+                 ingested_at if ingested_at is not None else time.time(), ",".join(tags)),
+            )
+            self._conn.commit()
+
+    def delete(self, source_name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE source_name = ?", (source_name,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    @property
+    def complete(self) -> bool:
+        """False until documents ingested before the manifest existed were backfilled."""
+        with self._lock:
+            return self._conn.execute("PRAGMA user_version").fetchone()[0] >= self.COMPLETE_VERSION
+
+    def backfill(self, records: Iterable[Dict[str, Any]]):
+        """Adds documents missing from the manifest and marks it complete."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO documents "
+                "(source_name, source, content_hash, bytes, chunk_count, ingested_at, tags) "
+                "VALUES (:source_name, :source, :content_hash, :bytes, :chunk_count, :ingested_at, :tags)",
+                [{**record, "tags": ",".join(record.get("tags", ()))} for record in records],
+            )
+            self._conn.execute(f"PRAGMA user_version = {self.COMPLETE_VERSION}")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
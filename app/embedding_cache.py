@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embedding vectors keyed by (embedding model, text hash).
+
+    Vectors are stored as float32 blobs in SQLite. When the stored vectors exceed
+    `max_bytes`, the least recently used entries are evicted down to 90% of it.
+    One cache file is shared by every embedding model.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model TEXT NOT NULL,
+                   text_hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   size INTEGER NOT NULL,
+                   last_used REAL NOT NULL,
+                   PRIMARY KEY (model, text_hash)
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors found for the given text hashes."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in hashes if key in found)
+            self.misses += sum(1 for key in hashes if key not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """Stores vectors by text hash, evicting old entries if over the size limit."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((model, key, blob, len(blob), now))
+        with self._lock:
+            # Replaced rows must not be counted twice
+            for start in range(0, len(rows), 500):
+                part = [row[1] for row in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(part))
+                self._total_bytes -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Deletes least recently used entries down to 90% of max_bytes. Caller holds the lock."""
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            doomed = []
+            for rowid, size in rows:
+                doomed.append((rowid,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {"entries": entries, "bytes": self._total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model so vectors already in the EmbeddingCache are not recomputed."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(self.model_name, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+
+        return [found[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_hash(text)
+        found = self.cache.get_many(self.model_name, [key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
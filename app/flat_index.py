@@ -0,0 +1,331 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from retrieval import matches_where
+from vector_backends import Chunks, VectorBackend
+
+
+class MappedMatrix:
+    """Growable (rows x dim) array kept in a memory-mapped file.
+
+    Only the pages a search touches are read into memory, and the kernel can
+    drop them again under memory pressure.
+    """
+
+    def __init__(self, path: str, dtype: str, dim: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim = dim
+        self.array: Optional[np.memmap] = None
+        rows = os.path.getsize(path) // (self.dtype.itemsize * dim) if os.path.exists(path) else 0
+        self._map(rows)
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.array is None else self.array.shape[0]
+
+    def _map(self, rows: int):
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(rows, self.dim)) if rows else None
+
+    def reserve(self, rows: int):
+        """Grows the file to hold at least `rows` rows (doubling, to amortize remapping)."""
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, 2 * self.capacity, 64)
+        self.close()
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dtype.itemsize * self.dim)
+        self._map(capacity)
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+    def close(self):
+        self.flush()
+        self.array = None
+
+
+class FlatIndex(VectorBackend):
+    """Brute-force vector index: float32 vectors in a memory-mapped NumPy file, chunks in SQLite.
+
+    A search is exact, one matrix-vector product of the vectors with the query
+    followed by a per-row scale (the inverse norm), which for a few thousand
+    chunks is faster than walking an HNSW graph and needs no index build.
+    Metadata is held in memory so `where` filters are applied before the scan.
+    Subclasses change how vectors are stored and scanned by overriding
+    _open_matrices, _read_vectors/_write_vectors, _store_scaled and _search
+    (see quantized_store.QuantizedIndex).
+    """
+
+    # Subdirectory of a model's store directory holding the index
+    DIRNAME = "flat_index"
+    # Rows read at a time when rebuilding the scales
+    SCAN_BLOCK_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                   id TEXT PRIMARY KEY,
+                   row INTEGER NOT NULL UNIQUE,
+                   document TEXT,
+                   metadata TEXT NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        settings = dict(self._conn.execute("SELECT key, value FROM settings").fetchall())
+
+        self._ids: List[Optional[str]] = []
+        # 1 per live row, read by NumPy without copying so unfiltered searches need no Python loop
+        self._alive = bytearray()
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._row_of: Dict[str, int] = {}
+        for chunk_id, row, metadata in self._conn.execute("SELECT id, row, metadata FROM chunks"):
+            self._set_row(row, chunk_id, json.loads(metadata))
+        self._free = [row for row, chunk_id in enumerate(self._ids) if chunk_id is None]
+
+        self.dim: Optional[int] = int(settings["dim"]) if "dim" in settings else None
+        self._vectors = self._scales = None
+        if self.dim is not None:
+            self._open_matrices()
+            if settings != self._settings():
+                self._rescale()
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        return os.path.isdir(os.path.join(store_dir, cls.DIRNAME))
+
+    @classmethod
+    def remove(cls, store_dir: str):
+        """Deletes a closed index's files."""
+        shutil.rmtree(os.path.join(store_dir, cls.DIRNAME), ignore_errors=True)
+
+    def _set_row(self, row: int, chunk_id: Optional[str], metadata: Optional[Dict[str, Any]]):
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._alive.append(0)
+            self._metadatas.append(None)
+        self._ids[row] = chunk_id
+        self._alive[row] = chunk_id is not None
+        self._metadatas[row] = metadata
+        if chunk_id is not None:
+            self._row_of[chunk_id] = row
+
+    def _matrices(self) -> List[MappedMatrix]:
+        return [matrix for matrix in (self._vectors, self._scales) if matrix is not None]
+
+    def _open_matrices(self):
+        self._vectors = MappedMatrix(os.path.join(self.directory, "vectors.f32"), "float32", self.dim)
+        self._scales = MappedMatrix(os.path.join(self.directory, "scales.f32"), "float32", 1)
+
+    def _settings(self) -> Dict[str, str]:
+        """Settings the files are written with; a mismatch on open rebuilds the scales."""
+        return {"dim": str(self.dim)}
+
+    def _save_settings(self):
+        self._conn.execute("DELETE FROM settings")
+        self._conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)", list(self._settings().items()))
+        self._conn.commit()
+
+    def _rescale(self):
+        """Rebuilds what _store_scaled derives from the float32 vectors (settings changed)."""
+        rows = len(self._ids)
+        for matrix in self._matrices():
+            matrix.reserve(rows)
+        block = max(1, self.SCAN_BLOCK_BYTES // (4 * self.dim))
+        for start in range(0, rows, block):
+            block_rows = np.arange(start, min(start + block, rows))
+            self._store_scaled(block_rows, self._read_vectors(block_rows))
+        for matrix in self._matrices():
+            matrix.flush()
+        self._save_settings()
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """The float32 vectors of some rows."""
+        return np.asarray(self._vectors.array[rows])
+
+    def _write_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        self._vectors.array[rows] = vectors
+
+    @staticmethod
+    def _inverse_norms(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1)
+        return np.where(norms == 0, 0.0, 1.0 / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+    def _store_scaled(self, rows: np.ndarray, vectors: np.ndarray):
+        """Stores what searches scan besides the vectors: their inverse norms."""
+        self._scales.array[rows, 0] = self._inverse_norms(vectors)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._row_of)
+
+    def estimated_bytes(self) -> int:
+        """Memory a full scan pages in: the vectors and their scales."""
+        with self._lock:
+            if self.dim is None:
+                return 0
+            return len(self._ids) * (self.dim * 4 + 4)
+
+    def _texts(self, chunk_ids: Sequence[str]) -> List[Optional[str]]:
+        texts: Dict[str, Optional[str]] = {}
+        for start in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            texts.update(self._conn.execute(
+                f"SELECT id, document FROM chunks WHERE id IN ({placeholders})", batch).fetchall())
+        return [texts.get(chunk_id) for chunk_id in chunk_ids]
+
+    def _chunks(self, rows: Sequence[int], include) -> Chunks:
+        include = set(include)
+        ids = [self._ids[row] for row in rows]
+        embeddings = None
+        if "embeddings" in include:
+            embeddings = list(self._read_vectors(np.asarray(rows, dtype=np.int64))) if len(rows) else []
+        return Chunks(
+            ids=ids,
+            texts=self._texts(ids) if "texts" in include else None,
+            metadatas=[dict(self._metadatas[row]) or None for row in rows] if "metadatas" in include else None,
+            embeddings=embeddings,
+        )
+
+    def _live_rows(self, where: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Live rows in row order; only a `where` filter is evaluated row by row in Python."""
+        rows = np.flatnonzero(np.frombuffer(self._alive, dtype=np.uint8))
+        if where:
+            rows = rows[[matches_where(self._metadatas[row], where) for row in rows]]
+        return rows
+
+    def list(self, ids=None, where=None, limit=None, offset=None, include=("texts", "metadatas")) -> Chunks:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_of[chunk_id] for chunk_id in dict.fromkeys(ids) if chunk_id in self._row_of]
+                if where:
+                    rows = [row for row in rows if matches_where(self._metadatas[row], where)]
+            else:
+                rows = self._live_rows(where)
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            return self._chunks(rows, include)
+
+    def search(self, vector, k, where=None, include=("texts", "metadatas")) -> Chunks:
+        with self._lock:
+            candidates = self._live_rows(where)
+            if not len(candidates) or k <= 0 or self.dim is None:
+                return self._chunks([], include)
+            vector = np.asarray(vector, dtype=np.float32)
+            unit = vector / (np.linalg.norm(vector) or 1.0)
+            return self._chunks(self._search(unit, candidates, k, filtered=bool(where)), include)
+
+    def _search(self, unit: np.ndarray, candidates: np.ndarray, k: int, filtered: bool) -> List[int]:
+        """Rows of the k candidates nearest to a unit query vector, nearest first."""
+        # One product over the mapped vectors, sliced in place unless a filter
+        # leaves only some rows
+        if filtered:
+            scores = self._vectors.array[candidates] @ unit * self._scales.array[candidates, 0]
+        else:
+            rows = len(self._ids)
+            scores = (self._vectors.array[:rows] @ unit * self._scales.array[:rows, 0])[candidates]
+        return [int(row) for row in candidates[self._top(scores, k)]]
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Positions of the k highest scores, highest first."""
+        if k < len(scores):
+            best = np.argpartition(-scores, k - 1)[:k]
+            return best[np.argsort(-scores[best], kind="stable")]
+        return np.argsort(-scores, kind="stable")
+
+    def add(self, ids, vectors, texts, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._open_matrices()
+                self._save_settings()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            rows = []
+            for chunk_id in ids:
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    row = self._free.pop() if self._free else len(self._ids)
+                    self._set_row(row, chunk_id, {})
+                rows.append(row)
+            rows_array = np.asarray(rows)
+            for matrix in self._matrices():
+                matrix.reserve(len(self._ids))
+            self._write_vectors(rows_array, vectors)
+            self._store_scaled(rows_array, vectors)
+            for matrix in self._matrices():
+                matrix.flush()
+
+            records = []
+            for chunk_id, row, text, metadata in zip(ids, rows, texts, metadatas):
+                self._metadatas[row] = dict(metadata or {})
+                records.append((chunk_id, row, text, json.dumps(self._metadatas[row])))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, row, document, metadata) VALUES (?, ?, ?, ?)", records)
+            self._conn.commit()
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            records = []
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self._row_of.get(chunk_id)
+                if row is None or not metadata:
+                    continue
+                self._metadatas[row].update(metadata)
+                records.append((json.dumps(self._metadatas[row]), chunk_id))
+            self._conn.executemany("UPDATE chunks SET metadata = ? WHERE id = ?", records)
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in dict.fromkeys(ids) if chunk_id in self._row_of]
+            for row in rows:
+                self._ids[row] = None
+                self._alive[row] = 0
+                self._metadatas[row] = None
+            self._free.extend(rows)
+            self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._conn.commit()
+
+    def reset(self):
+        """Deletes every chunk and the vector files."""
+        with self._lock:
+            for matrix in self._matrices():
+                matrix.close()
+                if os.path.exists(matrix.path):
+                    os.remove(matrix.path)
+            self._close_matrices()
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM settings")
+            self._conn.commit()
+            self._ids, self._metadatas, self._row_of, self._free = [], [], {}, []
+            self._alive = bytearray()
+            self.dim = None
+
+    def _close_matrices(self):
+        self._vectors = self._scales = None
+
+    def close(self):
+        with self._lock:
+            for matrix in self._matrices():
+                matrix.close()
+            self._conn.close()
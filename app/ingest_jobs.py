@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class IngestQueueFullError(Exception):
+    """Raised when too many ingestion jobs are already waiting to run."""
+
+
+# Timing bucket for each running status
+STAGE_TIMINGS = {
+    "parsing": "parse",
+    "splitting": "split",
+    "embedding": "embed",
+    "writing": "write",
+}
+FINISHED = ("done", "failed")
+
+
+@dataclass
+class IngestJob:
+    """State of a single background ingestion job."""
+    id: str
+    filename: str
+    file_path: str
+    embedding_model: Optional[str] = None
+    content_hash: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    # queued -> parsing/splitting/embedding/writing (repeated per window) -> done | failed
+    status: str = "queued"
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_added: int = 0
+    chunks_skipped: int = 0
+    chunks_removed: int = 0
+    tokens_total: int = 0
+    tokens_embedded: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Seconds spent per stage: upload, parse, split, embed, write
+    timings: Dict[str, float] = field(default_factory=dict)
+    version: int = 0
+    _stage_started_at: Optional[float] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        timings = dict(self.timings)
+        if self.status in STAGE_TIMINGS and self._stage_started_at is not None:
+            bucket = STAGE_TIMINGS[self.status]
+            timings[bucket] = timings.get(bucket, 0.0) + now - self._stage_started_at
+
+        elapsed = (self.finished_at or now) - (self.started_at or now)
+        embed_seconds = timings.get("embed", 0.0)
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "embedding_model": self.embedding_model,
+            "content_hash": self.content_hash,
+            "tags": self.tags,
+            "status": self.status,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_added": self.chunks_added,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_removed": self.chunks_removed,
+            # Streaming ingestion discovers chunks window by window, so this counts
+            # the chunks found so far that still have to be embedded
+            "chunks_remaining": max(0, self.chunks_total - self.chunks_skipped - self.chunks_embedded),
+            "tokens_total": self.tokens_total,
+            "tokens_embedded": self.tokens_embedded,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": round((self.started_at or now) - self.created_at, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+            "throughput": {
+                "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed > 0 else 0.0,
+                "embed_chunks_per_second":
+                    round(self.chunks_embedded / embed_seconds, 2) if embed_seconds > 0 else 0.0,
+                "embed_tokens_per_second":
+                    round(self.tokens_embedded / embed_seconds, 1) if embed_seconds > 0 else 0.0,
+            },
+            "version": self.version,
+        }
+
+
+class IngestJobManager:
+    """Runs document ingestion in a bounded pool of background threads.
+
+    `ingest_fn` is called as `ingest_fn(file_path, embedding_model=..., progress=...,
+    content_hash=..., tags=...)` and must return the number of chunks it embedded. It reports stage changes through
+    `progress(stage, **counts)`, which the manager turns into job status and timings.
+    Every change bumps the job's `version`, which `wait_for_update` awaits so
+    progress can be streamed instead of polled.
+    """
+
+    def __init__(self, ingest_fn: Callable[..., int], max_workers: int = 1,
+                 max_pending: int = 20, max_history: int = 100):
+        self.ingest_fn = ingest_fn
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # job id -> (event loop, event) of the wait_for_update calls waiting for a change
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def submit(self, file_path: str, filename: str, embedding_model: Optional[str] = None,
+               content_hash: Optional[str] = None, upload_seconds: Optional[float] = None,
+               tags: Optional[Sequence[str]] = None) -> IngestJob:
+        """Queues a file for ingestion and returns its job.
+
+        If the same file is already queued or running for the same embedding model,
+        that job is returned instead of starting another one.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if (job.file_path == file_path and job.embedding_model == embedding_model
+                        and job.status not in FINISHED):
+                    return job
+
+            pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if pending >= self.max_pending:
+                raise IngestQueueFullError(f"Too many pending ingestion jobs ({pending})")
+
+            job = IngestJob(id=uuid.uuid4().hex, filename=filename, file_path=file_path,
+                            embedding_model=embedding_model, content_hash=content_hash,
+                            tags=list(tags or []))
+            if upload_seconds is not None:
+                job.timings["upload"] = upload_seconds
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns a snapshot of the job, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    async def wait_for_update(self, job_id: str, since_version: int,
+                              timeout: float) -> Optional[Dict[str, Any]]:
+        """Waits until the job's version passes `since_version` or `timeout` expires.
+
+        Returns the current snapshot either way, or None if the job is unknown.
+        The wait is an asyncio.Event that the ingestion thread sets through the
+        event loop, so open progress streams hold no worker threads.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.version > since_version:
+                return job.to_dict() if job else None
+            self._waiters.setdefault(job_id, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(job_id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(job_id, None)
+        return self.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _prune(self):
+        """Drops the oldest finished jobs beyond the history limit. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _set_stage(self, job: IngestJob, stage: str, **counts):
+        now = time.time()
+        with self._lock:
+            if job.status != stage:
+                if job.status in STAGE_TIMINGS and job._stage_started_at is not None:
+                    bucket = STAGE_TIMINGS[job.status]
+                    job.timings[bucket] = job.timings.get(bucket, 0.0) + now - job._stage_started_at
+                job._stage_started_at = now
+                job.status = stage
+            if stage in FINISHED:
+                job.finished_at = now
+            for key, value in counts.items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+            job.version += 1
+            for loop, event in self._waiters.pop(job.id, []):
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    pass  # the waiter's event loop is closed
+
+    def _run(self, job: IngestJob):
+        with self._lock:
+            job.started_at = time.time()
+        self._set_stage(job, "parsing")
+
+        def progress(stage: str, **counts):
+            self._set_stage(job, stage, **counts)
+
+        try:
+            chunks_added = self.ingest_fn(job.file_path, embedding_model=job.embedding_model,
+                                          progress=progress, content_hash=job.content_hash,
+                                          tags=job.tags)
+            self._set_stage(job, "done", chunks_added=chunks_added)
+        except Exception as e:
+            print(f"Error ingesting file {job.filename}: {e}")
+            print(traceback.format_exc())
+            self._set_stage(job, "failed", error=str(e))
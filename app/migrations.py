@@ -0,0 +1,263 @@
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+FINISHED = ("done", "failed", "cancelled")
+# Written to the target model's store directory while a migration runs
+CHECKPOINT_FILENAME = "migration.json"
+
+
+class MigrationCancelled(Exception):
+    """Raised inside a migration when its job is cancelled."""
+
+
+class MigrationInterrupted(Exception):
+    """Raised inside a migration when the server shuts down; it resumes on the next start."""
+
+
+class ActivityMonitor:
+    """Counts foreground (chat) requests in flight so background work can yield to them."""
+
+    def __init__(self):
+        self._active = 0
+        self._idle = threading.Condition()
+
+    @property
+    def active(self) -> int:
+        with self._idle:
+            return self._active
+
+    def begin(self) -> Callable[[], None]:
+        """Marks a request as in flight; call the returned function when it ends (extra calls are ignored)."""
+        with self._idle:
+            self._active += 1
+        released = []
+
+        def release():
+            with self._idle:
+                if released:
+                    return
+                released.append(True)
+                self._active -= 1
+                if not self._active:
+                    self._idle.notify_all()
+        return release
+
+    def wait_idle(self, timeout: float) -> float:
+        """Waits until no request is in flight or `timeout` passes; returns the seconds waited."""
+        start = time.perf_counter()
+        with self._idle:
+            self._idle.wait_for(lambda: not self._active, timeout=timeout)
+        return time.perf_counter() - start
+
+
+@dataclass
+class MigrationJob:
+    """State of a re-embedding migration from one embedding model to another."""
+    id: str
+    source_model: str
+    target_model: str
+    # queued -> migrating <-> waiting (for chat requests) -> done | failed | cancelled,
+    # or interrupted by a shutdown (resumed by resume_interrupted)
+    status: str = "queued"
+    documents_total: int = 0
+    documents_migrated: int = 0
+    documents_skipped: int = 0
+    chunks_total: int = 0
+    chunks_migrated: int = 0
+    chunks_skipped: int = 0
+    throttled_seconds: float = 0.0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
+        done = self.chunks_migrated + self.chunks_skipped
+        return {
+            "job_id": self.id,
+            "source_model": self.source_model,
+            "target_model": self.target_model,
+            "status": self.status,
+            "documents_total": self.documents_total,
+            "documents_migrated": self.documents_migrated,
+            "documents_skipped": self.documents_skipped,
+            "chunks_total": self.chunks_total,
+            "chunks_migrated": self.chunks_migrated,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_remaining": max(0, self.chunks_total - done),
+            "progress": round(done / self.chunks_total, 4) if self.chunks_total else 0.0,
+            "chunks_per_second": round(self.chunks_migrated / elapsed, 2) if elapsed > 0 else 0.0,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class MigrationManager:
+    """Runs re-embedding migrations one at a time in a background thread.
+
+    `migrate_fn(source_model, target_model, progress=..., before_batch=...)` does
+    the work (RAGService.migrate_embeddings). Before every embedding request the
+    manager waits, up to `max_wait` seconds, for the chat requests counted by
+    `activity` to finish, then sleeps `pause` seconds, so chat keeps priority on
+    Ollama. Progress is checkpointed to a file in the target store's directory
+    (`store_dir(model)`); `resume_interrupted` restarts the migrations it finds
+    unfinished there, e.g. after a pod restart.
+    """
+
+    def __init__(self, migrate_fn: Callable[..., Dict[str, int]], store_dir: Callable[[str], str],
+                 activity: Optional[ActivityMonitor] = None, pause: float = 0.5, max_wait: float = 30.0,
+                 max_history: int = 20):
+        self.migrate_fn = migrate_fn
+        self.store_dir = store_dir
+        self.activity = activity or ActivityMonitor()
+        self.pause = pause
+        self.max_wait = max_wait
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="migrate")
+        self._jobs: "OrderedDict[str, MigrationJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def submit(self, source_model: str, target_model: str) -> MigrationJob:
+        """Queues a migration, or returns the unfinished one between the same models."""
+        if source_model == target_model:
+            raise ValueError("Source and target embedding models must differ")
+        with self._lock:
+            for job in self._jobs.values():
+                if (job.source_model, job.target_model) == (source_model, target_model) \
+                        and job.status not in FINISHED:
+                    return job
+            job = MigrationJob(id=uuid.uuid4().hex, source_model=source_model, target_model=target_model)
+            self._jobs[job.id] = job
+            self._prune()
+        self._checkpoint(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Stops a migration before its next batch; submitting it again resumes it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status not in FINISHED:
+                job.cancel_requested = True
+            return job.to_dict()
+
+    def resume_interrupted(self, persist_dir: str) -> List[MigrationJob]:
+        """Resubmits the migrations whose checkpoint shows they did not finish."""
+        jobs = []
+        for path in sorted(glob.glob(os.path.join(persist_dir, "*", CHECKPOINT_FILENAME))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    checkpoint = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable migration checkpoint {path}: {e}")
+                continue
+            if checkpoint.get("status") in FINISHED:
+                continue
+            print(f"Resuming migration from {checkpoint['source_model']} to {checkpoint['target_model']}")
+            jobs.append(self.submit(checkpoint["source_model"], checkpoint["target_model"]))
+        return jobs
+
+    def shutdown(self, wait: bool = False):
+        """Stops the running migration before its next batch, leaving it resumable."""
+        self._stopping = True
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _prune(self):
+        """Drops the oldest finished jobs beyond the history limit. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _checkpoint(self, job: MigrationJob):
+        """Saves the job's status and counts next to the target store (atomically)."""
+        directory = self.store_dir(job.target_model)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, CHECKPOINT_FILENAME)
+        with self._lock:
+            snapshot = job.to_dict()
+        snapshot["updated_at"] = time.time()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def _update(self, job: MigrationJob, status: Optional[str] = None, **counts):
+        with self._lock:
+            if status is not None:
+                job.status = status
+                if status in FINISHED:
+                    job.finished_at = time.time()
+            for key, value in counts.items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+
+    def _check_stop(self, job: MigrationJob):
+        if self._stopping:
+            raise MigrationInterrupted()
+        if job.cancel_requested:
+            raise MigrationCancelled()
+
+    def _before_batch(self, job: MigrationJob):
+        self._check_stop(job)
+        if self.activity.active:
+            self._update(job, "waiting")
+            waited = self.activity.wait_idle(self.max_wait)
+            self._update(job, "migrating", throttled_seconds=job.throttled_seconds + waited)
+        if self.pause:
+            time.sleep(self.pause)
+        self._check_stop(job)
+
+    def _run(self, job: MigrationJob):
+        with self._lock:
+            job.started_at = time.time()
+        self._update(job, "migrating")
+        documents_done = [0]
+
+        def progress(stage: str, **counts):
+            self._update(job, **counts)
+            # Checkpoint once per finished document, not per batch
+            done = job.documents_migrated + job.documents_skipped
+            if done != documents_done[0]:
+                documents_done[0] = done
+                self._checkpoint(job)
+
+        try:
+            self.migrate_fn(job.source_model, job.target_model, progress=progress,
+                            before_batch=lambda: self._before_batch(job))
+            self._update(job, "done")
+        except MigrationCancelled:
+            print(f"Migration from {job.source_model} to {job.target_model} cancelled")
+            self._update(job, "cancelled")
+        except MigrationInterrupted:
+            print(f"Migration from {job.source_model} to {job.target_model} interrupted")
+            self._update(job, "interrupted")
+        except Exception as e:
+            print(f"Error migrating {job.source_model} to {job.target_model}: {e}")
+            print(traceback.format_exc())
+            self._update(job, "failed", error=str(e))
+        self._checkpoint(job)
@@ -0,0 +1,144 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List
+
+from langchain_core.embeddings import Embeddings
+from bm25_index import BM25Index
+from chunking import ChunkingSettings
+from document_registry import DocumentRegistry
+from vector_backends import VectorBackend
+
+
+@dataclass
+class ModelStore:
+    """Everything kept open for one embedding model's knowledge base."""
+    embedding_model: str
+    persist_dir: str
+    chunking: ChunkingSettings
+    embeddings: Embeddings
+    vectors: VectorBackend
+    documents: DocumentRegistry
+    keyword_index: BM25Index
+
+    def estimated_bytes(self) -> int:
+        """Approximate resident size: the vector index plus the keyword index."""
+        keyword_index_paths = [os.path.join(self.persist_dir, filename)
+                               for filename in (BM25Index.FILENAME, BM25Index.LOG_FILENAME)]
+        return self.vectors.estimated_bytes() + sum(
+            os.path.getsize(path) for path in keyword_index_paths if os.path.exists(path))
+
+    def close(self):
+        """Saves the keyword index and releases the vector backend and registry."""
+        self.keyword_index.save()
+        self.documents.close()
+        self.vectors.close()
+
+
+class ModelStoreRegistry:
+    """Thread-safe pool of open ModelStores, one per embedding model.
+
+    Stores are opened by `open_store` on first use and reused afterwards, so
+    switching embedding models between requests costs nothing once a model is
+    warm. Beyond `max_stores` open stores, or `max_bytes` of estimated memory
+    (0 for no limit), the least recently used ones are closed. Requests hold a
+    store through `lease`; a store evicted while leased is closed when its last
+    lease ends. Opening a store only locks that model, so a slow first open does
+    not hold up requests for warm models.
+    """
+
+    def __init__(self, open_store: Callable[[str], ModelStore], max_stores: int = 4, max_bytes: int = 0):
+        self.open_store = open_store
+        self.max_stores = max(1, max_stores)
+        self.max_bytes = max_bytes
+        self.opened = 0
+        self.evicted = 0
+        self._stores: "OrderedDict[str, ModelStore]" = OrderedDict()
+        self._leases: Dict[int, int] = {}      # id(store) -> active leases
+        self._retired: Dict[int, ModelStore] = {}  # evicted while leased
+        self._open_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, embedding_model: str) -> ModelStore:
+        """The open store of a model, opening it if needed.
+
+        Without a lease the store may be closed by a later eviction; use it for
+        short calls only.
+        """
+        with self._lock:
+            store = self._stores.get(embedding_model)
+            if store is not None:
+                self._stores.move_to_end(embedding_model)
+                return store
+            open_lock = self._open_locks.setdefault(embedding_model, threading.Lock())
+        with open_lock:
+            with self._lock:
+                store = self._stores.get(embedding_model)
+            if store is None:
+                store = self.open_store(embedding_model)
+                with self._lock:
+                    self._stores[embedding_model] = store
+                    self.opened += 1
+                    closing = self._evict(keep=embedding_model)
+                for evicted in closing:
+                    evicted.close()
+            return store
+
+    @contextmanager
+    def lease(self, embedding_model: str) -> Iterator[ModelStore]:
+        """Holds a model's store open for the duration of a request."""
+        while True:
+            store = self.get(embedding_model)
+            with self._lock:
+                # Evicted between get() and here: open it again
+                if self._stores.get(embedding_model) is store:
+                    self._leases[id(store)] = self._leases.get(id(store), 0) + 1
+                    break
+        try:
+            yield store
+        finally:
+            with self._lock:
+                self._leases[id(store)] -= 1
+                release = not self._leases[id(store)]
+                if release:
+                    del self._leases[id(store)]
+                    retired = self._retired.pop(id(store), None)
+            if release and retired is not None:
+                retired.close()
+
+    def _evict(self, keep: str) -> List[ModelStore]:
+        """Drops least recently used stores over the limits; returns those to close now.
+
+        Caller holds the lock.
+        """
+        closing = []
+        while len(self._stores) > 1:
+            over_count = len(self._stores) > self.max_stores
+            if not over_count and not self.max_bytes:
+                break
+            if not over_count and sum(store.estimated_bytes() for store in self._stores.values()) <= self.max_bytes:
+                break
+            model = next(model for model in self._stores if model != keep)
+            store = self._stores.pop(model)
+            self.evicted += 1
+            print(f"Closing vector store of {model} (least recently used)")
+            if self._leases.get(id(store)):
+                self._retired[id(store)] = store
+            else:
+                closing.append(store)
+        return closing
+
+    def open_models(self) -> List[str]:
+        """Models with an open store, least recently used first."""
+        with self._lock:
+            return list(self._stores)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stores = list(self._stores.values())
+            leased = sum(1 for count in self._leases.values() if count)
+        return {"open": [store.embedding_model for store in stores], "max_stores": self.max_stores,
+                "max_bytes": self.max_bytes, "opened": self.opened, "evicted": self.evicted,
+                "leased": leased, "estimated_bytes": sum(store.estimated_bytes() for store in stores)}
@@ -0,0 +1,157 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+from flat_index import FlatIndex, MappedMatrix
+
+QUANTIZATIONS = ("int8", "float16")
+
+
+class VectorFile:
+    """float32 rows in a plain file, read and written at explicit offsets.
+
+    Nothing is mapped, so reading the rows of a rerank shortlist pages in
+    those rows only. Consecutive rows are read with a single call. Callers
+    serialize access (the index lock), since reads and writes share one file
+    position.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = 4 * dim
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+
+    def reserve(self, rows: int):
+        # Writes past the end grow the file
+        pass
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        starts = np.flatnonzero(np.diff(rows, prepend=-2) != 1)
+        for start, stop in zip(starts, [*starts[1:], len(rows)]):
+            self._file.seek(int(rows[start]) * self.row_bytes)
+            data = self._file.read((stop - start) * self.row_bytes)
+            out[start:stop] = np.frombuffer(data, dtype=np.float32).reshape(stop - start, self.dim)
+        return out
+
+    def write(self, rows: np.ndarray, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        for row, vector in zip(rows, vectors):
+            self._file.seek(int(row) * self.row_bytes)
+            self._file.write(vector.tobytes())
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def quantize(unit: np.ndarray, quantization: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantizes unit vectors; returns (values, per-row scales) with values * scale ≈ unit."""
+    if quantization == "float16":
+        return unit.astype(np.float16), np.ones(len(unit), dtype=np.float32)
+    peak = np.abs(unit).max(axis=1)
+    scales = np.where(peak == 0, 1.0, peak / 127.0).astype(np.float32)
+    return np.round(unit / scales[:, None]).astype(np.int8), scales
+
+
+class QuantizedIndex(FlatIndex):
+    """FlatIndex that scans an int8 or float16 copy of the unit vectors.
+
+    Only that copy and its scales are memory-mapped, a quarter or half of the
+    float32 vectors. int8 rows are scored against an int8 copy of the query
+    with int32 accumulation, float16 rows with float32 accumulation, neither
+    converting the scanned block. The best `rerank_factor * k` rows are then
+    reranked by exact cosine similarity against their float32 vectors, read
+    from the vector file at their offsets. Changing the quantization rebuilds
+    the copy on open.
+    """
+
+    DIRNAME = "quantized_index"
+    # Rows scored at a time when a filter leaves only some of them (gathered into a copy)
+    SCAN_BLOCK_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, directory: str, quantization: str = "int8", rerank_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r} (expected one of {', '.join(QUANTIZATIONS)})")
+        self.quantization = quantization
+        self.rerank_factor = max(1, rerank_factor)
+        self._quantized = None
+        super().__init__(directory)
+
+    def _matrices(self) -> List[MappedMatrix]:
+        return super()._matrices() + ([self._quantized] if self._quantized is not None else [])
+
+    def _open_matrices(self):
+        self._vectors = VectorFile(os.path.join(self.directory, "vectors.f32"), self.dim)
+        self._scales = MappedMatrix(os.path.join(self.directory, "scales.f32"), "float32", 1)
+        for name in QUANTIZATIONS:
+            path = os.path.join(self.directory, f"vectors.{name}")
+            if name != self.quantization and os.path.exists(path):
+                os.remove(path)
+        self._quantized = MappedMatrix(os.path.join(self.directory, f"vectors.{self.quantization}"),
+                                       self.quantization, self.dim)
+
+    def _close_matrices(self):
+        super()._close_matrices()
+        self._quantized = None
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors.read(rows)
+
+    def _write_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        self._vectors.write(rows, vectors)
+
+    def _settings(self):
+        return {**super()._settings(), "quantization": self.quantization}
+
+    def _store_scaled(self, rows: np.ndarray, vectors: np.ndarray):
+        """Stores the quantized unit vectors and their quantization scales."""
+        values, scales = quantize(vectors * self._inverse_norms(vectors)[:, None], self.quantization)
+        self._quantized.array[rows] = values
+        self._scales.array[rows, 0] = scales
+
+    def estimated_bytes(self) -> int:
+        """Memory a full scan pages in: the quantized vectors and their scales."""
+        with self._lock:
+            if self.dim is None:
+                return 0
+            return len(self._ids) * (self.dim * np.dtype(self.quantization).itemsize + 4)
+
+    def _scores(self, values: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Dot products of quantized rows with the query, accumulated without converting the rows."""
+        if self.quantization == "int8":
+            return np.einsum("ij,j->i", values, query, dtype=np.int32).astype(np.float32)
+        return np.einsum("ij,j->i", values, query, dtype=np.float32)
+
+    def _search(self, unit, candidates, k, filtered) -> List[int]:
+        # First pass over the quantized vectors; the int8 query keeps the ranking of
+        # the float one up to its own rounding, which the rerank absorbs
+        if self.quantization == "int8":
+            query, _ = quantize(unit[None, :], "int8")
+            query = query[0]
+        else:
+            query = unit.astype(np.float32)
+        if filtered:
+            approx = np.empty(len(candidates), dtype=np.float32)
+            block = max(1, self.SCAN_BLOCK_BYTES // self.dim)
+            for start in range(0, len(candidates), block):
+                rows = candidates[start:start + block]
+                approx[start:start + block] = (self._scores(self._quantized.array[rows], query)
+                                               * self._scales.array[rows, 0])
+        else:
+            rows = len(self._ids)
+            approx = (self._scores(self._quantized.array[:rows], query) * self._scales.array[:rows, 0])[candidates]
+        shortlist = candidates[self._top(approx, k * self.rerank_factor)]
+
+        # Exact rerank of the shortlist with its float32 vectors, read in file order
+        shortlist = np.sort(shortlist)
+        vectors = self._read_vectors(shortlist)
+        norms = np.linalg.norm(vectors, axis=1)
+        exact = vectors @ unit / np.where(norms == 0, 1.0, norms)
+        return [int(row) for row in shortlist[self._top(exact, k)]]
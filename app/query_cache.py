@@ -0,0 +1,77 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Collapses whitespace so retries that differ only in spacing share an entry."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of query embeddings keyed by (embedding model, normalized query).
+
+    Entries expire `ttl_seconds` after they were computed and the least recently
+    used ones are dropped beyond `max_entries`. The key is the exact string that
+    is embedded: case is kept, since embedding models tell "ABC-123" from "abc-123".
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, query: str) -> Tuple[str, str]:
+        return model, normalize_query(query)
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = self._key(model, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: str, query: str, vector: List[float]):
+        key = self._key(model, query)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, model: str, query: str,
+                       compute: Callable[[str], List[float]]) -> List[float]:
+        """Returns the cached vector or embeds the normalized query with `compute`."""
+        vector = self.get(model, query)
+        if vector is None:
+            vector = compute(normalize_query(query))
+            self.put(model, query, vector)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "ttl_seconds": self.ttl_seconds, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
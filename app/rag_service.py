@@ -1,15 +1,42 @@
+import asyncio
+import glob
+import hashlib
+import math
+import multiprocessing
 import os
+import re
 import shutil
-from typing import List, Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import TextLoader, DirectoryLoader, PyPDFLoader, UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import numpy as np
 import config
+from chunking import ChunkingSettings, chunking_for_model, count_tokens
+from context_compression import compress_documents
+from context_packing import PackedContext, model_num_ctx, pack_context
+from document_loaders import get_loader, load_and_split, split_documents
+from document_registry import DocumentRegistry
+from answer_cache import SemanticAnswerCache
+from bm25_index import BM25Index
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from model_stores import ModelStore, ModelStoreRegistry
+from flat_index import FlatIndex
+from quantized_store import QuantizedIndex
+from query_cache import QueryEmbeddingCache
+from retrieval import (TAG_PREFIX, RetrievalOptions, cosine_similarities, mmr_select, parse_tags,
+                       rrf_scores, source_name, tag_key)
+from uploads import file_sha256
+from vector_backends import INCLUDE_FIELDS, ChromaBackend, VectorBackend
 
 class RAGService:
     """Service to handle RAG operations: ingestion, retrieval, and generation."""
@@ -18,204 +45,703 @@ class RAGService:
                  ollama_base_url: str = config.OLLAMA_BASE_URL,
                  model_name: str = config.DEFAULT_MODEL,
                  embedding_model: str = config.DEFAULT_EMBEDDING_MODEL,
-                 persist_dir: str = config.CHROMA_PERSIST_DIR):
+                 persist_dir: str = config.CHROMA_PERSIST_DIR,
+                 embedding_batch_size: int = config.EMBEDDING_BATCH_SIZE,
+                 embedding_concurrency: int = config.EMBEDDING_MAX_CONCURRENCY,
+                 write_batch_size: int = config.VECTORSTORE_WRITE_BATCH_SIZE,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 ingest_window_docs: int = config.INGEST_WINDOW_DOCS,
+                 query_cache: Optional[QueryEmbeddingCache] = None,
+                 answer_cache: Optional[SemanticAnswerCache] = None):
         
         self.ollama_base_url = ollama_base_url
         self.model_name = model_name
         self.persist_dir = persist_dir
-        self.embedding_model_name = None # Force initial setup in _update_embedding_model
+        # Used when a request names no embedding model; never changes
+        self.default_embedding_model = embedding_model
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        self.embedding_concurrency = max(1, embedding_concurrency)
+        self.write_batch_size = max(1, write_batch_size)
+        self.ingest_window_docs = max(1, ingest_window_docs)
+        # Shared by every ingestion so the total number of embedding requests
+        # in flight against Ollama never exceeds embedding_concurrency.
+        self._embed_executor = ThreadPoolExecutor(max_workers=self.embedding_concurrency,
+                                                  thread_name_prefix="embed")
+        # The default cache file is opened on first use, so creating the service
+        # (e.g. importing the API) writes nothing to disk
+        self._embedding_cache = embedding_cache
+        self._embedding_cache_lock = threading.Lock()
+        if query_cache is None and config.QUERY_EMBEDDING_CACHE_SIZE > 0:
+            query_cache = QueryEmbeddingCache(config.QUERY_EMBEDDING_CACHE_SIZE,
+                                              ttl_seconds=config.QUERY_EMBEDDING_CACHE_TTL)
+        self.query_cache = query_cache
+        if answer_cache is None and config.ANSWER_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(config.ANSWER_CACHE_SIMILARITY,
+                                               max_entries=config.ANSWER_CACHE_SIZE,
+                                               ttl_seconds=config.ANSWER_CACHE_TTL)
+        self.answer_cache = answer_cache
+        # One open store per embedding model, passed explicitly through each request
+        self.stores = ModelStoreRegistry(self._open_store, max_stores=config.VECTORSTORE_POOL_SIZE,
+                                         max_bytes=config.VECTORSTORE_POOL_MAX_MB * 1024 * 1024)
+        # Fan-out retrieval searches several stores at once
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieve")
         
         # Initialize LLM
         self.llm = ChatOllama(
             model=model_name,
             base_url=ollama_base_url,
             temperature=0.3, # Low temperature for factual RAG
+            keep_alive=config.MODEL_KEEP_ALIVE,
         )
+        # Stores open on first use; the API opens the default one during warm-up
 
-        # Initialize embeddings, vectorstore, and retriever
-        self._update_embedding_model(embedding_model)
+    @property
+    def embedding_cache(self) -> Optional[EmbeddingCache]:
+        with self._embedding_cache_lock:
+            if self._embedding_cache is None and config.EMBEDDING_CACHE_ENABLED:
+                self._embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH,
+                                                       max_bytes=config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+            return self._embedding_cache
 
-    def _update_embedding_model(self, embedding_model: Optional[str]):
-        """Updates the embedding model if it's different from the current one."""
-        if not embedding_model or embedding_model == getattr(self, 'embedding_model_name', None):
-            return
+    def store(self, embedding_model: Optional[str] = None) -> ModelStore:
+        """The open store of an embedding model (the default one if None)."""
+        return self.stores.get(embedding_model or self.default_embedding_model)
+
+    def _lease(self, embedding_model: Optional[str] = None):
+        """Context manager holding an embedding model's store for one request."""
+        return self.stores.lease(embedding_model or self.default_embedding_model)
+
+    def default_embedding_models(self) -> List[str]:
+        """Embedding models a request without embedding_model uses: the default one
+        and the fan-out ones."""
+        return list(dict.fromkeys([self.default_embedding_model] + self._fanout_models()))
+
+    def warm_up(self, embedding_model: Optional[str] = None, queries: Sequence[str] = ()):
+        """Opens an embedding model's store and runs `queries` through retrieval.
+
+        The first search loads the vector index (Chroma's HNSW segments or the
+        flat index's vector pages) into memory, and the query embeddings stay in
+        the query cache. With fan-out configured the fan-out models' stores are
+        opened and searched as well.
+        """
+        with self._lease(embedding_model) as store:
+            for query in queries:
+                self._search(store, query, self._embed_query(store, query), RetrievalOptions())
 
-        print(f"Switching embedding model to: {embedding_model}")
-        self.embedding_model_name = embedding_model
-        self.embeddings = OllamaEmbeddings(
+    def store_dir(self, embedding_model: str) -> str:
+        """Directory of an embedding model's store."""
+        # Use a model-specific subdirectory to avoid dimension mismatch
+        return os.path.join(self.persist_dir, embedding_model.replace(':', '_'))
+
+    def _open_store(self, embedding_model: str) -> ModelStore:
+        embeddings = OllamaEmbeddings(
             model=embedding_model,
             base_url=self.ollama_base_url,
+            keep_alive=config.MODEL_KEEP_ALIVE,
         )
-        
-        # Use a model-specific subdirectory to avoid dimension mismatch
-        model_persist_dir = os.path.join(self.persist_dir, embedding_model.replace(':', '_'))
-        
-        # Update vectorstore with new embedding function
-        self.vectorstore = Chroma(
-            persist_directory=model_persist_dir,
-            embedding_function=self.embeddings,
-        )
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3}
+        embedding_cache = self.embedding_cache
+        if embedding_cache is not None:
+            embeddings = CachedEmbeddings(embeddings, embedding_cache, embedding_model)
+
+        model_persist_dir = self.store_dir(embedding_model)
+        vectors = self._open_vector_backend(model_persist_dir, embeddings)
+        store = ModelStore(
+            embedding_model=embedding_model,
+            persist_dir=model_persist_dir,
+            chunking=chunking_for_model(embedding_model),
+            embeddings=embeddings,
+            vectors=vectors,
+            documents=DocumentRegistry(model_persist_dir),
+            keyword_index=BM25Index.open(model_persist_dir),
         )
+        if not store.documents.complete:
+            self._backfill_document_registry(store)
+        if len(store.keyword_index) != vectors.count():
+            self._rebuild_keyword_index(store)
+        return store
 
-    def ingest_file(self, file_path: str, embedding_model: Optional[str] = None) -> int:
-        """Ingests a single file into the vector store."""
-        if embedding_model:
-            self._update_embedding_model(embedding_model)
+    def _open_vector_backend(self, store_dir: str, embeddings: Embeddings) -> VectorBackend:
+        """Opens the VECTOR_BACKEND of a store directory.
+
+        A flat or quantized index created next to an existing Chroma store starts
+        as a copy of it, so switching backends does not require embedding
+        everything again. The copy is built in a side directory and moved into
+        place once complete; an interrupted copy is discarded and started over
+        on the next open instead of being served.
+        """
+        if config.VECTOR_BACKEND == "chroma":
+            return ChromaBackend(store_dir, embeddings)
+        if config.VECTOR_BACKEND == "flat":
+            open_index = FlatIndex
+            index_dir = os.path.join(store_dir, FlatIndex.DIRNAME)
+        elif config.VECTOR_BACKEND == "quantized":
+            open_index = partial(QuantizedIndex, quantization=config.VECTOR_QUANTIZATION,
+                                 rerank_factor=config.VECTOR_RERANK_FACTOR)
+            index_dir = os.path.join(store_dir, QuantizedIndex.DIRNAME)
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND {config.VECTOR_BACKEND!r} "
+                             "(expected chroma, flat or quantized)")
+        if not os.path.exists(index_dir) and ChromaBackend.exists(store_dir):
+            copy_dir = index_dir + ".copying"
+            shutil.rmtree(copy_dir, ignore_errors=True)
+            vectors = open_index(copy_dir)
+            try:
+                self._copy_vectors(ChromaBackend(store_dir), vectors)
+            finally:
+                vectors.close()
+            os.replace(copy_dir, index_dir)
+        return open_index(index_dir)
+
+    def _copy_vectors(self, source: VectorBackend, target: VectorBackend):
+        """Copies every chunk, with its vector, from one backend to another and closes the source."""
+        try:
+            total = source.count()
+            for offset in range(0, total, self.write_batch_size):
+                batch = source.list(include=INCLUDE_FIELDS, limit=self.write_batch_size, offset=offset)
+                target.add(batch.ids, batch.embeddings, batch.texts, batch.metadatas)
+            if total:
+                print(f"Copied {total} vectors from {type(source).__name__} to {type(target).__name__}")
+        finally:
+            source.close()
 
+    def _backfill_document_registry(self, store: ModelStore):
+        """Adds documents ingested before the registry existed, reading chunk metadata once."""
+        total = store.vectors.count()
+        records: Dict[str, Dict] = {}
+        for offset in range(0, total, self.write_batch_size):
+            batch = store.vectors.list(include=["metadatas"], limit=self.write_batch_size, offset=offset)
+            for meta in batch.metadatas:
+                if not meta or "source" not in meta:
+                    continue
+                name = meta.get("source_name") or os.path.basename(meta["source"])
+                record = records.setdefault(name, {
+                    "source_name": name, "source": meta["source"], "content_hash": "",
+                    "bytes": os.path.getsize(meta["source"]) if os.path.exists(meta["source"]) else 0,
+                    "chunk_count": 0, "ingested_at": meta.get("uploaded_at", 0.0),
+                    "tags": sorted(key[len(TAG_PREFIX):] for key, value in meta.items()
+                                   if key.startswith(TAG_PREFIX) and value),
+                })
+                record["chunk_count"] += 1
+        if records:
+            print(f"Backfilled document registry with {len(records)} documents of {store.embedding_model}")
+        store.documents.backfill(records.values())
+
+    def _rebuild_keyword_index(self, store: ModelStore):
+        """Rebuilds the keyword index from the stored chunks.
+
+        Needed for stores that predate the index or when it was not saved after
+        the last write (e.g. the process stopped mid-ingestion).
+        """
+        total = store.vectors.count()
+        print(f"Building keyword index for {total} chunks of {store.embedding_model}...")
+        store.keyword_index.clear()
+        for offset in range(0, total, self.write_batch_size):
+            batch = store.vectors.list(include=["texts"], limit=self.write_batch_size, offset=offset)
+            store.keyword_index.add(batch.ids, [text or "" for text in batch.texts])
+        store.keyword_index.save()
+
+    def ingest_file(self, file_path: str, embedding_model: Optional[str] = None,
+                    progress: Optional[Callable[..., None]] = None,
+                    content_hash: Optional[str] = None,
+                    tags: Optional[Sequence[str]] = None) -> int:
+        """Ingests a single file into the vector store.
+
+        `progress(stage, **counts)` is called when ingestion moves to a new stage
+        ("parsing", "embedding"). Every chunk is stamped with the upload time and
+        the given tags so retrieval can filter on them. The file's content hash is
+        recorded in the document registry once ingestion succeeds.
+        """
+        progress = progress or (lambda stage, **counts: None)
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        # Determine loader based on extension
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif ext == ".md":
-            try:
-                # Try to ensure resources are available if using Unstructured
-                import nltk
-                try:
-                    nltk.data.find('tokenizers/punkt_tab')
-                except LookupError:
-                    nltk.download('punkt_tab')
-                try:
-                    nltk.data.find('tokenizers/punkt')
-                except LookupError:
-                    nltk.download('punkt')
+        progress("parsing")
+
+        # Pages/sections are read lazily and processed in windows, so peak memory
+        # depends on ingest_window_docs rather than on the size of the file
+        extra_metadata = self._ingest_metadata(tags)
+        with self._lease(embedding_model) as store:
+            stats = self._process_documents(get_loader(file_path).lazy_load(), progress=progress,
+                                            extra_metadata=extra_metadata, store=store)
+            self._record_document(store, file_path, stats, content_hash, extra_metadata)
+        return stats["chunks_added"]
+
+    @staticmethod
+    def _ingest_metadata(tags: Optional[Sequence[str]] = None) -> Dict[str, object]:
+        """Filterable metadata added to every chunk of an ingestion."""
+        metadata: Dict[str, object] = {"uploaded_at": time.time()}
+        for tag in parse_tags(tags):
+            metadata[tag_key(tag)] = True
+        return metadata
+
+    def _record_document(self, store: ModelStore, file_path: str, stats: Dict[str, int],
+                         content_hash: Optional[str] = None, extra_metadata: Optional[Dict[str, object]] = None,
+                         source_name: Optional[str] = None):
+        extra_metadata = extra_metadata or {}
+        store.documents.upsert(
+            source_name or os.path.basename(file_path),
+            source=file_path,
+            content_hash=content_hash or file_sha256(file_path),
+            size=os.path.getsize(file_path),
+            chunk_count=stats["chunks_total"],
+            tags=[key[len(TAG_PREFIX):] for key in extra_metadata if key.startswith(TAG_PREFIX)],
+            ingested_at=extra_metadata.get("uploaded_at"),
+        )
+
+    def is_ingested(self, filename: str, content_hash: str, embedding_model: Optional[str] = None) -> bool:
+        """True if this exact content was already ingested under this filename for the embedding model."""
+        with self._lease(embedding_model) as store:
+            record = store.documents.get(os.path.basename(filename))
+        return record is not None and record["content_hash"] == content_hash
+
+    def ingest_directory(self, dir_path: str, glob_pattern: str = "**/*",
+                         embedding_model: Optional[str] = None,
+                         max_workers: Optional[int] = None,
+                         tags: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Ingests all matching files in a directory and returns a per-file report.
+
+        Files are parsed and split in a process pool (PDF/Unstructured parsing is
+        CPU-bound and holds the GIL) with the same per-extension loaders as
+        ingest_file, while this process embeds and writes each parsed file through
+        the shared embedding stage as soon as it is ready. Each file is identified
+        (registry entry, chunk IDs, `sources` filter) by its path relative to
+        `dir_path`, so files with the same name in different folders stay apart.
+        """
+        with self._lease(embedding_model) as store:
+            return self._ingest_paths(store, dir_path, glob_pattern, max_workers, tags)
+
+    def _ingest_paths(self, store: ModelStore, dir_path: str, glob_pattern: str,
+                      max_workers: Optional[int], tags: Optional[Sequence[str]]) -> List[Dict]:
+        paths = sorted(path for path in glob.glob(os.path.join(dir_path, glob_pattern), recursive=True)
+                       if os.path.isfile(path))
+        max_workers = max(1, max_workers or config.INGEST_PARSE_WORKERS)
+        extra_metadata = self._ingest_metadata(tags)
+        report = []
+
+        # spawn avoids forking a process that holds Chroma and executor threads
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Keep a bounded number of parsed files waiting for the embedding stage
+            in_flight = deque()
+            path_iter = iter(paths)
+            for path in islice(path_iter, 2 * max_workers):
+                in_flight.append((path, time.time(),
+                                  pool.submit(load_and_split, path, store.chunking, self._relative_name(path, dir_path))))
+
+            while in_flight:
+                path, submitted_at, future = in_flight.popleft()
+                name = self._relative_name(path, dir_path)
+                entry = {"file": name}
                 try:
-                    nltk.data.find('taggers/averaged_perceptron_tagger')
-                except LookupError:
-                    nltk.download('averaged_perceptron_tagger')
+                    chunks = future.result()
+                    entry["parse_seconds"] = round(time.time() - submitted_at, 3)
+                    started = time.time()
+                    stats = self._process_chunks([chunks], extra_metadata=extra_metadata, store=store)
+                    self._record_document(store, path, stats, extra_metadata=extra_metadata, source_name=name)
+                    entry.update(stats)
+                    entry["embed_seconds"] = round(time.time() - started, 3)
+                    entry["status"] = "success"
+                except Exception as e:
+                    print(f"Error ingesting {path}: {e}")
+                    entry.update(status="failed", error=str(e))
+                report.append(entry)
 
-                loader = UnstructuredMarkdownLoader(file_path)
-                documents = loader.load()
-            except Exception as e:
-                print(f"Warning: UnstructuredMarkdownLoader failed: {e}. Falling back to TextLoader.")
-                loader = TextLoader(file_path, encoding="utf-8", autodetect_encoding=True)
-                documents = loader.load()
-        elif ext == ".txt":
-            loader = TextLoader(file_path, encoding="utf-8")
-        else:
-            # Fallback for code files or others, treat as text
-            loader = TextLoader(file_path, encoding="utf-8", autodetect_encoding=True)
-
-        documents = loader.load()
-        return self._process_documents(documents)
-
-    def ingest_directory(self, dir_path: str, glob_pattern: str = "**/*") -> int:
-        """Ingests all matching files in a directory."""
-        # Note: DirectoryLoader defaults to Unstructured for unknown types, 
-        # might want to be specific or use multiple loaders.
-        # For simplicity, we use TextLoader for now for text-based.
-        loader = DirectoryLoader(dir_path, glob=glob_pattern, loader_cls=TextLoader)
-        documents = loader.load()
-        return self._process_documents(documents)
-
-    def _process_documents(self, documents: List[Document]) -> int:
-        """Splits documents and adds them to the vector store."""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
+                next_path = next(path_iter, None)
+                if next_path is not None:
+                    in_flight.append((next_path, time.time(),
+                                      pool.submit(load_and_split, next_path, store.chunking,
+                                                  self._relative_name(next_path, dir_path))))
+
+        return report
+
+    @staticmethod
+    def _relative_name(path: str, root: str) -> str:
+        """Source name of a file ingested from a directory: its path under `root`, with "/" separators."""
+        return source_name(os.path.relpath(path, root))
+
+    @staticmethod
+    def _chunk_id(chunking: ChunkingSettings, source_name: str, text: str) -> str:
+        """Deterministic chunk ID from (source, splitter settings, chunk text)."""
+        digest = hashlib.sha256()
+        for part in (source_name, chunking.signature, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _existing_chunk_ids(self, store: ModelStore, sources: Dict[str, str]) -> Dict[str, Set[str]]:
+        """Returns the stored chunk IDs of each source, keyed by source name.
+
+        `sources` maps each source path to its source name. Chunks written before
+        source_name existed are matched by their full path: this one, or the
+        path the document was registered with, which differs when an upload
+        moved (e.g. into content-addressed storage).
+        """
+        names = sorted(set(sources.values()))
+        path_names = dict(sources)
+        for name in names:
+            record = store.documents.get(name)
+            if record and record["source"]:
+                path_names.setdefault(record["source"], name)
+        existing: Dict[str, Set[str]] = {name: set() for name in names}
+        if not names:
+            return existing
+
+        results = store.vectors.list(
+            where={"$or": [{"source_name": {"$in": names}}, {"source": {"$in": sorted(path_names)}}]},
+            include=["metadatas"],
         )
-        chunks = text_splitter.split_documents(documents)
-        
-        if not chunks:
-            return 0
-            
-        self.vectorstore.add_documents(chunks)
-        # Chroma handles persistence automatically in recent versions, but explicit persist calls
-        # were deprecated. LangChain's Chroma wrapper handles it.
-        
-        return len(chunks)
+        for chunk_id, meta in zip(results.ids, results.metadatas):
+            meta = meta or {}
+            source = meta.get("source", "")
+            name = meta.get("source_name") or path_names.get(source) or os.path.basename(source)
+            existing.setdefault(name, set()).add(chunk_id)
+        return existing
+
+    def _process_documents(self, documents: Iterable[Document],
+                           progress: Optional[Callable[..., None]] = None,
+                           extra_metadata: Optional[Dict[str, object]] = None,
+                           store: Optional[ModelStore] = None) -> Dict[str, int]:
+        """Splits documents and adds new chunks to a vector store (the default one if None).
+
+        Documents are consumed in windows of `ingest_window_docs`; each window is
+        split, embedded and written before the next one is read. Returns the chunk
+        counts from _process_chunks.
+        """
+        progress = progress or (lambda stage, **counts: None)
+        store = store or self.store()
+
+        def windows():
+            docs = iter(documents)
+            while True:
+                progress("parsing")
+                window = list(islice(docs, self.ingest_window_docs))
+                if not window:
+                    return
+                progress("splitting")
+                yield split_documents(window, store.chunking)
+
+        return self._process_chunks(windows(), progress=progress, extra_metadata=extra_metadata, store=store)
+
+    def _process_chunks(self, windows: Iterable[List[Document]],
+                        progress: Optional[Callable[..., None]] = None,
+                        extra_metadata: Optional[Dict[str, object]] = None,
+                        store: Optional[ModelStore] = None) -> Dict[str, int]:
+        """Embeds and writes windows of chunks, returning chunk counts.
+
+        Chunks already stored under the same content-addressed ID are skipped, and
+        chunks of the same sources that no longer exist are deleted at the end.
+        `extra_metadata` is added to every chunk, including skipped ones.
+        """
+        progress = progress or (lambda stage, **counts: None)
+        store = store or self.store()
+        current: Dict[str, Set[str]] = {}   # chunk IDs produced in this run, per source
+        existing: Dict[str, Set[str]] = {}  # chunk IDs stored before this run, per source
+        chunks_total = chunks_skipped = chunks_added = 0
+        tokens_total = tokens_embedded = 0
+        restamped = False
+
+        for chunks in windows:
+            unseen_sources = {chunk.metadata["source"]: chunk.metadata["source_name"] for chunk in chunks
+                              if "source" in chunk.metadata
+                              and chunk.metadata["source_name"] not in existing}
+            if unseen_sources:
+                existing.update(self._existing_chunk_ids(store, unseen_sources))
+
+            # Identical chunks within a source collapse to a single ID
+            new_chunks, skipped_ids = [], []
+            for chunk in chunks:
+                if extra_metadata:
+                    chunk.metadata.update(extra_metadata)
+                name = chunk.metadata.get("source_name", "")
+                chunk_id = self._chunk_id(store.chunking, name, chunk.page_content)
+                ids = current.setdefault(name, set())
+                if chunk_id in ids:
+                    continue
+                ids.add(chunk_id)
+                tokens = count_tokens(chunk.page_content)
+                chunks_total += 1
+                tokens_total += tokens
+                if chunk_id in existing.get(name, ()):
+                    chunks_skipped += 1
+                    skipped_ids.append(chunk_id)
+                else:
+                    tokens_embedded += tokens
+                    new_chunks.append((chunk_id, chunk))
+            del chunks
+            if extra_metadata and skipped_ids:
+                # Unchanged chunks are not re-embedded but take the new upload time and tags
+                for start in range(0, len(skipped_ids), self.write_batch_size):
+                    batch = store.vectors.list(ids=skipped_ids[start:start + self.write_batch_size],
+                                               include=["metadatas"])
+                    store.vectors.update_metadata(batch.ids, [self._restamp(meta, extra_metadata)
+                                                              for meta in batch.metadatas])
+                restamped = True
+
+            progress("embedding", chunks_total=chunks_total, chunks_skipped=chunks_skipped,
+                     tokens_total=tokens_total, tokens_embedded=tokens_embedded)
+            chunks_added += self._embed_and_write(store, new_chunks, progress, chunks_added)
+
+        # Remove chunks that disappeared only after their replacements are written
+        stale_ids = [chunk_id for name, ids in existing.items()
+                     for chunk_id in ids - current.get(name, set())]
+        if stale_ids:
+            progress("writing")
+        for start in range(0, len(stale_ids), self.write_batch_size):
+            store.vectors.delete(stale_ids[start:start + self.write_batch_size])
+        store.keyword_index.remove(stale_ids)
+        store.keyword_index.save()
+        if stale_ids:
+            progress("writing", chunks_removed=len(stale_ids))
+
+        # New tags and upload times change what tag and date filters match
+        if chunks_added or stale_ids or restamped:
+            self._knowledge_base_changed(store.embedding_model)
+
+        print(f"Ingested {chunks_total} chunks / {tokens_total} tokens into {store.embedding_model} "
+              f"({chunks_added} chunks / {tokens_embedded} tokens embedded, "
+              f"{store.chunking.chunk_tokens}-token chunks)")
+        return {"chunks_total": chunks_total, "chunks_added": chunks_added,
+                "chunks_skipped": chunks_skipped, "chunks_removed": len(stale_ids),
+                "tokens_total": tokens_total, "tokens_embedded": tokens_embedded}
+
+    @staticmethod
+    def _restamp(metadata: Optional[Dict], extra_metadata: Dict[str, object]) -> Dict[str, object]:
+        """Metadata update giving a stored chunk the tags of a new ingestion.
+
+        Backends merge metadata updates, so tags the chunk no longer has are set
+        to False, which tag filters (`{tag_key: True}`) treat as absent.
+        """
+        dropped = {key: False for key, value in (metadata or {}).items()
+                   if key.startswith(TAG_PREFIX) and value and key not in extra_metadata}
+        return {**extra_metadata, **dropped}
+
+    def _embed_and_write(self, store: ModelStore, new_chunks: List[Tuple[str, Document]],
+                         progress: Callable[..., None], embedded_before: int = 0) -> int:
+        """Embeds (chunk_id, chunk) pairs and writes them as each batch completes.
+
+        Reports "writing" around each vector store write and "embedding" with the
+        running chunks_embedded count (offset by `embedded_before`) otherwise.
+        """
+        ids = [chunk_id for chunk_id, _ in new_chunks]
+        texts = [chunk.page_content for _, chunk in new_chunks]
+        metadatas = [chunk.metadata for _, chunk in new_chunks]
+
+        pending_ids, pending_texts, pending_metas, pending_vectors = [], [], [], []
+        for start, vectors in self._embed_batches(store.embeddings, texts):
+            end = start + len(vectors)
+            pending_ids.extend(ids[start:end])
+            pending_texts.extend(texts[start:end])
+            pending_metas.extend(metadatas[start:end])
+            pending_vectors.extend(vectors)
+            if len(pending_ids) >= self.write_batch_size:
+                progress("writing")
+                self._write_batch(store, pending_ids, pending_texts, pending_metas, pending_vectors)
+                pending_ids, pending_texts, pending_metas, pending_vectors = [], [], [], []
+            progress("embedding", chunks_embedded=embedded_before + end)
+
+        if pending_ids:
+            progress("writing")
+            self._write_batch(store, pending_ids, pending_texts, pending_metas, pending_vectors)
+        return len(ids)
+
+    def _embed_batches(self, embeddings: Embeddings, texts: List[str]) -> Iterator[Tuple[int, List[List[float]]]]:
+        """Embeds texts in batches, yielding (start_index, vectors) in input order.
+
+        At most `embedding_concurrency` batches are in flight per call, and the shared
+        executor caps the total across concurrent ingestions.
+        """
+        in_flight = deque()
+        for start in range(0, len(texts), self.embedding_batch_size):
+            batch = texts[start:start + self.embedding_batch_size]
+            in_flight.append((start, self._embed_executor.submit(embeddings.embed_documents, batch)))
+            if len(in_flight) >= self.embedding_concurrency:
+                first, future = in_flight.popleft()
+                yield first, future.result()
+        while in_flight:
+            first, future = in_flight.popleft()
+            yield first, future.result()
+
+    def _write_batch(self, store: ModelStore, ids: List[str], texts: List[str], metadatas: List[dict],
+                     vectors: List[List[float]]):
+        """Writes pre-computed embeddings to the vector store in write_batch_size slices."""
+        for start in range(0, len(ids), self.write_batch_size):
+            end = start + self.write_batch_size
+            store.vectors.add(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+            store.keyword_index.add(ids[start:end], texts[start:end])
 
     def clear_database(self, embedding_model: Optional[str] = None):
-        """Clears the vector database. If embedding_model is provided, clears only that model's data."""
+        """Clears the vector database. If embedding_model is provided, clears only that model's data.
+
+        Stores are emptied through their vector backend instead of deleting their files,
+        which would break the client Chroma keeps cached for each path. The embedding
+        cache is kept.
+        """
         if embedding_model:
-            self._update_embedding_model(embedding_model)
-            if os.path.exists(self.vectorstore._persist_directory):
-                import shutil
-                shutil.rmtree(self.vectorstore._persist_directory)
-                # Force re-init after deletion
-                self.embedding_model_name = None
-                self._update_embedding_model(embedding_model)
+            with self._lease(embedding_model) as store:
+                self._clear_store(store)
         else:
-            # Clear everything
-            if os.path.exists(self.persist_dir):
-                import shutil
-                shutil.rmtree(self.persist_dir)
-                os.makedirs(self.persist_dir, exist_ok=True)
-                # Re-initialize current model
-                current_model = self.embedding_model_name
-                self.embedding_model_name = None
-                self._update_embedding_model(current_model)
-
-    def list_documents(self, embedding_model: Optional[str] = None) -> List[str]:
-        """Returns a list of unique document sources in the vector store."""
-        try:
-            if embedding_model:
-                self._update_embedding_model(embedding_model)
-            
-            # Get all metadata from the collection
-            results = self.vectorstore.get()
-            if not results or 'metadatas' not in results:
-                return []
-            
-            # Extract unique 'source' values
-            sources = set()
-            for meta in results['metadatas']:
-                if meta and 'source' in meta:
-                    sources.add(os.path.basename(meta['source']))
-            
-            return sorted(list(sources))
-        except Exception as e:
-            print(f"Error listing documents: {e}")
-            return []
+            # Open stores are cleared through their handles; the others on disk, plus a
+            # legacy store at the root, through a temporary client
+            open_dirs = {}
+            for model in self.stores.open_models():
+                open_dirs[os.path.abspath(self.store(model).persist_dir)] = model
+            store_dirs = [self.persist_dir] + [os.path.join(self.persist_dir, entry)
+                                               for entry in os.listdir(self.persist_dir)]
+            for store_dir in store_dirs:
+                model = open_dirs.get(os.path.abspath(store_dir))
+                if model is not None:
+                    with self._lease(model) as store:
+                        self._clear_store(store)
+                    continue
+                if not (ChromaBackend.exists(store_dir) or FlatIndex.exists(store_dir)
+                        or QuantizedIndex.exists(store_dir)):
+                    continue
+                FlatIndex.remove(store_dir)
+                QuantizedIndex.remove(store_dir)
+                if ChromaBackend.exists(store_dir):
+                    chroma = ChromaBackend(store_dir)
+                    chroma.reset()
+                    chroma.close()
+                if os.path.exists(os.path.join(store_dir, DocumentRegistry.FILENAME)):
+                    registry = DocumentRegistry(store_dir)
+                    registry.clear()
+                    registry.close()
+                for filename in (BM25Index.FILENAME, BM25Index.LOG_FILENAME):
+                    keyword_index_path = os.path.join(store_dir, filename)
+                    if os.path.exists(keyword_index_path):
+                        os.remove(keyword_index_path)
+        self._knowledge_base_changed(embedding_model)
 
-    def delete_document(self, filename: str, embedding_model: Optional[str] = None) -> bool:
-        """Deletes all chunks associated with a specific filename."""
-        try:
-            if embedding_model:
-                self._update_embedding_model(embedding_model)
-
-            results = self.vectorstore.get()
-            if not results or 'metadatas' not in results:
-                return False
-            
-            ids_to_delete = []
-            for i, meta in enumerate(results['metadatas']):
-                if meta and 'source' in meta:
-                    if os.path.basename(meta['source']) == filename:
-                        ids_to_delete.append(results['ids'][i])
-            
-            if ids_to_delete:
-                self.vectorstore.delete(ids=ids_to_delete)
-                print(f"Deleted {len(ids_to_delete)} chunks from {filename}")
-                return True
-            
-            return False
-        except Exception as e:
-            print(f"Error deleting document {filename}: {e}")
-            return False
-
-    async def ask(self, question: str, model_name: Optional[str] = None, temperature: float = 0.3, embedding_model: Optional[str] = None) -> str:
-        """Asks a question using the RAG chain."""
-        if embedding_model:
-            self._update_embedding_model(embedding_model)
+    @staticmethod
+    def _clear_store(store: ModelStore):
+        store.vectors.reset()
+        store.documents.clear()
+        store.keyword_index.clear()
+        store.keyword_index.save()
 
-        # Use provided model or fallback to default
-        target_model = model_name or self.model_name
-        
-        # Create a specific LLM instance for this request
-        llm = ChatOllama(
-            model=target_model,
-            base_url=self.ollama_base_url,
-            temperature=temperature,
-        )
+    def _knowledge_base_changed(self, embedding_model: Optional[str]):
+        """Invalidates cached answers for an embedding model's knowledge base (all if None)."""
+        if self.answer_cache is not None:
+            # Fan-out answers draw on every configured store
+            self.answer_cache.invalidate(None if self._fanout_models() else embedding_model)
+
+    def list_documents(self, embedding_model: Optional[str] = None, offset: int = 0,
+                       limit: Optional[int] = None) -> Dict[str, object]:
+        """Returns a page of the document registry ({"documents": [...], "total": n}).
+
+        Reads only the registry, never the chunks in the vector store.
+        """
+        with self._lease(embedding_model) as store:
+            return {"documents": store.documents.list(offset=offset, limit=limit),
+                    "total": store.documents.count()}
+
+    def delete_document(self, filename: str, embedding_model: Optional[str] = None) -> Dict[str, object]:
+        """Deletes all chunks of a document, returning {"found": bool, "chunks_deleted": n}.
+
+        `filename` is the registered source name: the basename of an uploaded file,
+        or the path under the ingested directory (e.g. "docs/README.txt"). Chunk
+        IDs are looked up through the backend's metadata filter (`where` on the
+        source name, or the registered path for chunks that predate source_name),
+        so the cost depends on the document, not on the size of the store.
+        """
+        filename = source_name(filename)
+        with self._lease(embedding_model) as store:
+            return self._delete_document(store, filename)
+
+    def _delete_document(self, store: ModelStore, filename: str) -> Dict[str, object]:
+        record = store.documents.get(filename)
+
+        clauses = [{"source_name": filename}]
+        if record:
+            clauses.append({"source": record["source"]})
+        where = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        ids = store.vectors.list(where=where, include=[]).ids
+
+        for start in range(0, len(ids), self.write_batch_size):
+            store.vectors.delete(ids[start:start + self.write_batch_size])
+        if ids:
+            store.keyword_index.remove(ids)
+            store.keyword_index.save()
+        if record:
+            store.documents.delete(filename)
+        if ids or record:
+            self._knowledge_base_changed(store.embedding_model)
+            print(f"Deleted {len(ids)} chunks from {filename}")
+        return {"found": bool(ids or record), "chunks_deleted": len(ids)}
+
+    def migrate_embeddings(self, source_model: str, target_model: str,
+                           progress: Optional[Callable[..., None]] = None,
+                           before_batch: Optional[Callable[[], None]] = None,
+                           batch_size: int = config.MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+        """Copies a knowledge base to another embedding model, re-embedding the stored chunks.
+
+        Chunk texts, metadata and IDs are read from the source store, so nothing
+        is parsed or split again (documents keep the source model's chunking).
+        Each document is registered in the target once all its chunks are
+        written, which is the checkpoint: documents already registered there
+        are skipped, and so are the chunks a previous run wrote of a document it
+        did not finish. `before_batch()` runs before every embedding request, for
+        throttling and cancellation. `progress(stage, **counts)` reports "migrating".
+        """
+        if source_model == target_model:
+            raise ValueError("Source and target embedding models must differ")
+        progress = progress or (lambda stage, **counts: None)
+        before_batch = before_batch or (lambda: None)
+        batch_size = max(1, batch_size)
+        counts = {"documents_total": 0, "documents_migrated": 0, "documents_skipped": 0,
+                  "chunks_total": 0, "chunks_migrated": 0, "chunks_skipped": 0}
+
+        with self._lease(source_model) as source, self._lease(target_model) as target:
+            records = source.documents.list()
+            counts["documents_total"] = len(records)
+            counts["chunks_total"] = sum(record["chunk_count"] for record in records)
+            progress("migrating", **counts)
 
-        template = """Usa el siguiente contexto para responder a la pregunta del usuario.
+            for record in records:
+                name = record["source_name"]
+                if target.documents.get(name) is not None:
+                    # Migrated by an earlier run, or ingested into the target directly
+                    counts["documents_skipped"] += 1
+                    counts["chunks_skipped"] += record["chunk_count"]
+                    progress("migrating", **counts)
+                    continue
+
+                # Chunks written before source_name existed are matched by their full path
+                chunks = source.vectors.list(
+                    where={"$or": [{"source_name": name}, {"source": record["source"]}]},
+                    include=["texts", "metadatas"],
+                )
+                present = set(target.vectors.list(ids=chunks.ids, include=[]).ids)
+                pending = [(chunk_id, text or "", meta) for chunk_id, text, meta
+                           in zip(chunks.ids, chunks.texts, chunks.metadatas)
+                           if chunk_id not in present]
+                counts["chunks_skipped"] += len(present)
+                for start in range(0, len(pending), batch_size):
+                    before_batch()
+                    batch = pending[start:start + batch_size]
+                    texts = [text for _, text, _ in batch]
+                    # Through the shared executor, so ingestion and migration together
+                    # stay within embedding_concurrency requests to Ollama
+                    vectors = self._embed_executor.submit(target.embeddings.embed_documents, texts).result()
+                    self._write_batch(target, [chunk_id for chunk_id, _, _ in batch], texts,
+                                      [meta for _, _, meta in batch], vectors)
+                    counts["chunks_migrated"] += len(batch)
+                    progress("migrating", **counts)
+
+                target.keyword_index.save()
+                target.documents.upsert(name, source=record["source"], content_hash=record["content_hash"],
+                                        size=record["bytes"], chunk_count=len(chunks.ids),
+                                        tags=record["tags"], ingested_at=record["ingested_at"])
+                counts["documents_migrated"] += 1
+                progress("migrating", **counts)
+
+        if counts["documents_migrated"]:
+            self._knowledge_base_changed(target_model)
+        print(f"Migrated {counts['documents_migrated']} documents / {counts['chunks_migrated']} chunks "
+              f"from {source_model} to {target_model} ({counts['documents_skipped']} documents skipped)")
+        return counts
+
+    RAG_TEMPLATE = """Usa el siguiente contexto para responder a la pregunta del usuario.
 Si la respuesta no se encuentra en el contexto, di que no tienes esa información. No inventes nada.
 Mantén la respuesta concisa y profesional.
 
@@ -224,61 +750,312 @@ Contexto:
 
 Pregunta: {question}
 Respuesta:"""
-        
-        prompt = ChatPromptTemplate.from_template(template)
 
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
-
-        chain = (
-            {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
-        return await chain.ainvoke(question)
-
-    async def ask_stream(self, question: str, model_name: Optional[str] = None, temperature: float = 0.3, embedding_model: Optional[str] = None):
-        """Asks a question using the RAG chain and streams the response."""
-        if embedding_model:
-            self._update_embedding_model(embedding_model)
+    # Tokens kept free for chat-template markup, plus slack for the token estimate
+    PROMPT_MARGIN_TOKENS = 64
+    TOKEN_ESTIMATE_SLACK = 0.9
+    MIN_CONTEXT_TOKENS = 256
 
+    def _rag_chain(self, model_name: Optional[str], temperature: float,
+                   max_tokens: Optional[int] = None):
+        """Prompt | LLM chain taking {"context", "question"}."""
         # Use provided model or fallback to default
-        target_model = model_name or self.model_name
-        
-        # Create a specific LLM instance for this request
+        model = model_name or self.model_name
         llm = ChatOllama(
-            model=target_model,
+            model=model,
             base_url=self.ollama_base_url,
             temperature=temperature,
+            num_ctx=model_num_ctx(model),
+            num_predict=max_tokens,
+            keep_alive=config.MODEL_KEEP_ALIVE,
         )
+        return ChatPromptTemplate.from_template(self.RAG_TEMPLATE) | llm | StrOutputParser()
 
-        template = """Usa el siguiente contexto para responder a la pregunta del usuario.
-Si la respuesta no se encuentra en el contexto, di que no tienes esa información. No inventes nada.
-Mantén la respuesta concisa y profesional.
+    def answer_tokens(self, question: str, model_name: Optional[str] = None,
+                      max_tokens: Optional[int] = None) -> int:
+        """Tokens reserved for the answer: max_tokens (or RAG_ANSWER_TOKENS), clamped
+        so the window still holds the prompt and MIN_CONTEXT_TOKENS of context."""
+        prompt_tokens = count_tokens(self.RAG_TEMPLATE.format(context="", question=question))
+        room = (model_num_ctx(model_name or self.model_name) - prompt_tokens - self.PROMPT_MARGIN_TOKENS
+                - math.ceil(self.MIN_CONTEXT_TOKENS / self.TOKEN_ESTIMATE_SLACK))
+        return max(1, min(max_tokens or config.RAG_ANSWER_TOKENS, room))
 
-Contexto:
-{context}
+    def context_budget(self, question: str, model_name: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> int:
+        """Tokens available for retrieved chunks in the model's context window.
 
-Pregunta: {question}
-Respuesta:"""
-        
-        prompt = ChatPromptTemplate.from_template(template)
+        The window must also hold the prompt template, the question and the
+        answer; never less than MIN_CONTEXT_TOKENS.
+        """
+        prompt_tokens = count_tokens(self.RAG_TEMPLATE.format(context="", question=question))
+        free = (model_num_ctx(model_name or self.model_name) - self.answer_tokens(question, model_name, max_tokens)
+                - prompt_tokens - self.PROMPT_MARGIN_TOKENS)
+        return max(self.MIN_CONTEXT_TOKENS, int(free * self.TOKEN_ESTIMATE_SLACK))
 
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
+    def _retrieve_context(self, store: ModelStore, question: str, question_vector: List[float],
+                          options: Optional[RetrievalOptions] = None, budget: Optional[int] = None) -> PackedContext:
+        if budget is None:
+            budget = self.context_budget(question)
+        scored = self._search(store, question, question_vector, options)
+        docs, scores = [doc for doc, _ in scored], [score for _, score in scored]
+        if config.CONTEXT_COMPRESSION_ENABLED and docs:
+            docs, scores = self._compress(store, question, question_vector, docs, scores,
+                                          min(budget, config.CONTEXT_COMPRESSION_TOKENS or budget))
+        context = pack_context(docs, scores, budget)
+        print(f"RAG context: {context.tokens}/{budget} tokens from {len(context.docs)} of {len(scored)} chunks"
+              + (" (truncated)" if context.truncated else ""))
+        return context
 
-        chain = (
-            {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
-        async for chunk in chain.astream(question):
+    def _compress(self, store: ModelStore, question: str, question_vector: List[float], docs: List[Document],
+                  scores: List[float], target_tokens: int) -> Tuple[List[Document], List[float]]:
+        """Extractive compression of retrieved chunks, scoring sentences with the request's
+        embedding model or CONTEXT_COMPRESSION_MODEL."""
+        model = config.CONTEXT_COMPRESSION_MODEL
+        if not model or model == store.embedding_model:
+            return compress_documents(docs, scores, question_vector, self._sentence_embedder(store),
+                                      target_tokens, neighbors=config.CONTEXT_COMPRESSION_NEIGHBORS)
+        with self.stores.lease(model) as compression_store:
+            return compress_documents(docs, scores, self._embed_query(compression_store, question),
+                                      self._sentence_embedder(compression_store), target_tokens,
+                                      neighbors=config.CONTEXT_COMPRESSION_NEIGHBORS)
+
+    def _sentence_embedder(self, store: ModelStore) -> Callable[[List[str]], List[List[float]]]:
+        """Embeds sentences for compression with the store's model, bypassing the on-disk
+        embedding cache (they are one-off texts) and within embedding_concurrency."""
+        embeddings = store.embeddings
+        if isinstance(embeddings, CachedEmbeddings):
+            embeddings = embeddings.embeddings
+        return lambda texts: self._embed_executor.submit(embeddings.embed_documents, texts).result()
+
+    def build_context(self, question: str, model_name: Optional[str] = None, max_tokens: Optional[int] = None,
+                      options: Optional[RetrievalOptions] = None,
+                      embedding_model: Optional[str] = None) -> PackedContext:
+        """The context a question would get with a chat model and answer length."""
+        with self._lease(embedding_model) as store:
+            return self._retrieve_context(store, question, self._embed_query(store, question), options,
+                                          self.context_budget(question, model_name, max_tokens))
+
+    def _vector_search(self, store: ModelStore, vector: List[float], k: int, with_embeddings: bool = False,
+                       where: Optional[Dict] = None) -> Tuple[List[Document], Dict[str, List[float]]]:
+        """Nearest chunks to a vector (with their IDs set) and, optionally, their embeddings.
+
+        `where` is applied by the vector backend during the search, not to its results.
+        """
+        include = ["texts", "metadatas"] + (["embeddings"] if with_embeddings else [])
+        result = store.vectors.search(vector, k, where=where, include=include)
+        docs = [Document(id=chunk_id, page_content=text or "", metadata=meta or {})
+                for chunk_id, text, meta in zip(result.ids, result.texts, result.metadatas)]
+        embeddings = dict(zip(result.ids, result.embeddings)) if with_embeddings else {}
+        return docs, embeddings
+
+    # Filters matching more chunks than this rank keyword hits first and filter them after
+    KEYWORD_FILTER_MAX_IDS = 20000
+
+    def _keyword_search(self, store: ModelStore, query: str, k: int, where: Optional[Dict] = None) -> List[str]:
+        """Chunk IDs ranked by BM25, restricted to chunks matching `where`."""
+        if where is None:
+            return [chunk_id for chunk_id, _ in store.keyword_index.search(query, k)]
+        matching = store.vectors.list(where=where, include=[], limit=self.KEYWORD_FILTER_MAX_IDS + 1).ids
+        if len(matching) <= self.KEYWORD_FILTER_MAX_IDS:
+            return [chunk_id for chunk_id, _ in store.keyword_index.search(query, k, allowed_ids=matching)]
+        hits = [chunk_id for chunk_id, _ in store.keyword_index.search(query, 10 * k)]
+        allowed = set(store.vectors.list(ids=hits, where=where, include=[]).ids)
+        return [chunk_id for chunk_id in hits if chunk_id in allowed][:k]
+
+    def _search(self, store: ModelStore, query: str, vector: List[float],
+                options: Optional[RetrievalOptions] = None) -> List[Tuple[Document, float]]:
+        """(chunk, relevance) pairs from the store, fused with FANOUT_EMBEDDING_MODELS' when set."""
+        options = options or RetrievalOptions()
+        fanout = self._fanout_models(store)
+        if fanout:
+            return self._fanout_search(store, query, vector, options, fanout)
+        return self._scored_search(store, query, vector, options)
+
+    def _scored_search(self, store: ModelStore, query: str, vector: List[float],
+                       options: Optional[RetrievalOptions] = None) -> List[Tuple[Document, float]]:
+        """Retrieves (chunk, relevance) pairs by vector similarity, fused with BM25
+        keyword hits in hybrid mode.
+
+        Both searches return `fetch_k` candidates that are merged by reciprocal
+        rank fusion, so exact identifiers missed by the embedding still surface.
+        With MMR the final k are picked from all candidates, trading relevance
+        (cosine similarity, or the normalized fusion score in hybrid mode) against
+        similarity to the chunks already picked, so near-duplicates are skipped.
+        Metadata filters in `options` restrict both searches to matching chunks.
+        """
+        options = options or RetrievalOptions()
+        k = options.k or config.RETRIEVAL_K
+        fetch_k = max(k, options.fetch_k or config.RETRIEVAL_CANDIDATES)
+        use_mmr = config.MMR_ENABLED if options.mmr is None else options.mmr
+        mmr_lambda = config.MMR_LAMBDA if options.mmr_lambda is None else options.mmr_lambda
+
+        where = options.where()
+        hybrid = config.RETRIEVAL_MODE == "hybrid"
+
+        candidates, embeddings = self._vector_search(store, vector, fetch_k, with_embeddings=use_mmr or not hybrid,
+                                                     where=where)
+        if hybrid:
+            keyword_ids = self._keyword_search(store, query, fetch_k, where)
+            scores = rrf_scores([[doc.id for doc in candidates], keyword_ids], k=config.RRF_K)
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            if not use_mmr:
+                ranked = ranked[:k]
+            docs = {doc.id: doc for doc in candidates}
+            missing = [chunk_id for chunk_id in ranked if chunk_id not in docs]
+            if missing:
+                include = ["texts", "metadatas"] + (["embeddings"] if use_mmr else [])
+                found = store.vectors.list(ids=missing, include=include)
+                for i, chunk_id in enumerate(found.ids):
+                    docs[chunk_id] = Document(id=chunk_id, page_content=found.texts[i] or "",
+                                              metadata=found.metadatas[i] or {})
+                    if use_mmr:
+                        embeddings[chunk_id] = found.embeddings[i]
+            candidates = [docs[chunk_id] for chunk_id in ranked if chunk_id in docs]
+            relevance = np.array([scores[doc.id] for doc in candidates], dtype=np.float32)
+            relevance /= relevance.max() if len(relevance) else 1.0
+        else:
+            relevance = cosine_similarities(vector, [embeddings[doc.id] for doc in candidates])
+
+        if not use_mmr or len(candidates) <= k:
+            return [(doc, float(score)) for doc, score in zip(candidates[:k], relevance)]
+        picked = mmr_select(relevance, np.array([embeddings[doc.id] for doc in candidates]),
+                            k, lambda_mult=mmr_lambda)
+        return [(candidates[i], float(relevance[i])) for i in picked]
+
+    @staticmethod
+    def _fanout_models(store: Optional[ModelStore] = None) -> List[str]:
+        """Embedding models searched per question: the request's one first, then
+        FANOUT_EMBEDDING_MODELS. Empty when fan-out is not configured."""
+        configured = [model.strip() for model in config.FANOUT_EMBEDDING_MODELS.split(",") if model.strip()]
+        if not configured:
+            return []
+        return list(dict.fromkeys(([store.embedding_model] if store else []) + configured))
+
+    def _fanout_search(self, store: ModelStore, query: str, vector: List[float], options: RetrievalOptions,
+                       models: Sequence[str]) -> List[Tuple[Document, float]]:
+        """Searches several embedding models' stores concurrently and fuses the results.
+
+        Each store ranks its own chunks (with its own query embedding, hybrid
+        search and MMR); the rankings are merged by reciprocal rank fusion. Chunks
+        with the same text in several stores count once, keeping the copy of the
+        first model. A store that is empty or fails to answer is skipped.
+        """
+        def search(model: str) -> List[Tuple[Document, float]]:
+            if model == store.embedding_model:
+                return self._scored_search(store, query, vector, options)
+            with self.stores.lease(model) as other:
+                if not other.vectors.count():
+                    return []
+                return self._scored_search(other, query, self._embed_query(other, query), options)
+
+        futures = [(model, self._retrieval_executor.submit(search, model)) for model in models]
+        docs: Dict[str, Document] = {}
+        rankings = []
+        for model, future in futures:
+            try:
+                ranking = future.result()
+            except Exception as e:
+                print(f"Warning: fan-out retrieval from {model} failed: {e}")
+                continue
+            keys = []
+            for doc, _ in ranking:
+                key = hashlib.sha256(" ".join(doc.page_content.split()).encode("utf-8")).hexdigest()
+                docs.setdefault(key, doc)
+                if key not in keys:
+                    keys.append(key)
+            rankings.append(keys)
+
+        scores = rrf_scores(rankings, k=config.RRF_K)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:options.k or config.RETRIEVAL_K]
+        top = scores[ranked[0]] if ranked else 1.0
+        return [(docs[key], scores[key] / top) for key in ranked]
+
+    async def ask(self, question: str, model_name: Optional[str] = None, temperature: float = 0.3, embedding_model: Optional[str] = None,
+                  retrieval: Optional[RetrievalOptions] = None, max_tokens: Optional[int] = None) -> str:
+        """Asks a question using the RAG chain, answering from the semantic cache when possible."""
+        model = model_name or self.model_name
+        embedding_model = embedding_model or self.default_embedding_model
+
+        retrieval = retrieval or RetrievalOptions()
+        if max_tokens:
+            # An answer longer than the window allows would push the prompt out of it
+            max_tokens = self.answer_tokens(question, model, max_tokens)
+        # The answer length also sizes the context, so it is part of the cache variant
+        variant = (retrieval, max_tokens)
+        with self.stores.lease(embedding_model) as store:
+            vector = await asyncio.to_thread(self._embed_query, store, question)
+            cache = self.answer_cache
+            if cache is not None:
+                version = cache.version(embedding_model)
+                cached = cache.lookup(model, temperature, embedding_model, vector, variant=variant)
+                if cached is not None:
+                    return cached
+
+            budget = self.context_budget(question, model, max_tokens)
+            context = await asyncio.to_thread(self._retrieve_context, store, question, vector, retrieval, budget)
+        answer = await self._rag_chain(model, temperature, max_tokens).ainvoke(
+            {"context": context.text, "question": question})
+        if cache is not None:
+            cache.store(model, temperature, embedding_model, vector, answer, version, variant=variant)
+        return answer
+
+    async def ask_stream(self, question: str, model_name: Optional[str] = None, temperature: float = 0.3, embedding_model: Optional[str] = None,
+                         retrieval: Optional[RetrievalOptions] = None, max_tokens: Optional[int] = None):
+        """Asks a question using the RAG chain and streams the response.
+
+        Cached answers are streamed back word by word; fresh ones are cached once
+        the generation completes.
+        """
+        model = model_name or self.model_name
+        embedding_model = embedding_model or self.default_embedding_model
+
+        retrieval = retrieval or RetrievalOptions()
+        if max_tokens:
+            # An answer longer than the window allows would push the prompt out of it
+            max_tokens = self.answer_tokens(question, model, max_tokens)
+        # The answer length also sizes the context, so it is part of the cache variant
+        variant = (retrieval, max_tokens)
+        # The store is held for retrieval only, not while the answer streams
+        with self.stores.lease(embedding_model) as store:
+            vector = await asyncio.to_thread(self._embed_query, store, question)
+            cache = self.answer_cache
+            cached = None
+            if cache is not None:
+                version = cache.version(embedding_model)
+                cached = cache.lookup(model, temperature, embedding_model, vector, variant=variant)
+            if cached is None:
+                budget = self.context_budget(question, model, max_tokens)
+                context = await asyncio.to_thread(self._retrieve_context, store, question, vector, retrieval,
+                                                  budget)
+        if cached is not None:
+            for piece in re.findall(r"\S+\s*|\s+", cached):
+                yield piece
+            return
+
+        pieces = []
+        async for chunk in self._rag_chain(model, temperature, max_tokens).astream(
+                {"context": context.text, "question": question}):
+            pieces.append(chunk)
             yield chunk
+        if cache is not None:
+            cache.store(model, temperature, embedding_model, vector, "".join(pieces), version,
+                        variant=variant)
+
+    def embed_query(self, query: str, embedding_model: Optional[str] = None) -> List[float]:
+        """Embeds a question, reusing recent embeddings of the same normalized question."""
+        with self._lease(embedding_model) as store:
+            return self._embed_query(store, query)
+
+    def _embed_query(self, store: ModelStore, query: str) -> List[float]:
+        if self.query_cache is None:
+            return store.embeddings.embed_query(query)
+        return self.query_cache.get_or_compute(store.embedding_model, query, store.embeddings.embed_query)
 
-    def get_related_docs(self, query: str, k: int = 3) -> List[Document]:
+    def get_related_docs(self, query: str, k: int = 3, options: Optional[RetrievalOptions] = None,
+                         embedding_model: Optional[str] = None) -> List[Document]:
         """Returns documents similar to the query."""
-        return self.vectorstore.similarity_search(query, k=k)
+        options = options or RetrievalOptions()
+        if options.k is None:
+            options = replace(options, k=k)
+        with self._lease(embedding_model) as store:
+            return [doc for doc, _ in self._search(store, query, self._embed_query(store, query), options)]
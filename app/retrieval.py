@@ -0,0 +1,156 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+TAG_PREFIX = "tag:"
+
+
+@dataclass(frozen=True)
+class RetrievalOptions:
+    """Per-request retrieval settings; None falls back to the configured default.
+
+    `sources` (document source names), `tags` (any of) and the `uploaded_after` /
+    `uploaded_before` epoch bounds restrict the search to matching chunks.
+    """
+    k: Optional[int] = None
+    fetch_k: Optional[int] = None
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    sources: Optional[Tuple[str, ...]] = None
+    tags: Optional[Tuple[str, ...]] = None
+    uploaded_after: Optional[float] = None
+    uploaded_before: Optional[float] = None
+
+    def where(self) -> Optional[Dict[str, Any]]:
+        """Chroma `where` clause for the metadata filters, or None without filters."""
+        clauses: List[Dict[str, Any]] = []
+        if self.sources:
+            clauses.append({"source_name": {"$in": list(self.sources)}})
+        if self.tags:
+            tag_clauses = [{tag_key(tag): True} for tag in self.tags]
+            clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+        if self.uploaded_after is not None:
+            clauses.append({"uploaded_at": {"$gte": self.uploaded_after}})
+        if self.uploaded_before is not None:
+            clauses.append({"uploaded_at": {"$lte": self.uploaded_before}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+_WHERE_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Chroma `where` clause against one chunk's metadata.
+
+    Supports $and/$or and the $eq, $ne, $gt, $gte, $lt, $lte, $in and $nin
+    operators; a bare value means $eq. Like Chroma, a condition on a key the
+    chunk does not have never matches.
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                try:
+                    if not _WHERE_OPERATORS[operator](metadata[key], operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+def source_name(name: str) -> str:
+    """Normalizes a document's source name: an upload's basename, or its path under an
+    ingested directory with "/" separators."""
+    return os.path.normpath(name).replace(os.sep, "/").lstrip("/")
+
+
+def tag_key(tag: str) -> str:
+    """Metadata key marking a chunk with a tag (Chroma metadata values must be scalars)."""
+    return TAG_PREFIX + tag.strip().lower()
+
+
+def parse_tags(tags: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """Normalizes tags given as a list or comma-separated strings."""
+    parsed = []
+    for item in tags or ():
+        for tag in item.split(","):
+            tag = tag.strip().lower()
+            if tag and tag not in parsed:
+                parsed.append(tag)
+    return tuple(parsed)
+
+
+def rrf_scores(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> Dict[Hashable, float]:
+    """Reciprocal rank fusion scores: sum(1 / (k + rank)) over the rankings."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+def cosine_similarities(query: Sequence[float], vectors: np.ndarray) -> np.ndarray:
+    query = np.asarray(query, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+    return vectors @ query / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_select(relevance: Sequence[float], vectors: np.ndarray, k: int,
+               lambda_mult: float = 0.5) -> List[int]:
+    """Maximal marginal relevance: picks k candidate indices balancing relevance and novelty.
+
+    Each step takes the candidate maximizing
+    `lambda_mult * relevance - (1 - lambda_mult) * max similarity to those already picked`.
+    The candidate similarity matrix is one matrix product; each step then only
+    updates a running maximum, so selection is O(k * n) after it.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = unit @ unit.T
+
+    selected: List[int] = []
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        if selected:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
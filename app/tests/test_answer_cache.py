@@ -0,0 +1,66 @@
+"""
+Tests de la caché semántica de respuestas
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_similar_question_hits_within_threshold():
+    """Test de acierto por similitud y fallo por debajo del umbral o con otro modelo."""
+    cache = SemanticAnswerCache(threshold=0.95)
+    version = cache.version("nomic-embed-text")
+    cache.store("llama3.2", 0.3, "nomic-embed-text", [1.0, 0.0, 0.1], "Respuesta", version)
+
+    assert cache.lookup("llama3.2", 0.3, "nomic-embed-text", [0.98, 0.01, 0.1]) == "Respuesta"
+    assert cache.lookup("llama3.2", 0.3, "nomic-embed-text", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("mistral", 0.3, "nomic-embed-text", [1.0, 0.0, 0.1]) is None
+    assert cache.lookup("llama3.2", 0.3, "bge-m3", [1.0, 0.0, 0.1]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidate_drops_answers_and_rejects_stale_ones():
+    """Test de invalidación por versión de la base de conocimiento."""
+    cache = SemanticAnswerCache(threshold=0.9)
+    version = cache.version("nomic-embed-text")
+    cache.store("llama3.2", 0.3, "nomic-embed-text", [1.0, 0.0], "Vieja", version)
+    cache.store("llama3.2", 0.3, "bge-m3", [1.0, 0.0], "Otra", cache.version("bge-m3"))
+
+    cache.invalidate("nomic-embed-text")
+    assert cache.lookup("llama3.2", 0.3, "nomic-embed-text", [1.0, 0.0]) is None
+    assert cache.lookup("llama3.2", 0.3, "bge-m3", [1.0, 0.0]) == "Otra"
+
+    # Una respuesta generada antes de la ingesta no se guarda
+    cache.store("llama3.2", 0.3, "nomic-embed-text", [1.0, 0.0], "Vieja", version)
+    assert cache.lookup("llama3.2", 0.3, "nomic-embed-text", [1.0, 0.0]) is None
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+    # invalidate() sin modelo también cubre modelos que la caché aún no ha visto
+    version = cache.version("nuevo-embed")
+    cache.invalidate()
+    cache.store("llama3.2", 0.3, "nuevo-embed", [1.0, 0.0], "Vieja", version)
+    assert cache.lookup("llama3.2", 0.3, "nuevo-embed", [1.0, 0.0]) is None
+
+
+def test_lru_bound():
+    """Test del límite de entradas."""
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store("m", 0.3, "e", vector, f"r{i}", 0)
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("m", 0.3, "e", [1.0, 0.0]) is None
+    assert cache.lookup("m", 0.3, "e", [-1.0, 0.0]) == "r2"
+
+
+def test_evicted_variants_leave_no_empty_groups():
+    """Test de que las variantes desalojadas por LRU no dejan grupos vacíos."""
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    for i in range(10):
+        cache.store("m", 0.3, "e", [1.0, 0.0], f"r{i}", 0, variant=("fuente", i))
+    assert len(cache._groups) == 2
+    assert cache.lookup("m", 0.3, "e", [1.0, 0.0], variant=("fuente", 9)) == "r9"
@@ -118,6 +118,80 @@ def test_chat_endpoint_message_too_long(client):
     assert "too long" in response.json()["detail"].lower()
 
 
+def test_ingest_job_not_found(client):
+    """Test del endpoint de estado de ingesta con un job inexistente."""
+    response = client.get("/ingest/jobs/does-not-exist")
+    assert response.status_code == 404
+
+
+def test_ingest_job_events_stream(client, monkeypatch):
+    """Test del stream de progreso de ingesta en NDJSON y SSE."""
+    import json
+    from ingest_jobs import IngestJobManager
+
+    def fake_ingest(file_path, embedding_model=None, progress=None, content_hash=None, tags=None):
+        progress("embedding", chunks_total=2)
+        progress("writing")
+        progress("embedding", chunks_embedded=2)
+        return 2
+
+    manager = IngestJobManager(fake_ingest)
+    monkeypatch.setattr("api_server.ingest_jobs", manager)
+    monkeypatch.setattr("api_server.INGEST_EVENTS_MIN_INTERVAL", 0)
+    job = manager.submit("/tmp/doc.txt", "doc.txt")
+
+    response = client.get(f"/ingest/jobs/{job.id}/events")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    assert events[-1]["status"] == "done"
+    assert events[-1]["chunks_embedded"] == 2
+    assert events[-1]["chunks_remaining"] == 0
+
+    response = client.get(f"/ingest/jobs/{job.id}/events", params={"format": "sse"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("data: ")
+    assert client.get("/ingest/jobs/missing/events").status_code == 404
+    manager.shutdown()
+
+
+def test_ingest_rejects_oversized_upload(client, monkeypatch):
+    """Test de rechazo (413) de subidas mayores que el límite configurado."""
+    monkeypatch.setattr("api_server.MAX_UPLOAD_BYTES", 1024)
+    response = client.post("/ingest", files={"file": ("grande.txt", b"x" * 100_000, "text/plain")})
+    assert response.status_code == 413
+
+
+def test_ready_reports_warmup(client, monkeypatch):
+    """Test de /ready: 503 hasta que termina el calentamiento y 200 después."""
+    import asyncio
+    from warmup import Warmup
+
+    warmup = Warmup()
+    monkeypatch.setattr("api_server.warmup", warmup)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+    asyncio.run(warmup.run([("paso", lambda: None)]))
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["steps"]["paso"]["status"] == "done"
+
+
+def test_migration_endpoints(client):
+    """Test de validación de migraciones y del contador de peticiones de chat."""
+    import api_server
+
+    response = client.post("/migrations", json={"source_model": "a", "target_model": "a"})
+    assert response.status_code == 400
+    assert client.get("/migrations/does-not-exist").status_code == 404
+    assert client.delete("/migrations/does-not-exist").status_code == 404
+
+    client.post("/chat", json={"messages": [{"role": "user", "content": "x" * 20000}]})
+    assert api_server.chat_activity.active == 0
+
+
 def test_multiple_messages():
     """Test con múltiples mensajes en la conversación."""
     request = ChatRequest(
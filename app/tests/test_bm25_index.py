@@ -0,0 +1,102 @@
+"""
+Tests del índice invertido BM25
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from bm25_index import BM25Index, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_strips_accents():
+    """Test de tokenización: códigos completos y por partes, sin tildes."""
+    assert tokenize("Código ABC-123") == ["codigo", "abc-123", "abc", "123"]
+    assert "v2.1" in tokenize("versión v2.1")
+
+
+def test_search_ranks_exact_matches_first():
+    """Test de ranking BM25 y de búsqueda por código de producto."""
+    index = BM25Index()
+    index.add(["a", "b", "c"], [
+        "El router XR-500 se configura desde el panel web.",
+        "El router se reinicia manteniendo el botón pulsado.",
+        "La impresora no tiene panel web.",
+    ])
+    assert [chunk_id for chunk_id, _ in index.search("xr-500", k=3)] == ["a"]
+    ranked = index.search("router panel web", k=3)
+    assert ranked[0][0] == "a"
+    assert {chunk_id for chunk_id, _ in ranked} == {"a", "b", "c"}
+    assert index.search("inexistente") == []
+
+
+def test_remove_persist_and_compact(tmp_path):
+    """Test de borrado, persistencia en disco y compactación."""
+    index = BM25Index.open(str(tmp_path))
+    index.add([f"id{i}" for i in range(2000)], [f"documento numero {i} SKU-{i}" for i in range(2000)])
+    assert index.remove(["id1", "missing"]) == 1
+    assert index.search("sku-1") == []
+    index.save()
+
+    reopened = BM25Index.open(str(tmp_path))
+    assert len(reopened) == 1999
+    assert reopened.search("sku-7", k=1)[0][0] == "id7"
+
+    # Más de una cuarta parte de huecos compacta los arrays
+    reopened.remove([f"id{i}" for i in range(2, 1500)])
+    assert len(reopened._ids) == len(reopened) == 501
+    assert reopened.search("sku-1999", k=1)[0][0] == "id1999"
+    reopened.add(["nuevo"], ["SKU-9999"])
+    assert reopened.search("sku-9999", k=1)[0][0] == "nuevo"
+
+
+def test_save_appends_writes_to_log(tmp_path):
+    """Test de que guardar añade solo los cambios al log y que el log se reproduce al abrir."""
+    index = BM25Index.open(str(tmp_path))
+    index.add([f"id{i}" for i in range(500)], [f"manual del producto SKU-{i}" for i in range(500)])
+    index.save()
+    snapshot = tmp_path / BM25Index.FILENAME
+    log = tmp_path / BM25Index.LOG_FILENAME
+    snapshot_mtime = snapshot.stat().st_mtime_ns
+
+    index.remove(["id3"])
+    index.save()
+    index.add(["nuevo"], ["SKU-9999 recambio"])
+    index.save()
+    assert snapshot.stat().st_mtime_ns == snapshot_mtime
+    assert 0 < log.stat().st_size < snapshot.stat().st_size // 10
+
+    reopened = BM25Index.open(str(tmp_path))
+    assert len(reopened) == 500
+    assert reopened.search("sku-3") == []
+    assert reopened.search("sku-9999", k=1)[0][0] == "nuevo"
+
+    # Un log de más de la mitad de la instantánea se integra en una nueva
+    reopened.remove([f"id{i}" for i in range(100, 400)])
+    reopened.add([f"otro{i}" for i in range(300)], [f"texto nuevo {i}" for i in range(300)])
+    reopened.save()
+    reopened.add(["ultimo"], ["ultimo"])
+    reopened.save()
+    assert not log.exists() or log.stat().st_size < snapshot.stat().st_size // 2
+    assert len(BM25Index.open(str(tmp_path))) == len(reopened) == 501
+
+
+def test_truncated_log_is_replayed_up_to_last_record(tmp_path):
+    """Test de que un log cortado por un fallo se lee hasta el último registro completo."""
+    index = BM25Index.open(str(tmp_path))
+    index.add(["a", "b"], ["router XR-500", "impresora"])
+    index.save()
+    index.remove(["a"])
+    index.save()
+    index.add(["c"], ["escaner"])
+    index.save()
+    log = tmp_path / BM25Index.LOG_FILENAME
+    log.write_bytes(log.read_bytes()[:-3])
+
+    reopened = BM25Index.open(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.search("xr-500") == []
+    reopened.add(["d"], ["escaner"])
+    reopened.save()
+    assert not log.exists()
+    assert len(BM25Index.open(str(tmp_path))) == 2
@@ -0,0 +1,46 @@
+"""
+Tests del troceado por tokens
+"""
+import sys
+import os
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import chunking
+from chunking import ChunkingSettings, chunking_for_model, count_tokens, make_text_splitter
+
+
+def test_count_tokens_estimates_subwords():
+    """Test de la estimación de tokens (palabras largas cuentan como varias piezas)."""
+    assert count_tokens("") == 0
+    assert count_tokens("hola casa") == 2
+    assert count_tokens("internacionalizacion") == 5
+    assert count_tokens("fin.") == 2
+
+
+def test_presets_per_embedding_model(monkeypatch):
+    """Test de los presets por modelo de embedding y de los overrides."""
+    monkeypatch.setattr(chunking.config, "CHUNK_TOKENS", None)
+    monkeypatch.setattr(chunking.config, "CHUNK_OVERLAP_TOKENS", None)
+    monkeypatch.setattr(chunking.config, "CHUNKING_OVERRIDES", "")
+    assert chunking_for_model("all-minilm") == ChunkingSettings(200, 20)
+    assert chunking_for_model("qwen3-embedding:8b") == ChunkingSettings(512, 48)
+    assert chunking_for_model("desconocido") == chunking.DEFAULT_SETTINGS
+
+    monkeypatch.setattr(chunking.config, "CHUNKING_OVERRIDES", "all-minilm=128:0")
+    assert chunking_for_model("all-minilm:latest") == ChunkingSettings(128, 0)
+
+    monkeypatch.setattr(chunking.config, "CHUNK_OVERLAP_TOKENS", 0)
+    assert chunking_for_model("nomic-embed-text").overlap_tokens == 0
+
+
+def test_splitter_respects_token_budget():
+    """Test de que ningún chunk supera el presupuesto de tokens."""
+    settings = ChunkingSettings(chunk_tokens=50, overlap_tokens=5)
+    text = " ".join(f"palabra{i}" for i in range(500))
+    chunks = make_text_splitter(settings).split_documents([Document(page_content=text)])
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk.page_content) <= 50 for chunk in chunks)
@@ -0,0 +1,53 @@
+"""
+Tests de la compresión extractiva del contexto
+"""
+import sys
+import os
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from chunking import count_tokens
+from context_compression import GAP, compress_documents
+
+VOCABULARY = ["vlan", "router", "impresora", "tóner", "vacaciones", "nómina"]
+
+
+def embed(texts):
+    """Bolsa de palabras sobre un vocabulario fijo."""
+    return [[float(text.lower().count(word)) + 0.01 for word in VOCABULARY] for text in texts]
+
+
+def test_keeps_relevant_sentences_with_neighbours():
+    """Test de que se conservan las frases relevantes, sus vecinas y el orden original."""
+    docs = [
+        Document(page_content="Intro general. La impresora usa tóner negro. Cambia el tóner cada mes. "
+                              "Las vacaciones se piden en enero. La nómina llega el día 28."),
+        Document(page_content="El router usa la VLAN 10. Nada más."),
+    ]
+    query = embed(["¿qué tóner usa la impresora?"])[0]
+    target = count_tokens("La impresora usa tóner negro. Cambia el tóner cada mes. Intro general.")
+    compressed, scores = compress_documents(docs, [0.9, 0.4], query, embed, target, neighbors=1)
+
+    assert len(compressed) == 1
+    assert scores == [0.9]
+    text = compressed[0].page_content
+    assert text.startswith("Intro general. La impresora usa tóner negro. Cambia el tóner cada mes.")
+    assert "vacaciones" not in text
+    assert sum(count_tokens(part) for part in text.split(GAP)) <= target
+
+
+def test_marks_gaps_between_non_contiguous_sentences():
+    """Test de que los huecos entre frases no contiguas se marcan."""
+    doc = Document(page_content="El router falla. Relleno uno. Relleno dos. Relleno tres. Reinicia el router.")
+    query = embed(["router"])[0]
+    compressed, _ = compress_documents([doc], [1.0], query, embed, target_tokens=12, neighbors=0)
+    assert compressed[0].page_content == f"El router falla.{GAP}Reinicia el router."
+
+
+def test_short_context_is_not_embedded():
+    """Test de que un contexto que ya cabe no se comprime ni se embebe."""
+    docs = [Document(page_content="Corto. Muy corto.")]
+    compressed, scores = compress_documents(docs, [1.0], [1.0] * 6, lambda texts: 1 / 0, target_tokens=100)
+    assert compressed == docs and scores == [1.0]
@@ -0,0 +1,59 @@
+"""
+Tests del empaquetado de contexto RAG por presupuesto de tokens
+"""
+import sys
+import os
+
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import config
+from chunking import count_tokens
+from context_packing import model_num_ctx, pack_context, split_sentences
+
+
+def doc(text):
+    return Document(page_content=text)
+
+
+def test_split_sentences():
+    """Test de separación en frases y párrafos."""
+    assert split_sentences("Uno. ¿Dos? Tres!\n\nCuatro sin punto") == ["Uno.", "¿Dos?", "Tres!", "Cuatro sin punto"]
+
+
+def test_pack_context_orders_by_score_and_fits_whole_chunks():
+    """Test de que se empaqueta por relevancia y sin pasarse del presupuesto."""
+    docs = [doc("Poco relevante."), doc("Muy relevante."), doc("Algo relevante.")]
+    packed = pack_context(docs, [0.1, 0.9, 0.5], budget=100)
+    assert packed.text == "Muy relevante.\n\nAlgo relevante.\n\nPoco relevante."
+    assert packed.tokens == sum(count_tokens(d.page_content) for d in docs)
+    assert not packed.truncated
+
+
+def test_pack_context_trims_last_chunk_at_sentence_boundary():
+    """Test de recorte del último chunk en un límite de frase."""
+    first = doc("Primera frase completa del chunk principal.")
+    second = doc("Frase uno del segundo chunk. Frase dos del segundo chunk. Frase tres.")
+    budget = count_tokens(first.page_content) + count_tokens("Frase uno del segundo chunk.") + 1
+    packed = pack_context([first, second], [1.0, 0.5], budget, min_fragment_tokens=1)
+
+    assert packed.truncated
+    assert packed.tokens <= budget
+    assert packed.docs[1].page_content == "Frase uno del segundo chunk."
+
+
+def test_pack_context_cuts_oversized_top_chunk_by_words():
+    """Test de que un primer chunk enorme sin frases cortas se corta por palabras."""
+    packed = pack_context([doc("palabra " * 500)], None, budget=50)
+    assert 0 < packed.tokens <= 50
+    assert packed.truncated
+
+
+def test_model_num_ctx_overrides(monkeypatch):
+    """Test de num_ctx por modelo (etiqueta exacta, luego familia, luego por defecto)."""
+    monkeypatch.setattr(config, "RAG_NUM_CTX", 4096)
+    monkeypatch.setattr(config, "MODEL_NUM_CTX", "qwen3=8192,qwen3:14b=16384")
+    assert model_num_ctx("qwen3:14b") == 16384
+    assert model_num_ctx("qwen3:4b") == 8192
+    assert model_num_ctx("llama3.2") == 4096
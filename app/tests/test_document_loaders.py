@@ -0,0 +1,102 @@
+"""
+Tests de los loaders de documentos
+"""
+import sys
+import os
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from document_loaders import StreamingTextLoader, get_loader
+
+
+def test_streaming_text_loader_cuts_sections_at_blank_lines(tmp_path):
+    """Test de que el texto se lee por secciones cortadas en líneas en blanco."""
+    paragraphs = [f"Parrafo {i} " + "x" * 50 for i in range(10)]
+    text = "\n\n".join(paragraphs) + "\n"
+    path = tmp_path / "notas.txt"
+    path.write_text(text, encoding="utf-8")
+
+    sections = list(StreamingTextLoader(str(path), section_chars=150).lazy_load())
+
+    assert len(sections) > 1
+    assert "".join(doc.page_content for doc in sections) == text
+    assert all(doc.page_content.endswith("\n\n") for doc in sections[:-1])
+    assert sections[0].metadata == {"source": str(path)}
+
+
+def test_streaming_text_loader_strict_encoding(tmp_path):
+    """Test de error claro cuando el fichero no está en la codificación esperada."""
+    path = tmp_path / "latin1.txt"
+    path.write_bytes("Jamón ibérico".encode("latin-1"))
+
+    with pytest.raises(RuntimeError):
+        list(StreamingTextLoader(str(path)).lazy_load())
+
+
+def test_streaming_text_loader_detects_encoding_before_yielding(tmp_path, monkeypatch):
+    """Test de que la codificación se detecta antes de trocear: sin secciones repetidas."""
+    import document_loaders
+
+    text = "Texto en ASCII.\n\n" * 20 + "Jamón ibérico al final.\n"
+    path = tmp_path / "latin1.txt"
+    path.write_bytes(text.encode("latin-1"))
+    monkeypatch.setattr(document_loaders, "detect_file_encodings",
+                        lambda file_path: [SimpleNamespace(encoding="latin-1")])
+
+    sections = list(StreamingTextLoader(str(path), autodetect_encoding=True, section_chars=100).lazy_load())
+    assert len(sections) > 1
+    assert "".join(doc.page_content for doc in sections) == text
+
+
+def test_markdown_loader_keeps_heading_paths(tmp_path):
+    """Test del loader de markdown nativo: secciones con la ruta de encabezados."""
+    path = tmp_path / "guia.md"
+    path.write_text(
+        "Introduccion sin encabezado.\n\n"
+        "# Guia\n\n"
+        "## Instalacion\n\nPasos de instalacion.\n\n"
+        "```bash\n# esto es un comentario, no un encabezado\npip install x\n```\n\n"
+        "### Linux\n\nUsar apt.\n\n"
+        "## Uso\n\nEjecutar el servidor.\n",
+        encoding="utf-8",
+    )
+
+    docs = list(get_loader(str(path)).lazy_load())
+
+    assert [doc.metadata["headings"] for doc in docs] == [
+        "", "Guia > Instalacion", "Guia > Instalacion > Linux", "Guia > Uso"]
+    assert "# esto es un comentario" in docs[1].page_content
+    assert docs[2].page_content.startswith("### Linux")
+    assert all(doc.metadata["source"] == str(path) for doc in docs)
+
+
+def test_markdown_loader_keeps_hashes_inside_headings(tmp_path):
+    """Test de que solo se quita la secuencia de cierre de # precedida de espacio."""
+    path = tmp_path / "lenguajes.md"
+    path.write_text("# Using C#\n\nTexto sobre C#.\n\n## Instalacion ##\n\nPasos.\n", encoding="utf-8")
+
+    docs = list(get_loader(str(path)).lazy_load())
+
+    assert [doc.metadata["headings"] for doc in docs] == ["Using C#", "Using C# > Instalacion"]
+    assert docs[0].page_content.startswith("# Using C#\n")
+
+
+def test_markdown_loader_closes_fences_with_a_run_as_long(tmp_path):
+    """Test de que una valla de cuatro comillas no la cierra una de tres."""
+    path = tmp_path / "ejemplo.md"
+    path.write_text(
+        "# Ejemplo\n\n"
+        "````markdown\n```python\nprint(1)\n```\n# no es encabezado\n````\n\n"
+        "~~~\n# tampoco\n~~~~\n\n"
+        "## Fin\n\nUltima seccion.\n",
+        encoding="utf-8",
+    )
+
+    docs = list(get_loader(str(path)).lazy_load())
+
+    assert [doc.metadata["headings"] for doc in docs] == ["Ejemplo", "Ejemplo > Fin"]
+    assert "# no es encabezado" in docs[0].page_content
+    assert "# tampoco" in docs[0].page_content
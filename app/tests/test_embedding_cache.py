@@ -0,0 +1,65 @@
+"""
+Tests de la caché persistente de embeddings
+"""
+import sys
+import os
+
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, text_hash
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cached_embeddings_only_compute_misses(tmp_path):
+    """Test de que sólo se calculan los textos que no están en caché."""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, cache, "nomic-embed-text")
+
+    first = embeddings.embed_documents(["uno", "dos", "uno"])
+    assert inner.calls == [["uno", "dos"]]
+
+    second = embeddings.embed_documents(["dos", "tres"])
+    assert inner.calls[-1] == ["tres"]
+    assert second[0] == first[1]
+    assert embeddings.embed_query("uno") == first[0]
+    assert len(inner.calls) == 2
+
+
+def test_cache_is_per_model_and_persistent(tmp_path):
+    """Test de que la caché distingue modelos y sobrevive a reabrir el fichero."""
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_bytes=1024 * 1024)
+    cache.put_many("all-minilm", {text_hash("hola"): [1.0, 2.0]})
+
+    reopened = EmbeddingCache(path, max_bytes=1024 * 1024)
+    assert reopened.get_many("all-minilm", [text_hash("hola")]) == {text_hash("hola"): [1.0, 2.0]}
+    assert reopened.get_many("nomic-embed-text", [text_hash("hola")]) == {}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test de la expulsión por tamaño (LRU)."""
+    # Cada vector de 4 floats ocupa 16 bytes; caben 4
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=64)
+    for i in range(4):
+        cache.put_many("m", {f"k{i}": [float(i)] * 4})
+    cache.get_many("m", ["k0"])  # k0 pasa a ser el más reciente
+    cache.put_many("m", {"k4": [4.0] * 4})
+
+    remaining = cache.get_many("m", [f"k{i}" for i in range(5)])
+    assert "k0" in remaining and "k4" in remaining
+    assert "k1" not in remaining
+    assert cache.stats()["bytes"] <= 64
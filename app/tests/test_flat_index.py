@@ -0,0 +1,81 @@
+"""
+Tests del índice plano de NumPy (vectores float32 en ficheros mapeados en memoria)
+"""
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flat_index import FlatIndex
+
+
+def test_add_list_update_delete_and_reopen(tmp_path):
+    """Test de escritura, filtros, actualización de metadatos, borrado y persistencia."""
+    index = FlatIndex(str(tmp_path / "index"))
+    index.add(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]], ["uno", "dos", "tres"],
+              [{"source_name": "x.txt"}, {"source_name": "y.txt"}, None])
+    index.add(["a"], [[1, 1, 0]], ["uno bis"], [{"source_name": "x.txt"}])
+    index.update_metadata(["b"], [{"tag:red": True}])
+
+    assert index.count() == 3
+    assert index.list(ids=["a"]).texts == ["uno bis"]
+    assert index.list(where={"source_name": {"$in": ["y.txt"]}}).metadatas == \
+        [{"source_name": "y.txt", "tag:red": True}]
+    assert index.list(limit=1, offset=1, include=[]).ids == ["b"]
+    assert index.search([1, 0.1, 0], 1).ids == ["a"]
+
+    index.delete(["c"])
+    index.add(["d"], [[0, 0, 2]], ["cuatro"], [{"source_name": "z.txt"}])
+    index.close()
+
+    reopened = FlatIndex(str(tmp_path / "index"))
+    assert reopened.count() == 3
+    result = reopened.search([0, 0, 1], 2, include=["texts", "embeddings"])
+    assert result.ids[0] == "d"
+    assert result.texts[0] == "cuatro"
+    assert list(result.embeddings[0]) == [0.0, 0.0, 2.0]
+    assert reopened.search([0, 0, 1], 5, where={"source_name": "x.txt"}).ids == ["a"]
+    with pytest.raises(ValueError):
+        reopened.add(["e"], [[1, 2]], ["cinco"], [None])
+    reopened.reset()
+    assert reopened.count() == 0
+    assert reopened.search([0, 0, 1], 2).ids == []
+
+
+def test_search_matches_exact_search(tmp_path):
+    """Test de que la búsqueda plana devuelve exactamente los vecinos más cercanos, en orden."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(600, 64)).astype(np.float32)
+    index = FlatIndex(str(tmp_path / "index"))
+    ids = [f"id{i}" for i in range(len(vectors))]
+    for start in range(0, len(ids), 100):
+        index.add(ids[start:start + 100], vectors[start:start + 100], [None] * 100, [None] * 100)
+    index.delete(ids[:50])
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for query in rng.normal(size=(20, 64)).astype(np.float32):
+        exact = [ids[i] for i in np.argsort(-(unit @ query)) if i >= 50][:10]
+        assert index.search(query, 10).ids == exact
+
+
+def test_unfiltered_search_skips_the_row_filter(tmp_path, monkeypatch):
+    """Test de que sin filtro las filas vivas salen de la máscara, también tras borrar y reabrir."""
+    import flat_index
+
+    index = FlatIndex(str(tmp_path / "index"))
+    index.add(["a", "b", "c"], [[1, 0], [0, 1], [1, 1]], [None] * 3, [{"source_name": "x.txt"}] * 3)
+    index.delete(["a"])
+    index.close()
+
+    def fail(metadata, where):
+        raise AssertionError("unfiltered search evaluated the row filter")
+
+    reopened = FlatIndex(str(tmp_path / "index"))
+    monkeypatch.setattr(flat_index, "matches_where", fail)
+    assert reopened.search([1, 0], 3).ids == ["c", "b"]
+    assert reopened.list(include=[]).ids == ["b", "c"]
+    reopened.add(["a"], [[2, 0]], [None], [None])
+    assert reopened.search([1, 0], 1).ids == ["a"]
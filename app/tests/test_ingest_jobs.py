@@ -0,0 +1,125 @@
+"""
+Tests de la cola de ingesta en segundo plano
+"""
+import time
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from ingest_jobs import IngestJobManager, IngestQueueFullError
+
+
+def wait_for(manager, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_stages_and_counts():
+    """Test de que el job recorre las etapas y guarda conteos y tiempos."""
+    def fake_ingest(file_path, embedding_model=None, progress=None, content_hash=None, tags=None):
+        progress("parsing")
+        progress("splitting")
+        progress("embedding", chunks_total=7, chunks_embedded=4)
+        progress("writing")
+        progress("embedding", chunks_embedded=7)
+        return 7
+
+    manager = IngestJobManager(fake_ingest, max_workers=1)
+    job = manager.submit("/tmp/doc.md", "doc.md", embedding_model="nomic-embed-text",
+                         upload_seconds=0.5)
+    result = wait_for(manager, job.id)
+
+    assert result["status"] == "done"
+    assert result["chunks_total"] == 7
+    assert result["chunks_added"] == 7
+    assert result["chunks_remaining"] == 0
+    assert set(result["timings"]) == {"upload", "parse", "split", "embed", "write"}
+    assert result["timings"]["upload"] == 0.5
+    assert set(result["throughput"]) == {"chunks_per_second", "embed_chunks_per_second",
+                                         "embed_tokens_per_second"}
+    manager.shutdown()
+
+
+def test_wait_for_update_returns_on_progress():
+    """Test de que wait_for_update despierta con cada cambio y da los chunks pendientes."""
+    import asyncio
+    import threading
+    step = threading.Event()
+
+    def stepped_ingest(file_path, embedding_model=None, progress=None, content_hash=None, tags=None):
+        progress("embedding", chunks_total=10, chunks_skipped=2, chunks_embedded=3)
+        step.wait(5)
+        return 8
+
+    manager = IngestJobManager(stepped_ingest, max_workers=1)
+    job = manager.submit("/tmp/doc.txt", "doc.txt")
+
+    async def follow():
+        snapshot = await manager.wait_for_update(job.id, 0, timeout=5)
+        while snapshot["status"] != "embedding":
+            snapshot = await manager.wait_for_update(job.id, snapshot["version"], timeout=5)
+        assert snapshot["chunks_remaining"] == 5
+        assert "embed" in snapshot["timings"]
+
+        # Sin cambios devuelve el mismo estado al agotar el timeout
+        same = await manager.wait_for_update(job.id, snapshot["version"], timeout=0.05)
+        assert same["version"] == snapshot["version"]
+
+        step.set()
+        final = await manager.wait_for_update(job.id, snapshot["version"], timeout=5)
+        assert final["status"] == "done"
+        assert final["finished_at"] is not None
+        assert await manager.wait_for_update("missing", 0, timeout=0.01) is None
+        assert not manager._waiters
+
+    asyncio.run(follow())
+    manager.shutdown()
+
+
+def test_job_failure_is_recorded():
+    """Test de que un error en la ingesta marca el job como fallido."""
+    def broken_ingest(file_path, embedding_model=None, progress=None, content_hash=None, tags=None):
+        raise ValueError("bad pdf")
+
+    manager = IngestJobManager(broken_ingest, max_workers=1)
+    job = manager.submit("/tmp/doc.pdf", "doc.pdf")
+    result = wait_for(manager, job.id)
+
+    assert result["status"] == "failed"
+    assert result["error"] == "bad pdf"
+    manager.shutdown()
+
+
+def test_pending_limit():
+    """Test del límite de jobs en cola."""
+    release = __import__("threading").Event()
+
+    def slow_ingest(file_path, embedding_model=None, progress=None, content_hash=None, tags=None):
+        release.wait(5)
+        return 0
+
+    manager = IngestJobManager(slow_ingest, max_workers=1, max_pending=1)
+    manager.submit("/tmp/a.txt", "a.txt")
+    time.sleep(0.05)  # el primer job ya está corriendo
+    manager.submit("/tmp/b.txt", "b.txt")
+    # El mismo fichero ya en cola no crea otro job
+    assert manager.submit("/tmp/b.txt", "b.txt").status == "queued"
+    with pytest.raises(IngestQueueFullError):
+        manager.submit("/tmp/c.txt", "c.txt")
+    release.set()
+    manager.shutdown(wait=True)
+
+
+def test_unknown_job():
+    """Test de job inexistente."""
+    manager = IngestJobManager(lambda *a, **k: 0)
+    assert manager.get("missing") is None
+    manager.shutdown()
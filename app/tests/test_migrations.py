@@ -0,0 +1,83 @@
+"""
+Tests del gestor de migraciones de embeddings en segundo plano
+"""
+import json
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from migrations import CHECKPOINT_FILENAME, ActivityMonitor, MigrationManager
+
+
+def wait_for(manager, job_id, statuses, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job still {manager.get(job_id)['status']}")
+
+
+def fake_migration(batches=3):
+    def migrate(source_model, target_model, progress, before_batch):
+        progress("migrating", documents_total=batches, chunks_total=batches)
+        for i in range(batches):
+            before_batch()
+            progress("migrating", documents_migrated=i + 1, chunks_migrated=i + 1)
+        return {}
+    return migrate
+
+
+def test_migration_waits_for_chat_requests(tmp_path):
+    """Test de prioridad del chat: la migración espera a que acaben las peticiones en curso."""
+    activity = ActivityMonitor()
+    manager = MigrationManager(fake_migration(), lambda model: str(tmp_path / model), activity=activity,
+                               pause=0, max_wait=5)
+    release = activity.begin()
+    job = manager.submit("a", "b")
+    assert wait_for(manager, job.id, ("waiting",))["chunks_migrated"] == 0
+    time.sleep(0.05)
+
+    release()
+    release()  # las llamadas repetidas no descuentan otra petición
+    job = wait_for(manager, job.id, ("done",))
+    assert activity.active == 0
+    assert job["chunks_migrated"] == 3
+    assert job["progress"] == 1.0
+    assert job["throttled_seconds"] >= 0.05
+    with open(tmp_path / "b" / CHECKPOINT_FILENAME, encoding="utf-8") as f:
+        assert json.load(f)["status"] == "done"
+
+
+def test_cancel_and_resume_interrupted(tmp_path):
+    """Test de cancelación y de reanudación de migraciones a partir del checkpoint."""
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def migrate(source_model, target_model, progress, before_batch):
+        started.set()
+        proceed.wait(5)
+        before_batch()
+        return {}
+
+    manager = MigrationManager(migrate, lambda model: str(tmp_path / model), pause=0)
+    job = manager.submit("a", "b")
+    assert manager.submit("a", "b") is job
+    started.wait(5)
+    manager.cancel(job.id)
+    proceed.set()
+    assert wait_for(manager, job.id, ("cancelled",))["status"] == "cancelled"
+    assert manager.resume_interrupted(str(tmp_path)) == []
+
+    # Un checkpoint sin terminar (p. ej. tras reiniciar el pod) se reanuda
+    os.makedirs(tmp_path / "c")
+    with open(tmp_path / "c" / CHECKPOINT_FILENAME, "w", encoding="utf-8") as f:
+        json.dump({"source_model": "a", "target_model": "c", "status": "migrating"}, f)
+    resumed = manager.resume_interrupted(str(tmp_path))
+    assert [(job.source_model, job.target_model) for job in resumed] == [("a", "c")]
+    assert wait_for(manager, resumed[0].id, ("done",))["status"] == "done"
+    manager.shutdown()
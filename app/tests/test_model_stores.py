@@ -0,0 +1,84 @@
+"""
+Tests del registro de almacenes vectoriales por modelo de embeddings
+"""
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from model_stores import ModelStoreRegistry
+
+
+class FakeStore:
+    def __init__(self, model, size=0):
+        self.embedding_model = model
+        self.size = size
+        self.closed = False
+
+    def estimated_bytes(self):
+        return self.size
+
+    def close(self):
+        self.closed = True
+
+
+def test_reuses_open_stores_and_evicts_least_recently_used():
+    """Test de reutilización y expulsión LRU por número de almacenes."""
+    opened = []
+    registry = ModelStoreRegistry(lambda model: opened.append(model) or FakeStore(model), max_stores=2)
+    a = registry.get("a")
+    assert registry.get("a") is a
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+
+    assert opened == ["a", "b", "c"]
+    assert registry.open_models() == ["a", "c"]
+    assert not a.closed
+    assert registry.stats()["evicted"] == 1
+
+
+def test_evicts_by_estimated_memory():
+    """Test de expulsión cuando se supera la memoria estimada."""
+    registry = ModelStoreRegistry(lambda model: FakeStore(model, size=60), max_stores=10, max_bytes=100)
+    first = registry.get("a")
+    registry.get("b")
+    assert first.closed
+    assert registry.open_models() == ["b"]
+
+
+def test_leased_store_is_closed_when_released():
+    """Test de que un almacén en uso no se cierra hasta que termina la petición."""
+    registry = ModelStoreRegistry(lambda model: FakeStore(model), max_stores=1)
+    with registry.lease("a") as store:
+        registry.get("b")
+        assert "a" not in registry.open_models()
+        assert not store.closed
+    assert store.closed
+
+    with registry.lease("a") as reopened:
+        assert reopened is not store and not reopened.closed
+
+
+def test_opens_each_model_once_under_concurrency():
+    """Test de que peticiones concurrentes abren cada modelo una sola vez."""
+    opened = []
+
+    def open_store(model):
+        time.sleep(0.05)
+        opened.append(model)
+        return FakeStore(model)
+
+    registry = ModelStoreRegistry(open_store, max_stores=4)
+    results = []
+    threads = [threading.Thread(target=lambda m=m: results.append(registry.get(m)))
+               for m in ["a", "b"] * 5]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(opened) == ["a", "b"]
+    assert len({id(store) for store in results}) == 2
@@ -0,0 +1,59 @@
+"""
+Tests del índice cuantizado (int8/float16 en ficheros mapeados en memoria)
+"""
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from quantized_store import QuantizedIndex
+
+
+def test_requantizes_on_reopen_and_reset(tmp_path):
+    """Test de persistencia, cambio de cuantización al reabrir y borrado completo."""
+    index = QuantizedIndex(str(tmp_path / "index"))
+    index.add(["a", "b", "c"], [[1, 0, 0], [0, 1, 0], [0, 0, 1]], ["uno", "dos", "tres"],
+              [{"source_name": "x.txt"}, {"source_name": "y.txt"}, None])
+    index.delete(["c"])
+    index.add(["d"], [[0, 0, 2]], ["cuatro"], [{"source_name": "z.txt"}])
+    index.close()
+
+    reopened = QuantizedIndex(str(tmp_path / "index"), quantization="float16")
+    assert not os.path.exists(tmp_path / "index" / "vectors.int8")
+    assert reopened.count() == 3
+    result = reopened.search([0, 0, 1], 2, include=["texts", "embeddings"])
+    assert result.ids[0] == "d"
+    assert result.texts[0] == "cuatro"
+    assert list(result.embeddings[0]) == [0.0, 0.0, 2.0]
+    assert reopened.search([0, 0, 1], 5, where={"source_name": "x.txt"}).ids == ["a"]
+    with pytest.raises(ValueError):
+        reopened.add(["e"], [[1, 2]], ["cinco"], [None])
+    reopened.reset()
+    assert reopened.count() == 0
+    assert reopened.search([0, 0, 1], 2).ids == []
+
+    with pytest.raises(ValueError):
+        QuantizedIndex(str(tmp_path / "otro"), quantization="int4")
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+def test_quantized_search_matches_exact_search(tmp_path, quantization):
+    """Test de recall: la búsqueda cuantizada con reordenación devuelve los mismos vecinos que la exacta."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(600, 64)).astype(np.float32)
+    index = QuantizedIndex(str(tmp_path / quantization), quantization=quantization)
+    ids = [f"id{i}" for i in range(len(vectors))]
+    for start in range(0, len(ids), 100):
+        index.add(ids[start:start + 100], vectors[start:start + 100], [None] * 100, [None] * 100)
+    index.delete(ids[:50])
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    hits = 0
+    queries = rng.normal(size=(20, 64)).astype(np.float32)
+    for query in queries:
+        exact = {ids[i] for i in [i for i in np.argsort(-(unit @ query)) if i >= 50][:10]}
+        hits += len(exact & set(index.search(query, 10).ids))
+    assert hits / (10 * len(queries)) >= 0.95
@@ -0,0 +1,53 @@
+"""
+Tests de la caché LRU de embeddings de preguntas
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from query_cache import QueryEmbeddingCache, normalize_query
+
+
+def test_normalized_queries_share_entry():
+    """Test de que los espacios no generan entradas distintas, pero las mayúsculas sí."""
+    cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=60)
+    computed = []
+
+    def compute(text):
+        computed.append(text)
+        return [1.0, 2.0]
+
+    assert cache.get_or_compute("nomic-embed-text", "  ¿Cómo  instalo?\n", compute) == [1.0, 2.0]
+    assert cache.get_or_compute("nomic-embed-text", "¿Cómo instalo?", compute) == [1.0, 2.0]
+    assert computed == ["¿Cómo instalo?"]
+    # Cada grafía se embebe tal cual: el resultado no depende del orden de las preguntas
+    cache.get_or_compute("nomic-embed-text", "¿cómo instalo?", compute)
+    assert computed == ["¿Cómo instalo?", "¿cómo instalo?"]
+    # Otro modelo de embedding no comparte vectores
+    cache.get_or_compute("bge-m3", "¿cómo instalo?", compute)
+    assert len(computed) == 3
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert normalize_query(" a \t b ") == "a b"
+
+
+def test_lru_and_ttl_bounds():
+    """Test de expulsión LRU por tamaño y de caducidad por TTL."""
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    cache.get("m", "a")  # "b" pasa a ser la menos usada
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+    short = QueryEmbeddingCache(max_entries=2, ttl_seconds=0.01)
+    short.put("m", "a", [1.0])
+    time.sleep(0.02)
+    assert short.get("m", "a") is None
+    assert short.stats()["entries"] == 0
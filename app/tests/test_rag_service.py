@@ -0,0 +1,610 @@
+"""
+Tests de RAGService con embeddings falsos (sin Ollama)
+"""
+import threading
+import sys
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from rag_service import RAGService
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings deterministas que registran el tamaño de cada lote."""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def service(tmp_path):
+    """RAGService sobre un directorio temporal con embeddings falsos."""
+    rag = RAGService(
+        persist_dir=str(tmp_path / "chroma"),
+        embedding_model="fake-embed",
+        embedding_batch_size=2,
+        embedding_concurrency=2,
+        write_batch_size=3,
+        embedding_cache=EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024),
+    )
+    fake = FakeEmbeddings()
+    rag.store().embeddings = fake
+    return rag
+
+
+def test_process_documents_batches_embeddings(service):
+    """Test de que los chunks se embeben por lotes y se escriben todos."""
+    docs = [Document(page_content=f"Parrafo numero {i}. " * 3, metadata={"source": "doc.txt"})
+            for i in range(7)]
+    stats = service._process_documents(docs)
+
+    assert stats["chunks_added"] == 7
+    assert service.store().embeddings.batches == [2, 2, 2, 1]
+    assert service.store().vectors.count() == 7
+
+
+def test_process_documents_reports_progress(service):
+    """Test del progreso reportado durante el embedding."""
+    events = []
+    docs = [Document(page_content=f"Texto {i}", metadata={"source": "a.txt"}) for i in range(5)]
+    service._process_documents(docs, progress=lambda stage, **counts: events.append((stage, counts)))
+
+    embedding_events = [counts for stage, counts in events if stage == "embedding"]
+    assert events[0] == ("parsing", {})
+    assert embedding_events[0]["chunks_total"] == 5
+    assert embedding_events[0]["chunks_skipped"] == 0
+    assert embedding_events[0]["tokens_total"] == embedding_events[0]["tokens_embedded"] > 0
+    assert embedding_events[-1] == {"chunks_embedded": 5}
+
+
+def test_documents_are_processed_in_windows(service):
+    """Test de ingesta por ventanas: se escribe cada ventana antes de leer la siguiente."""
+    service.ingest_window_docs = 2
+    counts_seen_by_reader = []
+
+    def pages():
+        for i in range(5):
+            counts_seen_by_reader.append(service.store().vectors.count())
+            yield Document(page_content=f"Pagina {i} " * 5, metadata={"source": "libro.pdf", "page": i})
+
+    assert service._process_documents(pages())["chunks_added"] == 5
+    # Las páginas 2 y 4 se leen cuando las ventanas anteriores ya están escritas
+    assert counts_seen_by_reader == [0, 0, 2, 2, 4]
+
+
+def test_reingest_only_embeds_changed_chunks(service, tmp_path):
+    """Test de re-ingesta incremental: sólo se embeben los chunks nuevos y se borran los viejos."""
+    paragraphs = [f"Seccion {i}: " + ("contenido estable " * 40) for i in range(4)]
+    path = tmp_path / "manual.txt"
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+    first = service.ingest_file(str(path))
+    stored = service.store().vectors.count()
+    assert first == stored > 0
+
+    # Re-subir el mismo fichero no embebe nada
+    service.store().embeddings.batches.clear()
+    assert service.ingest_file(str(path)) == 0
+    assert service.store().embeddings.batches == []
+    assert service.store().vectors.count() == stored
+
+    # Editar un párrafo sólo re-embebe sus chunks y elimina los obsoletos
+    paragraphs[2] = "Seccion 2: " + ("contenido editado " * 40)
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    events = []
+    added = service.ingest_file(str(path), progress=lambda stage, **counts: events.append(counts))
+    assert 0 < added < stored
+    removed = [e["chunks_removed"] for e in events if "chunks_removed" in e]
+    assert removed and removed[0] > 0
+    assert service.store().vectors.count() == stored - removed[0] + added
+
+
+def test_clear_database_keeps_embedding_cache(tmp_path):
+    """Test de que borrar todas las bases vectoriales conserva la caché de embeddings."""
+    persist_dir = tmp_path / "chroma"
+    cache = EmbeddingCache(str(persist_dir / "_embedding_cache" / "embeddings.sqlite3"), max_bytes=1024)
+    rag = RAGService(persist_dir=str(persist_dir), embedding_model="fake-embed", embedding_cache=cache)
+
+    rag.clear_database()
+
+    assert "_embedding_cache" in os.listdir(persist_dir)
+    assert rag.store().vectors.count() == 0
+    assert os.path.exists(cache.path)
+
+
+def test_ingest_directory_reports_per_file(service, tmp_path):
+    """Test de ingesta de directorio en paralelo con informe por fichero."""
+    docs_dir = tmp_path / "kb"
+    (docs_dir / "sub").mkdir(parents=True)
+    (docs_dir / "a.txt").write_text("Normas del gimnasio. " * 20, encoding="utf-8")
+    (docs_dir / "sub" / "b.py").write_text("def hola():\n    return 'hola'\n", encoding="utf-8")
+    (docs_dir / "roto.txt").write_bytes(b"\xff\xfe\x00 no es utf-8 \xff")
+
+    report = service.ingest_directory(str(docs_dir), max_workers=2)
+
+    by_file = {entry["file"]: entry for entry in report}
+    assert set(by_file) == {"a.txt", "sub/b.py", "roto.txt"}
+    assert by_file["a.txt"]["status"] == "success"
+    assert by_file["a.txt"]["chunks_added"] > 0
+    assert by_file["sub/b.py"]["status"] == "success"
+    assert by_file["roto.txt"]["status"] == "failed"
+    assert service.store().vectors.count() == sum(
+        entry.get("chunks_added", 0) for entry in report)
+
+
+def test_ingest_directory_keeps_same_names_apart(service, tmp_path):
+    """Test de que ficheros con el mismo nombre en carpetas distintas no se pisan."""
+    docs_dir = tmp_path / "kb"
+    for folder, text in (("a", "Manual del gimnasio. "), ("b", "Horario de la piscina. ")):
+        (docs_dir / folder).mkdir(parents=True)
+        (docs_dir / folder / "README.txt").write_text(text * 20, encoding="utf-8")
+
+    report = service.ingest_directory(str(docs_dir), max_workers=2)
+
+    assert [entry["file"] for entry in report] == ["a/README.txt", "b/README.txt"]
+    assert all(entry["status"] == "success" for entry in report)
+    store = service.store()
+    assert {record["source_name"] for record in store.documents.list()} == {"a/README.txt", "b/README.txt"}
+    total = store.vectors.count()
+    assert total == sum(entry["chunks_added"] for entry in report)
+
+    # Reingerir no borra los chunks del otro fichero
+    report = service.ingest_directory(str(docs_dir), max_workers=2)
+    assert all(entry["chunks_added"] == 0 for entry in report)
+    assert store.vectors.count() == total
+
+    deleted = service.delete_document("a/README.txt")
+    assert deleted["chunks_deleted"] == report[0]["chunks_total"]
+    assert store.vectors.count() == total - deleted["chunks_deleted"]
+    assert store.documents.get("b/README.txt") is not None
+
+
+def test_clear_database_single_model(service, tmp_path):
+    """Test de borrado de la base de un único modelo."""
+    path = tmp_path / "nota.txt"
+    path.write_text("Contenido de prueba. " * 10, encoding="utf-8")
+    service.ingest_file(str(path))
+    assert service.store().documents.get("nota.txt") is not None
+
+    service.clear_database(embedding_model="fake-embed")
+
+    assert service.store().vectors.count() == 0
+    assert service.store().documents.get("nota.txt") is None
+
+
+def test_related_docs_reuse_query_embedding(service):
+    """Test de que la misma pregunta no se vuelve a embeber en cada búsqueda."""
+    service._process_documents([Document(page_content="El manual de instalación.",
+                                         metadata={"source": "manual.txt"})])
+    calls = []
+    embed_query = service.store().embeddings.embed_query
+    service.store().embeddings.embed_query = lambda text: calls.append(text) or embed_query(text)
+
+    first = service.get_related_docs("¿Dónde está el manual?")
+    second = service.get_related_docs("¿Dónde está   el manual? ")
+    assert [d.page_content for d in first] == [d.page_content for d in second]
+    assert len(calls) == 1
+    assert service.query_cache.stats()["hits"] == 1
+
+
+def test_answer_cache_serves_repeated_questions(service):
+    """Test de la caché semántica: repetir la pregunta no regenera y una ingesta la invalida."""
+    import asyncio
+    from answer_cache import SemanticAnswerCache
+
+    class FakeChain:
+        def __init__(self):
+            self.calls = 0
+
+        async def ainvoke(self, inputs):
+            self.calls += 1
+            return f"respuesta {self.calls}"
+
+        async def astream(self, inputs):
+            self.calls += 1
+            for piece in ("respuesta ", str(self.calls)):
+                yield piece
+
+    async def collect(stream):
+        return "".join([piece async for piece in stream])
+
+    chain = FakeChain()
+    service.answer_cache = SemanticAnswerCache(threshold=0.99)
+    service._rag_chain = lambda model, temperature, max_tokens=None: chain
+
+    assert asyncio.run(service.ask("¿Qué es X?")) == "respuesta 1"
+    assert asyncio.run(service.ask("¿Qué es X?")) == "respuesta 1"
+    assert asyncio.run(collect(service.ask_stream("¿Qué es X?"))) == "respuesta 1"
+    assert chain.calls == 1
+
+    service._process_documents([Document(page_content="X es nuevo.", metadata={"source": "x.txt"})])
+    assert asyncio.run(collect(service.ask_stream("¿Qué es X?"))) == "respuesta 2"
+    assert asyncio.run(service.ask("¿Qué es X?")) == "respuesta 2"
+    assert chain.calls == 2
+
+
+def test_hybrid_search_finds_exact_identifiers(service, tmp_path):
+    """Test de búsqueda híbrida: un código exacto aparece aunque el vector no lo encuentre."""
+    docs = [Document(page_content=f"Nota general numero {i} sobre el inventario.",
+                     metadata={"source": "notas.txt"}) for i in range(30)]
+    docs.append(Document(page_content="Referencia ZX-9041: sustituir filtro.", metadata={"source": "ref.txt"}))
+    service.ingest_window_docs = 100
+    service._process_documents(docs)
+
+    related = service.get_related_docs("¿qué hago con ZX-9041?", k=3)
+    assert any("ZX-9041" in doc.page_content for doc in related)
+
+    # El índice se persiste y se actualiza al borrar
+    assert os.path.exists(os.path.join(service.store().persist_dir, "bm25.pkl"))
+    assert service.delete_document("ref.txt")["found"]
+    assert service.store().keyword_index.search("zx-9041") == []
+
+
+def test_delete_document_uses_where_lookup_and_returns_counts(service, monkeypatch):
+    """Test de borrado: resuelve IDs por metadatos, borra en lotes y devuelve el número de chunks."""
+    docs = [Document(page_content=f"Parrafo {i} del manual.", metadata={"source": "/data/manual.txt"})
+            for i in range(7)]
+    docs.append(Document(page_content="Otro documento.", metadata={"source": "/data/otro.txt"}))
+    service._process_documents(docs)
+    service.store().documents.upsert("manual.txt", "/data/manual.txt", "h", 10, 7)
+    service.write_batch_size = 3
+
+    vectors = service.store().vectors
+    deletes = []
+    original_delete, original_list = vectors.delete, vectors.list
+    monkeypatch.setattr(vectors, "delete", lambda ids: deletes.append(len(ids)) or original_delete(ids))
+    monkeypatch.setattr(vectors, "list", lambda ids=None, where=None, **kw: original_list(ids=ids, where=where, **kw)
+                        if ids is not None or where else pytest.fail("full scan"))
+
+    assert service.delete_document("manual.txt") == {"found": True, "chunks_deleted": 7}
+    assert deletes == [3, 3, 1]
+    assert service.store().documents.get("manual.txt") is None
+    assert vectors.count() == 1
+    assert service.delete_document("manual.txt") == {"found": False, "chunks_deleted": 0}
+
+
+def test_reupload_replaces_chunks_ingested_before_source_name(service, tmp_path):
+    """Test de resubida de un documento de antes de source_name (IDs aleatorios, ruta antigua)."""
+    text = "Horario de la piscina: de 8 a 22 horas."
+    legacy_path = str(tmp_path / "uploaded_files" / "piscina.txt")
+    store = service.store()
+    store.vectors.add(["3f2a-legacy"], store.embeddings.embed_documents([text]), [text], [{"source": legacy_path}])
+    service._backfill_document_registry(store)
+    assert store.documents.get("piscina.txt")["source"] == legacy_path
+
+    # Las subidas se guardan ahora en <UPLOAD_DIR>/<sha256>/<nombre>
+    new_path = tmp_path / "uploaded_files" / ("ab" * 32) / "piscina.txt"
+    new_path.parent.mkdir(parents=True)
+    new_path.write_text(text, encoding="utf-8")
+    service.ingest_file(str(new_path))
+
+    assert "3f2a-legacy" not in store.vectors.list(include=[]).ids
+    assert store.vectors.count() == 1
+    assert service.delete_document("piscina.txt") == {"found": True, "chunks_deleted": 1}
+    assert store.vectors.count() == 0
+
+
+def test_context_is_packed_within_the_model_budget(service, monkeypatch):
+    """Test de empaquetado: el contexto respeta el presupuesto derivado de num_ctx y max_tokens."""
+    import config
+    docs = [Document(page_content=" ".join(f"Frase {j} del documento {i}." for j in range(40)),
+                     metadata={"source": f"doc{i}.txt"}) for i in range(4)]
+    service._process_documents(docs)
+    monkeypatch.setattr(config, "RAG_NUM_CTX", 4096)
+    monkeypatch.setattr(config, "MODEL_NUM_CTX", "mini=1024")
+
+    large = service.context_budget("documento", "qwen3:14b", max_tokens=512)
+    small = service.context_budget("documento", "mini:latest", max_tokens=512)
+    assert large > small >= service.MIN_CONTEXT_TOKENS
+
+    context = service.build_context("documento", "mini:latest", 512)
+    assert context.budget == small
+    assert 0 < context.tokens <= small
+    assert context.truncated
+    assert context.text.endswith(".")
+
+
+def test_answer_length_is_clamped_to_the_context_window(service, monkeypatch):
+    """Test de que un max_tokens mayor que la ventana se recorta y el prompt sigue cabiendo."""
+    import asyncio
+    import config
+    from chunking import count_tokens
+    monkeypatch.setattr(config, "MODEL_NUM_CTX", "mini=1024")
+    service._process_documents([Document(page_content="El manual de instalación.",
+                                         metadata={"source": "manual.txt"})])
+
+    answer = service.answer_tokens("documento", "mini:latest", max_tokens=4096)
+    budget = service.context_budget("documento", "mini:latest", max_tokens=4096)
+    prompt = count_tokens(service.RAG_TEMPLATE.format(context="", question="documento"))
+    assert answer < 1024 and budget >= service.MIN_CONTEXT_TOKENS
+    assert answer + budget + prompt <= 1024
+    assert service.answer_tokens("documento", "mini:latest", max_tokens=128) == 128
+
+    class FakeChain:
+        async def ainvoke(self, inputs):
+            return "respuesta"
+
+    requested = []
+    service._rag_chain = lambda model, temperature, max_tokens=None: requested.append(max_tokens) or FakeChain()
+    asyncio.run(service.ask("documento", "mini:latest", max_tokens=4096))
+    assert requested == [answer]
+
+
+def test_context_compression_reduces_prompt_tokens(service, monkeypatch):
+    """Test de compresión: el contexto se reduce al objetivo de tokens configurado."""
+    import config
+    service._process_documents([Document(page_content=" ".join(f"Frase {j} del documento {i}." for j in range(30)),
+                                         metadata={"source": f"doc{i}.txt"}) for i in range(3)])
+    full = service.build_context("documento")
+
+    monkeypatch.setattr(config, "CONTEXT_COMPRESSION_ENABLED", True)
+    monkeypatch.setattr(config, "CONTEXT_COMPRESSION_TOKENS", 60)
+    # Las frases se embeben sin pasar por la caché de embeddings en disco
+    store = service.store()
+    store.embeddings = CachedEmbeddings(store.embeddings, service.embedding_cache, store.embedding_model)
+    cached = service.embedding_cache.stats()["entries"]
+    compressed = service.build_context("documento")
+    assert 0 < compressed.tokens <= 60 < full.tokens
+    assert service.embedding_cache.stats()["entries"] <= cached + 1  # solo la pregunta
+
+
+def test_fanout_retrieval_merges_stores_and_dedups_chunks(service, monkeypatch):
+    """Test de fan-out: busca en varios almacenes, fusiona por RRF y deduplica por texto."""
+    import config
+    service._process_documents([
+        Document(page_content="El router principal usa la VLAN 10.", metadata={"source": "red.txt"}),
+        Document(page_content="Contraseñas en el gestor corporativo.", metadata={"source": "seguridad.txt"}),
+    ])
+    other = service.store("other-embed")
+    other.embeddings = FakeEmbeddings()
+    service._process_documents([
+        Document(page_content="El router principal usa la VLAN 10.", metadata={"source": "red.txt"}),
+        Document(page_content="El router de invitados usa la VLAN 20.", metadata={"source": "invitados.txt"}),
+    ], store=other)
+
+    monkeypatch.setattr(config, "FANOUT_EMBEDDING_MODELS", "other-embed, empty-embed")
+    docs = service.get_related_docs("router VLAN", k=5)
+    texts = [doc.page_content for doc in docs]
+
+    assert service._fanout_models(service.store()) == ["fake-embed", "other-embed", "empty-embed"]
+    assert "El router de invitados usa la VLAN 20." in texts
+    assert texts.count("El router principal usa la VLAN 10.") == 1
+    assert texts[0] == "El router principal usa la VLAN 10."
+    assert len(texts) == 3
+
+
+def test_mmr_retrieval_is_configurable_per_request(service):
+    """Test de MMR por petición: sin MMR vuelven los duplicados, con MMR chunks distintos."""
+    from retrieval import RetrievalOptions
+    docs = [Document(page_content="Aaaa bbbb cccc dddd.", metadata={"source": f"copia{i}.txt"})
+            for i in range(3)]
+    docs.append(Document(page_content="Texto diferente y mucho mas largo que los anteriores.",
+                         metadata={"source": "otro.txt"}))
+    service._process_documents(docs)
+    query = "Aaaa bbbb cccc dddd."
+
+    plain = service.get_related_docs(query, k=2, options=RetrievalOptions(mmr=False))
+    assert [d.page_content for d in plain] == [query, query]
+    diverse = service.get_related_docs(query, k=2, options=RetrievalOptions(mmr=True, mmr_lambda=0.3))
+    assert {d.page_content for d in diverse} == {query, docs[-1].page_content}
+
+
+def test_filtered_retrieval_by_source_tags_and_date(service, tmp_path):
+    """Test de filtros de metadatos (documento, etiquetas y fecha) en la búsqueda."""
+    import time
+    from retrieval import RetrievalOptions
+
+    manual = tmp_path / "manual.txt"
+    manual.write_text("Instrucciones del router: reiniciar con el boton.", encoding="utf-8")
+    faq = tmp_path / "faq.txt"
+    faq.write_text("Preguntas frecuentes del router y la impresora.", encoding="utf-8")
+    service.ingest_file(str(manual), tags=["Soporte", "redes"])
+    cutoff = time.time()
+    service.ingest_file(str(faq))
+
+    def sources(**filters):
+        docs = service.get_related_docs("router", k=5, options=RetrievalOptions(**filters))
+        return {d.metadata["source_name"] for d in docs}
+
+    assert sources() == {"manual.txt", "faq.txt"}
+    assert sources(sources=("faq.txt",)) == {"faq.txt"}
+    assert sources(tags=("soporte",)) == {"manual.txt"}
+    assert sources(uploaded_after=cutoff) == {"faq.txt"}
+    assert sources(sources=("faq.txt",), tags=("redes",)) == set()
+
+    # Re-ingerir sin cambios no re-embebe pero actualiza etiquetas y fecha
+    service.ingest_file(str(manual), tags=["nueva"])
+    assert sources(tags=("nueva",)) == {"manual.txt"}
+    assert sources(uploaded_after=cutoff) == {"manual.txt", "faq.txt"}
+
+
+def test_reingest_replaces_tags(service, tmp_path):
+    """Test de re-etiquetado: al re-ingerir con otras etiquetas, las anteriores dejan de filtrar."""
+    from answer_cache import SemanticAnswerCache
+    from retrieval import RetrievalOptions
+
+    path = tmp_path / "politica.txt"
+    path.write_text("Politica de vacaciones del equipo.", encoding="utf-8")
+    service.ingest_file(str(path), tags=["borrador", "rrhh"])
+    service.answer_cache = SemanticAnswerCache()
+    version = service.answer_cache.version("fake-embed")
+    service.ingest_file(str(path), tags=["publicado", "rrhh"])
+    # Sin chunks nuevos, pero las respuestas filtradas por etiqueta quedan obsoletas
+    assert service.answer_cache.version("fake-embed") != version
+
+    def sources(*tags):
+        docs = service.get_related_docs("vacaciones", k=5, options=RetrievalOptions(tags=tags))
+        return {d.metadata["source_name"] for d in docs}
+
+    assert sources("borrador") == set()
+    assert sources("publicado") == sources("rrhh") == {"politica.txt"}
+    assert service.store().documents.get("politica.txt")["tags"] == ["publicado", "rrhh"]
+
+
+def test_document_registry_listing_is_paginated(service, tmp_path):
+    """Test del listado de documentos desde el registro, paginado y con metadatos."""
+    for name in ("b.txt", "a.txt", "c.txt"):
+        path = tmp_path / name
+        path.write_text(f"Contenido del documento {name}.", encoding="utf-8")
+        service.ingest_file(str(path), tags=["manual"] if name == "a.txt" else None)
+
+    service.store().vectors.list = None  # el listado no debe leer la base vectorial
+    page = service.list_documents(offset=1, limit=1)
+    assert page["total"] == 3
+    assert [doc["source_name"] for doc in page["documents"]] == ["b.txt"]
+    first = service.list_documents(limit=1)["documents"][0]
+    assert first["tags"] == ["manual"]
+    assert first["chunk_count"] == 1 and first["bytes"] > 0 and first["content_hash"]
+
+
+def test_concurrent_requests_use_their_own_embedding_model(service):
+    """Test de que peticiones concurrentes con distintos modelos no comparten estado."""
+    other = service.store("other-embed")
+    other.embeddings = FakeEmbeddings()
+    service._process_documents([Document(page_content="Solo en el modelo por defecto.",
+                                         metadata={"source": "a.txt"})])
+    service._process_documents([Document(page_content="Solo en el otro modelo.",
+                                         metadata={"source": "b.txt"})], store=other)
+
+    errors = []
+
+    def ask(model, expected):
+        for _ in range(10):
+            docs = service.get_related_docs("modelo", k=1, embedding_model=model)
+            if [doc.page_content for doc in docs] != [expected]:
+                errors.append((model, docs))
+
+    threads = [threading.Thread(target=ask, args=args) for args in
+               [("fake-embed", "Solo en el modelo por defecto."), ("other-embed", "Solo en el otro modelo.")] * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert service.stores.stats()["opened"] == 2
+
+
+def test_document_registry_backfills_existing_store(service, tmp_path):
+    """Test de que una base anterior al registro se vuelca en él una sola vez."""
+    from document_registry import DocumentRegistry
+
+    service._process_documents([Document(page_content=f"Parte {i}", metadata={"source": "/x/antiguo.txt"})
+                                for i in range(3)])
+    os.remove(os.path.join(service.store().persist_dir, DocumentRegistry.FILENAME))
+    store = service.store()
+    store.documents = DocumentRegistry(store.persist_dir)
+    assert not store.documents.complete
+
+    service._backfill_document_registry(store)
+    assert store.documents.complete
+    assert store.documents.get("antiguo.txt")["chunk_count"] == 3
+
+
+def test_migrate_embeddings_reembeds_stored_chunks_and_resumes(service, tmp_path):
+    """Test de migración entre modelos: reutiliza el texto de los chunks y se reanuda sin repetir trabajo."""
+    for name in ("a.txt", "b.txt"):
+        path = tmp_path / name
+        path.write_text(" ".join(f"Frase {i} del documento {name}." for i in range(300)), encoding="utf-8")
+        service.ingest_file(str(path), tags=["manual"])
+    source = service.store()
+    target = service.store("other-embed")
+    target.embeddings = FakeEmbeddings()
+    total = source.vectors.count()
+
+    batches = []
+    counts = service.migrate_embeddings("fake-embed", "other-embed", before_batch=lambda: batches.append(1),
+                                        batch_size=4)
+    assert counts["documents_migrated"] == 2
+    assert counts["chunks_migrated"] == total == target.vectors.count()
+    assert len(batches) == sum(-(-record["chunk_count"] // 4) for record in source.documents.list())
+    assert set(target.vectors.list(include=[]).ids) == set(source.vectors.list(include=[]).ids)
+    assert target.documents.get("a.txt")["tags"] == ["manual"]
+    assert len(target.keyword_index) == total
+    assert service.get_related_docs("Frase del documento b.txt", embedding_model="other-embed")
+
+    # Interrumpida a mitad de b.txt: solo se embeben los chunks que faltan
+    target.documents.delete("b.txt")
+    missing = target.vectors.list(where={"source_name": "b.txt"}, include=[]).ids[:2]
+    target.vectors.delete(missing)
+    counts = service.migrate_embeddings("fake-embed", "other-embed")
+    assert counts["documents_skipped"] == 1
+    assert counts["documents_migrated"] == 1
+    assert counts["chunks_migrated"] == 2
+    assert target.vectors.count() == total
+
+
+@pytest.mark.parametrize("backend", ["flat", "quantized"])
+def test_flat_backend_imports_chroma_store_and_serves_retrieval(service, tmp_path, monkeypatch, backend):
+    """Test del índice plano (exacto o cuantizado): copia el almacén de Chroma existente y sirve la recuperación."""
+    import config
+    from flat_index import FlatIndex
+    from quantized_store import QuantizedIndex
+
+    path = tmp_path / "red.txt"
+    path.write_text("El router principal usa la VLAN 10. La impresora usa tóner negro.", encoding="utf-8")
+    service.ingest_file(str(path))
+    chroma_ids = set(service.store().vectors.list(include=[]).ids)
+    service.store().close()
+
+    monkeypatch.setattr(config, "VECTOR_BACKEND", backend)
+    flat = RAGService(persist_dir=service.persist_dir, embedding_model="fake-embed",
+                      embedding_cache=EmbeddingCache(str(tmp_path / "cache2.sqlite3"), max_bytes=1024 * 1024))
+    store = flat.store()
+    store.embeddings = FakeEmbeddings()
+
+    assert type(store.vectors) is (FlatIndex if backend == "flat" else QuantizedIndex)
+    assert set(store.vectors.list(include=[]).ids) == chroma_ids
+    assert flat.get_related_docs("router VLAN", k=1)[0].metadata["source_name"] == "red.txt"
+    assert flat.delete_document("red.txt")["chunks_deleted"] == len(chroma_ids)
+    assert store.vectors.count() == 0
+    assert flat.stores.stats()["estimated_bytes"] >= 0
+
+
+def test_interrupted_chroma_copy_is_not_served(service, tmp_path, monkeypatch):
+    """Test de que una copia de Chroma interrumpida no se sirve: se repite al volver a abrir."""
+    import config
+    from flat_index import FlatIndex
+
+    path = tmp_path / "manual.txt"
+    path.write_text(" ".join(f"Frase numero {i} del manual." for i in range(200)), encoding="utf-8")
+    service.ingest_file(str(path))
+    chroma_ids = set(service.store().vectors.list(include=[]).ids)
+    assert len(chroma_ids) > 3
+    service.store().close()
+
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "flat")
+    original_add = FlatIndex.add
+
+    def add_then_crash(self, ids, vectors, texts, metadatas):
+        original_add(self, ids, vectors, texts, metadatas)
+        raise RuntimeError("proceso interrumpido")
+
+    monkeypatch.setattr(FlatIndex, "add", add_then_crash)
+    with pytest.raises(RuntimeError):
+        RAGService(persist_dir=service.persist_dir, embedding_model="fake-embed", write_batch_size=3,
+                   embedding_cache=EmbeddingCache(str(tmp_path / "cache2.sqlite3"), max_bytes=1024 * 1024)).store()
+    assert not FlatIndex.exists(service.store_dir("fake-embed"))
+
+    monkeypatch.setattr(FlatIndex, "add", original_add)
+    flat = RAGService(persist_dir=service.persist_dir, embedding_model="fake-embed", write_batch_size=3,
+                      embedding_cache=EmbeddingCache(str(tmp_path / "cache3.sqlite3"), max_bytes=1024 * 1024))
+    assert set(flat.store().vectors.list(include=[]).ids) == chroma_ids
+    assert not os.path.exists(os.path.join(service.store_dir("fake-embed"), FlatIndex.DIRNAME + ".copying"))
@@ -0,0 +1,58 @@
+"""
+Tests de las utilidades de recuperación
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import numpy as np
+
+from retrieval import cosine_similarities, mmr_select, rrf_scores
+
+
+def test_rrf_scores_reward_items_in_both_rankings():
+    """Test de fusión RRF: lo que aparece en ambas listas sube."""
+    scores = rrf_scores([["a", "b", "c"], ["c", "d"]])
+    merged = sorted(scores, key=scores.get, reverse=True)
+    assert merged[0] == "c"
+    assert set(merged) == {"a", "b", "c", "d"}
+    assert merged.index("a") < merged.index("d")
+
+
+def test_mmr_skips_near_duplicates():
+    """Test de MMR: entre dos casi-duplicados relevantes elige uno y luego algo distinto."""
+    query = [1.0, 0.0, 0.0]
+    vectors = np.array([[0.9, 0.1, 0.0], [0.9, 0.11, 0.0], [0.7, 0.0, 0.7], [0.0, 1.0, 0.0]])
+    relevance = cosine_similarities(query, vectors)
+
+    assert mmr_select(relevance, vectors, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(relevance, vectors, k=2, lambda_mult=0.5) == [0, 2]
+    assert len(mmr_select(relevance, vectors, k=10)) == 4
+    assert mmr_select([], np.empty((0, 3)), k=3) == []
+
+
+def test_retrieval_options_where_clause():
+    """Test de la cláusula where de Chroma generada por los filtros."""
+    from retrieval import RetrievalOptions, parse_tags
+
+    assert RetrievalOptions().where() is None
+    assert RetrievalOptions(sources=("a.pdf",)).where() == {"source_name": {"$in": ["a.pdf"]}}
+    where = RetrievalOptions(tags=("x", "y"), uploaded_after=10.0).where()
+    assert where == {"$and": [{"$or": [{"tag:x": True}, {"tag:y": True}]},
+                              {"uploaded_at": {"$gte": 10.0}}]}
+    assert parse_tags(["A, b", "a", ""]) == ("a", "b")
+
+
+def test_matches_where_evaluates_chroma_filters():
+    """Test de la evaluación en Python de cláusulas where de Chroma."""
+    from retrieval import RetrievalOptions, matches_where
+
+    meta = {"source_name": "a.pdf", "tag:x": True, "uploaded_at": 20.0}
+    assert matches_where(meta, None)
+    assert matches_where(meta, RetrievalOptions(sources=("a.pdf", "b.pdf"), tags=("y", "x"),
+                                                uploaded_after=10.0).where())
+    assert not matches_where(meta, RetrievalOptions(uploaded_before=10.0).where())
+    assert not matches_where(meta, {"tag:y": True})
+    assert matches_where(meta, {"source_name": {"$nin": ["b.pdf"]}, "uploaded_at": {"$lt": 30}})
+    assert not matches_where(meta, {"uploaded_at": {"$gt": "texto"}})
@@ -0,0 +1,49 @@
+"""
+Tests del guardado de subidas (streaming, hash y límite de tamaño)
+"""
+import asyncio
+import hashlib
+import io
+import sys
+import os
+
+import pytest
+from fastapi import UploadFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from uploads import UploadTooLargeError, save_upload
+
+
+def upload(data: bytes, filename: str = "manual.pdf") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename)
+
+
+def test_save_upload_is_content_addressed(tmp_path):
+    """Test de almacenamiento por hash de contenido y detección de duplicados."""
+    data = b"contenido " * 1000
+    first = asyncio.run(save_upload(upload(data), str(tmp_path), max_bytes=1 << 20, chunk_size=1024))
+
+    expected_hash = hashlib.sha256(data).hexdigest()
+    assert first.content_hash == expected_hash
+    assert first.path == os.path.join(str(tmp_path), expected_hash, "manual.pdf")
+    assert first.size == len(data)
+    assert not first.already_stored
+
+    second = asyncio.run(save_upload(upload(data), str(tmp_path), max_bytes=1 << 20))
+    assert second.already_stored
+    assert second.path == first.path
+
+
+def test_save_upload_enforces_max_size(tmp_path):
+    """Test del límite de tamaño: no quedan ficheros parciales."""
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload(upload(b"x" * 5000), str(tmp_path), max_bytes=4096, chunk_size=1024))
+    assert os.listdir(tmp_path / ".incoming") == []
+
+
+def test_save_upload_strips_directories_from_filename(tmp_path):
+    """Test de que el nombre de fichero no puede salir del directorio de subidas."""
+    stored = asyncio.run(save_upload(upload(b"hola", "../../etc/passwd"), str(tmp_path), max_bytes=1024))
+    assert os.path.basename(stored.path) == "passwd"
+    assert os.path.dirname(os.path.dirname(stored.path)) == str(tmp_path)
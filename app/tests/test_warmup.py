@@ -0,0 +1,58 @@
+"""
+Tests del calentamiento al arrancar
+"""
+import asyncio
+import json
+import sys
+import os
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import warmup
+from warmup import Warmup, load_ollama_model
+
+
+def test_runs_steps_in_order_and_records_failures():
+    """Test de ejecución de pasos síncronos y asíncronos, incluido uno que falla."""
+    calls = []
+
+    async def async_step():
+        calls.append("async")
+
+    def failing_step():
+        raise RuntimeError("Ollama no responde")
+
+    state = Warmup()
+    assert not state.ready
+    asyncio.run(state.run([("sync", lambda: calls.append("sync")), ("falla", failing_step),
+                           ("async", async_step)]))
+
+    assert calls == ["sync", "async"]
+    assert state.ready
+    status = state.status()
+    assert status["steps"]["sync"]["status"] == "done"
+    assert status["steps"]["falla"] == {"status": "failed", "error": "Ollama no responde",
+                                        "seconds": status["steps"]["falla"]["seconds"]}
+    assert status["steps"]["async"]["status"] == "done"
+
+
+def test_load_ollama_model_payloads(monkeypatch):
+    """Test de las peticiones de carga: generate con prompt vacío y num_ctx, embed con keep_alive."""
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(warmup.httpx, "AsyncClient",
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+
+    asyncio.run(load_ollama_model("http://ollama:11434/", "qwen3:14b", keep_alive=1800, num_ctx=8192))
+    asyncio.run(load_ollama_model("http://ollama:11434", "nomic-embed-text", embedding=True))
+
+    assert requests[0] == ("/api/generate", {"model": "qwen3:14b", "prompt": "",
+                                             "options": {"num_ctx": 8192}, "keep_alive": 1800})
+    assert requests[1] == ("/api/embed", {"model": "nomic-embed-text", "input": "warm-up"})
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    filename: str
+    content_hash: str
+    size: int
+    already_stored: bool
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def save_upload(file: UploadFile, upload_dir: str, max_bytes: int,
+                      chunk_size: int = 1024 * 1024) -> StoredUpload:
+    """Streams an upload to content-addressed storage, hashing it on the way.
+
+    The file is copied in `chunk_size` pieces with disk writes off the event loop,
+    the size limit is checked as bytes arrive, and the result is stored as
+    `<upload_dir>/<sha256>/<filename>`, so the basename used as the document name
+    is preserved and identical content always lands on the same path.
+    """
+    filename = os.path.basename(file.filename or "") or "upload"
+    incoming_dir = os.path.join(upload_dir, ".incoming")
+    os.makedirs(incoming_dir, exist_ok=True)
+    tmp_path = os.path.join(incoming_dir, f"{uuid.uuid4().hex}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        out = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            while True:
+                block = await file.read(chunk_size)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB")
+                digest.update(block)
+                await asyncio.to_thread(out.write, block)
+        finally:
+            await asyncio.to_thread(out.close)
+
+        content_hash = digest.hexdigest()
+        final_dir = os.path.join(upload_dir, content_hash)
+        final_path = os.path.join(final_dir, filename)
+        already_stored = os.path.exists(final_path)
+        if already_stored:
+            os.remove(tmp_path)
+        else:
+            os.makedirs(final_dir, exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return StoredUpload(path=final_path, filename=filename, content_hash=content_hash,
+                        size=size, already_stored=already_stored)
@@ -0,0 +1,150 @@
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+# What `include` may ask for, besides the IDs that are always returned
+INCLUDE_FIELDS = ("texts", "metadatas", "embeddings")
+
+
+@dataclass
+class Chunks:
+    """Chunks read from a vector backend; fields not in `include` are None."""
+    ids: List[str]
+    texts: Optional[List[Optional[str]]] = None
+    metadatas: Optional[List[Optional[Dict[str, Any]]]] = None
+    embeddings: Optional[List[Sequence[float]]] = None
+
+
+class VectorBackend(ABC):
+    """Storage and nearest-neighbour search of one embedding model's chunks.
+
+    RAGService embeds texts itself and hands backends the vectors. `where`
+    filters use Chroma's syntax (see retrieval.matches_where) and restrict a
+    search before ranking, not its results.
+    """
+
+    @abstractmethod
+    def add(self, ids: Sequence[str], vectors: Sequence[Sequence[float]], texts: Sequence[Optional[str]],
+            metadatas: Sequence[Optional[Dict[str, Any]]]):
+        """Writes chunks, replacing those with the same IDs."""
+
+    @abstractmethod
+    def search(self, vector: Sequence[float], k: int, where: Optional[Dict[str, Any]] = None,
+               include: Iterable[str] = ("texts", "metadatas")) -> Chunks:
+        """The k chunks nearest to `vector`, nearest first."""
+
+    @abstractmethod
+    def list(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+             limit: Optional[int] = None, offset: Optional[int] = None,
+             include: Iterable[str] = ("texts", "metadatas")) -> Chunks:
+        """Stored chunks, all of them or those with the given IDs, optionally filtered and paged."""
+
+    @abstractmethod
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        """Merges keys into the metadata of existing chunks."""
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]):
+        """Deletes chunks; unknown IDs are ignored."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored chunks."""
+
+    @abstractmethod
+    def reset(self):
+        """Deletes every chunk."""
+
+    @abstractmethod
+    def close(self):
+        """Releases files and clients; the backend is not used afterwards."""
+
+    def estimated_bytes(self) -> int:
+        """Approximate memory the backend's index takes once searched."""
+        return 0
+
+
+class ChromaBackend(VectorBackend):
+    """Chunks in a Chroma collection, searched through its HNSW index."""
+
+    _INCLUDE = {"texts": "documents", "metadatas": "metadatas", "embeddings": "embeddings"}
+
+    def __init__(self, directory: str, embeddings: Optional[Embeddings] = None):
+        self.directory = directory
+        self.vectorstore = Chroma(persist_directory=directory, embedding_function=embeddings)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "chroma.sqlite3"))
+
+    @property
+    def _collection(self):
+        # Re-read after every reset, which replaces the collection
+        return self.vectorstore._collection
+
+    @classmethod
+    def _chunks(cls, result: Dict[str, Any], include: Iterable[str]) -> Chunks:
+        return Chunks(ids=list(result["ids"]),
+                      **{field: list(result[cls._INCLUDE[field]]) for field in include})
+
+    def add(self, ids, vectors, texts, metadatas):
+        if not ids:
+            return
+        self._collection.upsert(
+            ids=list(ids),
+            embeddings=list(vectors),
+            documents=list(texts),
+            # Chroma rejects empty metadata dicts but accepts None
+            metadatas=[meta or None for meta in metadatas],
+        )
+
+    def search(self, vector, k, where=None, include=("texts", "metadatas")) -> Chunks:
+        include = list(include)
+        result = self._collection.query(query_embeddings=[vector], n_results=k, where=where,
+                                        include=[self._INCLUDE[field] for field in include])
+        # One query: take the first of each per-query list
+        return self._chunks({key: (values[0] if values is not None else None) for key, values in result.items()
+                             if key in ("ids", "documents", "metadatas", "embeddings")}, include)
+
+    def list(self, ids=None, where=None, limit=None, offset=None, include=("texts", "metadatas")) -> Chunks:
+        include = list(include)
+        if ids is not None and not ids:
+            # Chroma reads an empty ID list as "all chunks"
+            return Chunks(ids=[], **{field: [] for field in include})
+        result = self._collection.get(ids=list(ids) if ids is not None else None, where=where, limit=limit,
+                                      offset=offset, include=[self._INCLUDE[field] for field in include])
+        return self._chunks(result, include)
+
+    def update_metadata(self, ids, metadatas):
+        if ids:
+            self._collection.update(ids=list(ids), metadatas=list(metadatas))
+
+    def delete(self, ids):
+        if ids:
+            self._collection.delete(ids=list(ids))
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def reset(self):
+        self.vectorstore.reset_collection()
+
+    def close(self):
+        # Client.close() only exists in recent chromadb releases; older ones keep
+        # the client until the process exits
+        close = getattr(self.vectorstore._client, "close", None)
+        if close is not None:
+            close()
+
+    def estimated_bytes(self) -> int:
+        """Size of the HNSW segment files, which Chroma loads into memory; chroma.sqlite3
+        is read from disk."""
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, "header.bin")):
+                total += sum(os.path.getsize(os.path.join(entry.path, name)) for name in os.listdir(entry.path))
+        return total
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import httpx
+
+
+class Warmup:
+    """Startup warm-up steps and their status, reported by the readiness probe.
+
+    Steps run one after another. A failing step is recorded and the rest still
+    run, so an unreachable Ollama costs no more than its own timeout; the
+    service is ready once every step has finished, whatever its outcome.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, steps: Sequence[Tuple[str, Callable[[], Any]]]):
+        """Runs (name, function) steps in order; plain functions run in a worker thread."""
+        self.started_at = time.time()
+        for name, _ in steps:
+            self.steps[name] = {"status": "pending"}
+        for name, func in steps:
+            step = self.steps[name]
+            step["status"] = "running"
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await asyncio.to_thread(func)
+                step["status"] = "done"
+            except Exception as e:
+                step.update(status="failed", error=str(e))
+                print(f"Warm-up step {name} failed: {e}")
+            step["seconds"] = round(time.perf_counter() - start, 3)
+        self.finished_at = time.time()
+        failed = [name for name, step in self.steps.items() if step["status"] == "failed"]
+        print(f"Warm-up finished in {self.finished_at - self.started_at:.1f}s"
+              + (f" ({len(failed)} failed: {', '.join(failed)})" if failed else ""))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+            "steps": {name: dict(step) for name, step in self.steps.items()},
+        }
+
+
+async def load_ollama_model(base_url: str, model: str, embedding: bool = False,
+                            keep_alive: Optional[int] = None, num_ctx: Optional[int] = None,
+                            timeout: float = 300):
+    """Loads a model into Ollama's memory without generating anything.
+
+    A generate request with an empty prompt only loads the model. num_ctx must
+    be the one later requests use, otherwise Ollama loads the model again with
+    the new context size on the first of them.
+    """
+    if embedding:
+        path, payload = "/api/embed", {"model": model, "input": "warm-up"}
+    else:
+        path, payload = "/api/generate", {"model": model, "prompt": ""}
+        if num_ctx:
+            payload["options"] = {"num_ctx": num_ctx}
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        response = await client.post(base_url.rstrip("/") + path, json=payload)
+        response.raise_for_status()
@@ -1,5 +1,30 @@
 import React, { useState, useRef } from 'react';
 import { api } from '../utils/api';
+import { IngestJob } from '../types';
+
+const JOB_POLL_INTERVAL_MS = 1000;
+
+const waitForJob = async (jobId: string, onUpdate: (job: IngestJob) => void): Promise<IngestJob> => {
+    try {
+        for await (const job of api.streamIngestJob(jobId)) {
+            onUpdate(job);
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+        }
+    } catch (error) {
+        console.warn('Ingestion progress stream unavailable, polling instead:', error);
+    }
+    // Sin stream (proxy que lo corta, etc.): se consulta el estado periódicamente
+    while (true) {
+        const job = await api.getIngestJob(jobId);
+        onUpdate(job);
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+};
 
 interface FileUploaderProps {
     embeddingModel?: string;
@@ -24,7 +49,22 @@ export const FileUploader: React.FC<FileUploaderProps> = ({ embeddingModel, onUp
         setUploadStatus(`Uploading ${file.name}...`);
 
         try {
-            const data = await api.ingest(file, embeddingModel);
+            const queued = await api.ingest(file, embeddingModel);
+            if (queued.status === 'duplicate' || !queued.job_id) {
+                setUploadStatus(`${queued.filename} is already in the knowledge base`);
+                setTimeout(() => setUploadStatus(''), 3000);
+                return;
+            }
+            const data = await waitForJob(queued.job_id, (job) => {
+                const counts = job.chunks_total
+                    ? ` (${job.chunks_embedded} chunks embedded, ${job.chunks_remaining} remaining` +
+                      (job.throughput?.embed_chunks_per_second ? `, ${job.throughput.embed_chunks_per_second} chunks/s` : '') + ')'
+                    : '';
+                setUploadStatus(`${file.name}: ${job.status}${counts}...`);
+            });
+            if (data.status === 'failed') {
+                throw new Error(data.error || 'Ingestion failed');
+            }
             setUploadStatus(`Success! Added ${data.chunks_added} chunks from ${data.filename}`);
 
             if (onUploadSuccess) {
@@ -22,6 +22,14 @@ export interface ChatRequest {
   use_knowledge_base?: boolean;
   embedding_model?: string;
   use_mongodb_tools?: boolean;
+  rag_k?: number;
+  rag_fetch_k?: number;
+  rag_mmr?: boolean;
+  rag_mmr_lambda?: number;
+  rag_sources?: string[];
+  rag_tags?: string[];
+  rag_uploaded_after?: string;
+  rag_uploaded_before?: string;
 }
 
 export interface ChatResponse {
@@ -29,6 +37,54 @@ export interface ChatResponse {
   model: string;
 }
 
+export interface IngestJob {
+  job_id: string;
+  filename: string;
+  embedding_model?: string | null;
+  status: 'queued' | 'parsing' | 'splitting' | 'embedding' | 'writing' | 'done' | 'failed';
+  chunks_total: number;
+  chunks_embedded: number;
+  chunks_remaining: number;
+  chunks_added: number;
+  error?: string | null;
+  queued_seconds: number;
+  elapsed_seconds: number;
+  // upload, parse, split, embed, write (seconds)
+  timings: Record<string, number>;
+  throughput: {
+    chunks_per_second: number;
+    embed_chunks_per_second: number;
+    embed_tokens_per_second: number;
+  };
+  version: number;
+}
+
+export interface IngestSubmission {
+  job_id: string | null;
+  filename: string;
+  status: 'queued' | 'parsing' | 'embedding' | 'duplicate';
+  content_hash: string;
+  message: string;
+}
+
+export interface DocumentRecord {
+  source_name: string;
+  source: string;
+  content_hash: string;
+  bytes: number;
+  chunk_count: number;
+  ingested_at: number;
+  tags: string[];
+}
+
+export interface DocumentList {
+  documents: string[];
+  items: DocumentRecord[];
+  total: number;
+  offset: number;
+  limit: number | null;
+}
+
 export interface ModelInfo {
   name: string;
   size?: string;
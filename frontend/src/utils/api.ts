@@ -1,4 +1,4 @@
-import { ChatRequest, ChatResponse, ModelInfo } from '../types';
+import { ChatRequest, ChatResponse, DocumentList, IngestJob, IngestSubmission, ModelInfo } from '../types';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'api';
 const API_KEY = import.meta.env.VITE_API_KEY || '';
@@ -88,7 +88,7 @@ export const api = {
     }
   },
 
-  async ingest(file: File, embeddingModel?: string): Promise<any> {
+  async ingest(file: File, embeddingModel?: string): Promise<IngestSubmission> {
     const formData = new FormData();
     formData.append('file', file);
     if (embeddingModel) {
@@ -101,6 +101,9 @@ export const api = {
       body: formData,
     });
 
+    if (response.status === 413) {
+      throw new Error('File too large');
+    }
     if (!response.ok) {
       throw new Error('Upload failed');
     }
@@ -108,8 +111,56 @@ export const api = {
     return response.json();
   },
 
-  async getDocuments(embeddingModel?: string): Promise<{ documents: string[] }> {
-    const query = embeddingModel ? `?embedding_model=${embeddingModel}` : '';
+  async getIngestJob(jobId: string): Promise<IngestJob> {
+    const response = await fetch(`${API_BASE_URL}/ingest/jobs/${jobId}`, {
+      headers: getHeaders(),
+    });
+    if (!response.ok) {
+      throw new Error('Failed to fetch ingestion job');
+    }
+    return response.json();
+  },
+
+  // Progreso en vivo de un job de ingesta (NDJSON, un snapshot por línea)
+  async *streamIngestJob(jobId: string): AsyncGenerator<IngestJob, void, unknown> {
+    const response = await fetch(`${API_BASE_URL}/ingest/jobs/${jobId}/events`, {
+      headers: getHeaders(),
+    });
+    if (!response.ok) {
+      throw new Error('Failed to stream ingestion job');
+    }
+
+    const reader = response.body?.getReader();
+    if (!reader) {
+      throw new Error('No reader available');
+    }
+
+    const decoder = new TextDecoder();
+    let buffer = '';
+    try {
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+        for (const line of lines) {
+          if (line.trim()) {
+            yield JSON.parse(line) as IngestJob;
+          }
+        }
+      }
+    } finally {
+      reader.releaseLock();
+    }
+  },
+
+  async getDocuments(embeddingModel?: string, offset?: number, limit?: number): Promise<DocumentList> {
+    const params = new URLSearchParams();
+    if (embeddingModel) params.set('embedding_model', embeddingModel);
+    if (offset) params.set('offset', String(offset));
+    if (limit) params.set('limit', String(limit));
+    const query = params.toString() ? `?${params}` : '';
     const response = await fetch(`${API_BASE_URL}/documents${query}`, {
       headers: getHeaders(),
     });
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la compresión extractiva del contexto: tokens de contexto y tiempo
+hasta el primer token (TTFT) con y sin compresión. Necesita Ollama y documentos ya
+ingeridos con el modelo de embeddings indicado. Ejecutar desde la raíz del repositorio:
+
+    python scripts/benchmark_compression.py --model qwen3:14b --embedding-model nomic-embed-text \\
+        "¿Cómo se configura la VLAN?" "¿Qué tóner usa la impresora?"
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import config
+from rag_service import RAGService
+
+
+async def time_to_first_token(service: RAGService, question: str, model: str, max_tokens: int) -> float:
+    start = time.perf_counter()
+    stream = service.ask_stream(question, model_name=model, max_tokens=max_tokens)
+    async for _ in stream:
+        elapsed = time.perf_counter() - start
+        await stream.aclose()
+        return elapsed
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", nargs="+")
+    parser.add_argument("--model", default=config.DEFAULT_MODEL)
+    parser.add_argument("--embedding-model", default=config.DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--target-tokens", type=int, default=config.CONTEXT_COMPRESSION_TOKENS)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones por pregunta y modo")
+    args = parser.parse_args()
+
+    config.ANSWER_CACHE_ENABLED = False
+    config.CONTEXT_COMPRESSION_TOKENS = args.target_tokens
+    service = RAGService(model_name=args.model, embedding_model=args.embedding_model)
+    # Carga el modelo de chat antes de medir
+    asyncio.run(time_to_first_token(service, args.questions[0], args.model, args.max_tokens))
+
+    print(f"model={args.model} embedding={args.embedding_model} target={args.target_tokens} tokens")
+    print(f"{'modo':>10} {'tokens ctx':>10} {'TTFT medio s':>13} {'TTFT p95 s':>11}")
+    for enabled in (False, True):
+        config.CONTEXT_COMPRESSION_ENABLED = enabled
+        tokens, ttfts = [], []
+        for question in args.questions:
+            tokens.append(service.build_context(question, args.model, args.max_tokens).tokens)
+            for _ in range(args.repeat):
+                ttfts.append(asyncio.run(time_to_first_token(service, question, args.model, args.max_tokens)))
+        ttfts.sort()
+        p95 = ttfts[min(len(ttfts) - 1, int(0.95 * len(ttfts)))]
+        print(f"{'comprimido' if enabled else 'completo':>10} {statistics.mean(tokens):>10.0f} "
+              f"{statistics.mean(ttfts):>13.2f} {p95:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
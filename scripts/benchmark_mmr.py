@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark del reranking MMR: coste por consulta y diversidad del contexto.
+Usa vectores sintéticos con grupos de casi-duplicados (como los chunks solapados),
+no necesita Ollama. Ejecutar desde la raíz del repositorio:
+
+    python scripts/benchmark_mmr.py --dim 4096 --fetch-k 20 50 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from retrieval import cosine_similarities, mmr_select
+
+
+def make_candidates(rng, dim: int, n: int, group_size: int = 3):
+    """Candidatos en grupos de `group_size` casi-duplicados alrededor de una consulta."""
+    query = rng.normal(size=dim).astype(np.float32)
+    centers = query + rng.normal(scale=1.2, size=(n // group_size + 1, dim)).astype(np.float32)
+    vectors = np.repeat(centers, group_size, axis=0)[:n]
+    vectors += rng.normal(scale=0.05, size=vectors.shape).astype(np.float32)
+    return query, vectors
+
+
+def mean_pairwise_similarity(vectors: np.ndarray) -> float:
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    sims = unit @ unit.T
+    n = len(vectors)
+    return float((sims.sum() - n) / (n * (n - 1))) if n > 1 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=4096, help="Dimensión de los embeddings (qwen3-embedding:8b = 4096)")
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 50, 100], help="Candidatos por consulta")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 10], help="Chunks seleccionados")
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"dim={args.dim} lambda={args.lambda_mult} queries={args.queries}")
+    print(f"{'fetch_k':>7} {'k':>3} {'ms/consulta':>12} {'sim top-k':>10} {'sim MMR':>8}")
+    for fetch_k in args.fetch_k:
+        for k in args.k:
+            cases = [make_candidates(rng, args.dim, fetch_k) for _ in range(args.queries)]
+            start = time.perf_counter()
+            picks = []
+            for query, vectors in cases:
+                relevance = cosine_similarities(query, vectors)
+                picks.append((relevance, mmr_select(relevance, vectors, k, args.lambda_mult)))
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+            top_sim = np.mean([mean_pairwise_similarity(vectors[np.argsort(-relevance)[:k]])
+                               for (query, vectors), (relevance, _) in zip(cases, picks)])
+            mmr_sim = np.mean([mean_pairwise_similarity(vectors[selected])
+                               for (query, vectors), (_, selected) in zip(cases, picks)])
+            print(f"{fetch_k:>7} {k:>3} {elapsed_ms:>12.3f} {top_sim:>10.3f} {mmr_sim:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los backends de vectores: Chroma (HNSW) frente al índice plano de NumPy
+(float32 exacto, o int8/float16 con reordenación exacta). Mide memoria residente
+(RSS) tras abrir el almacén y lanzar las consultas, tamaño en disco, tiempo de
+apertura, recall@k frente a la búsqueda exacta en float32 y latencia p50/p95. Cada
+backend se mide en un proceso nuevo. Usa vectores sintéticos, o los de un almacén de
+Chroma existente con --from-store. No necesita Ollama. Ejecutar desde la raíz del repositorio:
+
+    python scripts/benchmark_vector_store.py --dim 4096 --vectors 5000
+    python scripts/benchmark_vector_store.py --from-store chroma_db/qwen3-embedding_8b
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+BATCH = 256
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def disk_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files) / (1024 * 1024)
+
+
+def synthetic_vectors(rng, n: int, dim: int) -> np.ndarray:
+    """Vectores unitarios agrupados en temas, como los chunks de documentos parecidos."""
+    centers = rng.normal(size=(max(1, n // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + rng.normal(scale=0.6, size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_store_vectors(path: str) -> np.ndarray:
+    from vector_backends import ChromaBackend
+    chroma = ChromaBackend(path)
+    vectors = [np.asarray(vector, dtype=np.float32)
+               for offset in range(0, chroma.count(), BATCH)
+               for vector in chroma.list(include=["embeddings"], limit=BATCH, offset=offset).embeddings]
+    chroma.close()
+    vectors = np.stack(vectors)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_backend(backend: str, directory: str):
+    """VectorBackend de "chroma", "flat" (float32), "int8" o "float16"."""
+    if backend == "chroma":
+        from vector_backends import ChromaBackend
+        return ChromaBackend(directory)
+    if backend == "flat":
+        from flat_index import FlatIndex
+        return FlatIndex(directory)
+    from quantized_store import QuantizedIndex
+    return QuantizedIndex(directory, quantization=backend)
+
+
+def build(backend: str, directory: str, vectors: np.ndarray):
+    index = open_backend(backend, directory)
+    ids = [f"chunk{i}" for i in range(len(vectors))]
+    for start in range(0, len(vectors), BATCH):
+        rows = range(start, min(start + BATCH, len(vectors)))
+        index.add(ids[start:start + BATCH], vectors[start:start + BATCH].tolist(),
+                  [f"texto {i}" for i in rows], [{"source_name": f"doc{i % 20}.txt"} for i in rows])
+    index.close()
+
+
+def measure(backend: str, directory: str, queries: np.ndarray, k: int, results):
+    """Ejecutado en un proceso nuevo: abre el almacén y lanza las consultas."""
+    import quantized_store  # noqa: F401 - mismas importaciones para todos los backends
+    import vector_backends  # noqa: F401
+    baseline = rss_mb()
+    start = time.perf_counter()
+    index = open_backend(backend, directory)
+    open_ms = (time.perf_counter() - start) * 1000
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = index.search(query.tolist(), k)
+        latencies.append(time.perf_counter() - start)
+        found.append([int(chunk_id[len("chunk"):]) for chunk_id in result.ids])
+    rss = rss_mb() - baseline
+    index.close()
+    results.put((latencies, found, rss, open_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-store", help="Directorio de un almacén de Chroma del que leer los vectores")
+    parser.add_argument("--dim", type=int, default=4096, help="Dimensión de los vectores sintéticos")
+    parser.add_argument("--vectors", type=int, default=5000, help="Número de vectores sintéticos")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=["chroma", "flat", "int8", "float16"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = load_store_vectors(args.from_store) if args.from_store else synthetic_vectors(rng, args.vectors, args.dim)
+    # Consultas cercanas a chunks existentes, como las preguntas sobre un documento
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + rng.normal(scale=0.5 / np.sqrt(vectors.shape[1]), size=queries.shape).astype(np.float32)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+
+    print(f"vectores={len(vectors)} dim={vectors.shape[1]} consultas={args.queries} k={args.k}")
+    print(f"{'backend':>8} {'RSS MB':>8} {'disco MB':>9} {'abrir ms':>9} {'recall@k':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        directory = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        try:
+            build(backend, directory, vectors)
+            results = context.Queue()
+            process = context.Process(target=measure, args=(backend, directory, queries, args.k, results))
+            process.start()
+            latencies, found, rss, open_ms = results.get()
+            process.join()
+            recall = np.mean([len(set(hits) & set(truth)) / args.k for hits, truth in zip(found, exact.tolist())])
+            latencies_ms = np.array(latencies) * 1000
+            print(f"{backend:>8} {rss:>8.1f} {disk_mb(directory):>9.1f} {open_ms:>9.1f} {recall:>9.3f} "
+                  f"{np.percentile(latencies_ms, 50):>8.2f} {np.percentile(latencies_ms, 95):>8.2f}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()